@@ -11,11 +11,24 @@ Flight Data Analyzer: API Handler
 
 
 import abc
+import copy
 import logging
 import numpy as np
+import os
+import simplejson as json
 import six
-
+import sqlite3
+import sys
+import threading
+import time
+import yaml
+
+from collections import OrderedDict
+from contextlib import contextmanager
 from operator import itemgetter
+from scipy.spatial import cKDTree
+from six.moves import cPickle
+from six.moves.urllib.parse import urlencode
 
 from flightdatautilities import api
 
@@ -28,11 +41,502 @@ from analysis_engine import library, settings
 
 logger = logging.getLogger(name=__name__)
 
+# Mean radius of the Earth in metres as used by library.bearings_and_distances.
+EARTH_RADIUS = 6371000
+
+# Version of the format of compiled config indexes.
+CONFIG_INDEX_VERSION = 1
+
+# Config indexes of the File API Handler by path.
+_config_indexes = {}
+
+# Geodata context of the flight being processed by each thread (see
+# flight_geodata).
+_geodata = threading.local()
+
+# Response cache of the HTTP API Handler (see get_response_cache).
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
 
 ##############################################################################
 # Classes
 
 
+class AirportIndex(object):
+    '''
+    Spatial index of airports for nearest airport lookups. Airports are
+    stored within a KD-tree of their positions on the unit sphere so that
+    only the airports within the maximum distance are considered.
+    '''
+
+    def __init__(self, airports):
+        '''
+        :param airports: airport info dictionaries. Airports without a
+            latitude and longitude are ignored.
+        :type airports: list of dict
+        '''
+        self.airports = [a for a in airports
+                         if 'latitude' in a and 'longitude' in a]
+        self.latitudes = np.ma.array([a['latitude'] for a in self.airports],
+                                     dtype=float)
+        self.longitudes = np.ma.array([a['longitude'] for a in self.airports],
+                                      dtype=float)
+        self._tree = cKDTree(self._unit_vectors(self.latitudes.data,
+                                                self.longitudes.data))
+
+    @staticmethod
+    def _unit_vectors(latitudes, longitudes):
+        lat = np.radians(latitudes)
+        lon = np.radians(longitudes)
+        return np.column_stack((np.cos(lat) * np.cos(lon),
+                                np.cos(lat) * np.sin(lon),
+                                np.sin(lat)))
+
+    def nearest(self, latitude, longitude, max_distance=None):
+        '''
+        Returns the airports within max_distance of the provided latitude and
+        longitude sorted by distance.
+
+        :param latitude: latitude in decimal degrees.
+        :type latitude: float
+        :param longitude: longitude in decimal degrees.
+        :type longitude: float
+        :param max_distance: maximum distance in metres. None returns all
+            airports.
+        :type max_distance: float or None
+        :returns: copies of the airport info dictionaries with the distance
+            in metres of each airport.
+        :rtype: list of dict
+        '''
+        if max_distance is None:
+            indices = np.arange(len(self.airports))
+        else:
+            # Chord length between points max_distance apart on the sphere.
+            angle = min(float(max_distance) / EARTH_RADIUS, np.pi)
+            point = self._unit_vectors([latitude], [longitude])[0]
+            indices = np.array(sorted(self._tree.query_ball_point(
+                point, 2 * np.sin(angle / 2) * (1 + 1e-9))), dtype=int)
+        if not len(indices):
+            return []
+        distances = library.bearings_and_distances(
+            self.latitudes[indices], self.longitudes[indices],
+            {'latitude': latitude, 'longitude': longitude})[1].data
+        airports = []
+        for index in np.argsort(distances, kind='mergesort'):
+            distance = float(distances[index])
+            if max_distance is not None and distance > max_distance:
+                continue
+            airport = dict(self.airports[indices[index]])
+            airport['distance'] = distance
+            airports.append(airport)
+        return airports
+
+
+class ResponseCache(object):
+    '''
+    Cache of API responses with a time to live held within the process and
+    optionally within an SQLite database shared between processes. At most
+    size responses are held within the process, discarding the least
+    recently used. Concurrent requests for the same key within the process
+    are coalesced into a single request.
+
+    Responses must be JSON serialisable and a new copy of the response is
+    returned for each lookup.
+    '''
+    _missing = object()
+
+    def __init__(self, ttl, path=None, size=None):
+        '''
+        :param ttl: Time in seconds that responses are cached for.
+        :type ttl: float
+        :param path: Path to the SQLite database which will be created if it
+            does not exist. None only caches responses within the process.
+        :type path: str or None
+        :param size: Maximum number of responses held within the process.
+            None does not limit the number of responses.
+        :type size: int or None
+        '''
+        self.ttl = ttl
+        self.path = path
+        self.size = size
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        '''
+        Connections cannot be shared between threads, so one is opened per
+        thread.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             'key TEXT PRIMARY KEY, expires REAL, value TEXT)')
+        return conn
+
+    def _remember(self, key, expires, value):
+        '''
+        Hold a response within the process as the most recently used. The
+        lock must be held.
+        '''
+        self._memory.pop(key, None)
+        self._memory[key] = (expires, value)
+        while self.size is not None and len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            expires, value = self._memory.get(key, (0, None))
+            if expires > now:
+                self._remember(key, expires, value)
+                return value
+        if self.path:
+            row = self._connection().execute(
+                'SELECT expires, value FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row and row[0] > now:
+                with self._lock:
+                    self._remember(key, *row)
+                return row[1]
+        return None
+
+    def get(self, key):
+        '''
+        :param key: Cache key.
+        :type key: str
+        :returns: Copy of the cached response or None if it has not been
+            cached or has expired.
+        '''
+        value = self._get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, response):
+        '''
+        :param key: Cache key.
+        :type key: str
+        :param response: JSON serialisable response.
+        '''
+        expires = time.time() + self.ttl
+        value = json.dumps(response)
+        with self._lock:
+            self._remember(key, expires, value)
+        if self.path:
+            conn = self._connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                             (key, expires, value))
+
+    def fetch(self, key, func):
+        '''
+        Returns the cached response or calls func to request it. If another
+        thread is already requesting the same key its response is shared.
+        Errors are not cached and are raised within each waiting thread.
+
+        :param key: Cache key.
+        :type key: str
+        :param func: Function without arguments which requests the response.
+        :type func: callable
+        '''
+        value = self._get(key)
+        if value is not None:
+            return json.loads(value)
+        with self._lock:
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = {'event': threading.Event()}
+        if not owner:
+            pending['event'].wait()
+            if 'exc_info' in pending:
+                six.reraise(*pending['exc_info'])
+            return json.loads(pending['value'])
+        try:
+            response = func()
+            self.set(key, response)
+            pending['value'] = json.dumps(response)
+        except Exception:
+            pending['exc_info'] = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending['event'].set()
+        return json.loads(pending['value'])
+
+
+def get_response_cache():
+    '''
+    Returns the response cache of the HTTP API Handler shared within the
+    process, configured by settings.API_HTTP_CACHE_TTL,
+    settings.API_HTTP_CACHE_PATH and settings.API_HTTP_CACHE_SIZE.
+
+    :returns: response cache or None if caching is disabled.
+    :rtype: ResponseCache or None
+    '''
+    global _response_cache
+    if not settings.API_HTTP_CACHE_TTL:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None or \
+                _response_cache.ttl != settings.API_HTTP_CACHE_TTL or \
+                _response_cache.path != settings.API_HTTP_CACHE_PATH or \
+                _response_cache.size != settings.API_HTTP_CACHE_SIZE:
+            _response_cache = ResponseCache(settings.API_HTTP_CACHE_TTL,
+                                            settings.API_HTTP_CACHE_PATH,
+                                            settings.API_HTTP_CACHE_SIZE)
+        return _response_cache
+
+
+class ConfigIndex(object):
+    '''
+    Parsed contents of a YAML file of the File API Handler with lookup tables
+    of airports by code and a spatial index of airports.
+    '''
+
+    def __init__(self, data):
+        '''
+        :param data: parsed contents of the YAML file.
+        :type data: list, dict or None
+        '''
+        self.data = data
+        # Position of the first airport with each id, IATA or ICAO code.
+        self.airport_codes = {}
+        if isinstance(data, list):
+            for position, airport in enumerate(data):
+                codes = airport.get('code', {})
+                for code in (airport.get('id'), codes.get('iata'), codes.get('icao')):
+                    if code is not None:
+                        self.airport_codes.setdefault(code, position)
+        self._airport_index = None
+
+    def __getstate__(self):
+        # The KD-tree is faster to build than to load.
+        state = self.__dict__.copy()
+        state['_airport_index'] = None
+        return state
+
+    @property
+    def airport_index(self):
+        '''
+        :rtype: AirportIndex
+        '''
+        if self._airport_index is None:
+            self._airport_index = AirportIndex(self.data or [])
+        return self._airport_index
+
+
+def _config_index_path(path):
+    '''
+    :param path: path of a YAML file.
+    :type path: str
+    :returns: path of the YAML file's compiled index.
+    :rtype: str
+    '''
+    index_dir = settings.API_FILE_INDEX_DIR or os.path.dirname(path)
+    return os.path.join(index_dir, os.path.basename(path) + '.idx')
+
+
+def compile_config(path):
+    '''
+    Parse a YAML file of the File API Handler and write its compiled index
+    (see load_config). Failure to write the index is logged.
+
+    :param path: path of the YAML file.
+    :type path: str
+    :rtype: ConfigIndex
+    '''
+    stat = os.stat(path)
+    with open(path, 'rb') as yaml_file:
+        data = yaml.load(yaml_file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    index = ConfigIndex(data)
+    index_path = _config_index_path(path)
+    temp_path = '%s.%d.tmp' % (index_path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as index_file:
+            cPickle.dump((CONFIG_INDEX_VERSION, stat.st_mtime, stat.st_size, index),
+                         index_file, protocol=cPickle.HIGHEST_PROTOCOL)
+        # Replace the index atomically for concurrent workers.
+        getattr(os, 'replace', os.rename)(temp_path, index_path)
+    except (IOError, OSError) as err:
+        logger.warning("Unable to write config index '%s': %s", index_path, err)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return index
+
+
+def load_config(path):
+    '''
+    Load a YAML file of the File API Handler from its compiled index. The
+    index is loaded once per process and compiled again if the YAML file is
+    modified.
+
+    :param path: path of the YAML file.
+    :type path: str
+    :rtype: ConfigIndex
+    '''
+    stat = os.stat(path)
+    key = (stat.st_mtime, stat.st_size)
+    cached = _config_indexes.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    index = None
+    try:
+        with open(_config_index_path(path), 'rb') as index_file:
+            version, mtime, size, stored = cPickle.load(index_file)
+        if (version, mtime, size) == (CONFIG_INDEX_VERSION, ) + key:
+            index = stored
+    except Exception:
+        # Missing, incomplete or incompatible index.
+        pass
+    if index is None:
+        index = compile_config(path)
+    _config_indexes[path] = (key, index)
+    return index
+
+
+class GeodataContext(object):
+    '''
+    Airport lookups of a single flight. Lookups are made through the API
+    handler once for each airport code and set of coordinates and the
+    coordinates of several lookups can be resolved with a single call to the
+    handler using prefetch. The context provides the lookup methods of the
+    API handler so that nodes use it in place of the handler.
+    '''
+
+    def __init__(self, handler=None):
+        '''
+        :param handler: API handler. If None, the handler is created from
+            settings.API_HANDLER on first use.
+        :type handler: MethodInterface or None
+        '''
+        self._handler = handler
+        self._airports = {}
+        self._nearest = {}
+
+    @property
+    def handler(self):
+        if self._handler is None:
+            self._handler = api.get_handler(settings.API_HANDLER)
+        return self._handler
+
+    def __getattr__(self, name):
+        # Other lookups are not cached.
+        return getattr(self.handler, name)
+
+    @staticmethod
+    def _result(result):
+        if isinstance(result, Exception):
+            raise result
+        return copy.deepcopy(result)
+
+    def get_airport(self, code):
+        '''
+        Returns details of an airport matching the provided code (see
+        MethodInterface.get_airport).
+        '''
+        if code not in self._airports:
+            try:
+                self._airports[code] = self.handler.get_airport(code)
+            except api.NotFoundError as err:
+                self._airports[code] = err
+        return self._result(self._airports[code])
+
+    def get_nearest_airport(self, latitude, longitude):
+        '''
+        Returns the nearest airports to the provided latitude and longitude
+        (see MethodInterface.get_nearest_airport).
+        '''
+        key = (latitude, longitude)
+        if key not in self._nearest:
+            try:
+                self._nearest[key] = self.handler.get_nearest_airport(
+                    latitude, longitude)
+            except api.NotFoundError as err:
+                self._nearest[key] = err
+        return self._result(self._nearest[key])
+
+    def prefetch(self, coordinates):
+        '''
+        Resolve the nearest airports to the coordinates which have not been
+        looked up with a single call to the handler. Invalid coordinates are
+        ignored.
+
+        :param coordinates: latitude and longitude pairs in decimal degrees.
+        :type coordinates: iterable of (float, float)
+        '''
+        keys = []
+        for latitude, longitude in coordinates:
+            if any(x is None or x is np.ma.masked or np.isnan(x)
+                   for x in (latitude, longitude)):
+                continue
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                continue
+            key = (latitude, longitude)
+            if key not in self._nearest and key not in keys:
+                keys.append(key)
+        if keys:
+            self._nearest.update(zip(keys,
+                                     self.handler.get_nearest_airports(keys)))
+
+
+@contextmanager
+def flight_geodata(handler=None):
+    '''
+    Share airport lookups between the nodes of a flight processed within the
+    context (see geodata_handler).
+
+    :param handler: API handler. If None, the handler is created from
+        settings.API_HANDLER.
+    :type handler: MethodInterface or None
+    :rtype: GeodataContext
+    '''
+    previous = getattr(_geodata, 'context', None)
+    _geodata.context = GeodataContext(handler)
+    try:
+        yield _geodata.context
+    finally:
+        _geodata.context = previous
+
+
+def geodata_handler(handler):
+    '''
+    Returns the geodata context of the flight being processed if within
+    flight_geodata, otherwise the provided API handler.
+
+    Usage:
+
+    handler = geodata_handler(api.get_handler(settings.API_HANDLER))
+
+    :param handler: API handler used by the context if it does not have one.
+    :type handler: MethodInterface
+    :rtype: GeodataContext or MethodInterface
+    '''
+    context = getattr(_geodata, 'context', None)
+    if context is None:
+        return handler
+    if context._handler is None:
+        context._handler = handler
+    return context
+
+
+def prefetch_airports(coordinates):
+    '''
+    Resolve the nearest airports to the coordinates with a single lookup if
+    within flight_geodata, otherwise do nothing.
+
+    :param coordinates: latitude and longitude pairs in decimal degrees.
+    :type coordinates: iterable of (float, float)
+    '''
+    context = getattr(_geodata, 'context', None)
+    if context is not None:
+        context.prefetch(coordinates)
+
+
 class MethodInterface(six.with_metaclass(abc.ABCMeta, object)):
     '''
     Abstract base class for Flight Data Analyser API handler classes.
@@ -105,12 +609,52 @@ class MethodInterface(six.with_metaclass(abc.ABCMeta, object)):
         '''
         raise NotImplementedError
 
+    def get_nearest_airports(self, coordinates):
+        '''
+        Returns the nearest airports to each of the provided coordinates.
+        Handlers which are able to look up several coordinates at once should
+        override this method.
+
+        :param coordinates: latitude and longitude pairs in decimal degrees.
+        :type coordinates: list of (float, float)
+        :returns: nearest airports (see get_nearest_airport) or the
+            api.NotFoundError raised for each of the coordinates.
+        :rtype: list
+        '''
+        results = []
+        for latitude, longitude in coordinates:
+            try:
+                results.append(self.get_nearest_airport(latitude, longitude))
+            except api.NotFoundError as err:
+                results.append(err)
+        return results
+
 
 class HTTPHandler(MethodInterface, api.HTTPHandler):
 
     def __init__(self):
         assert settings.API_HTTP_BASE_URL, 'Setting missing for HTTP API Handler.'
 
+    def cached_request(self, url, params=None):
+        '''
+        Make a request, returning the cached response of an identical request
+        if available (see get_response_cache).
+
+        :param url: URL of the request.
+        :type url: str
+        :param params: query parameters.
+        :type params: dict or None
+        :returns: response of the request.
+        '''
+        kwargs = {} if params is None else {'params': params}
+        cache = get_response_cache()
+        if cache is None:
+            return self.request(url, **kwargs)
+        key = url
+        if params:
+            key += '?' + urlencode(sorted(params.items()))
+        return cache.fetch(key, lambda: self.request(url, **kwargs))
+
     def get_aircraft(self, aircraft):
         '''
         Returns details of an aircraft matching the provided tail number.
@@ -125,7 +669,7 @@ class HTTPHandler(MethodInterface, api.HTTPHandler):
             'base_url': settings.API_HTTP_BASE_URL.rstrip('/'),
             'aircraft': aircraft.strip().lower(),
         }
-        return self.request(url)
+        return self.cached_request(url)
 
     def get_analyser_profiles(self, aircraft):
         '''
@@ -173,7 +717,7 @@ class HTTPHandler(MethodInterface, api.HTTPHandler):
             'base_url': settings.API_HTTP_BASE_URL.rstrip('/'),
             'code': str(code).strip().lower(),
         }
-        return self.request(url)
+        return self.cached_request(url)
 
     def get_nearest_airport(self, latitude, longitude):
         '''
@@ -202,7 +746,7 @@ class HTTPHandler(MethodInterface, api.HTTPHandler):
         #       Also more opportunity for caching similar responses.
         #       See https://gis.stackexchange.com/a/8674 for details.
         params = {'ll': '%.3f,%.3f' % (latitude, longitude), 'all': 1}
-        return self.request(url, params=params)
+        return self.cached_request(url, params=params)
 
 
 class FileHandler(MethodInterface, api.FileHandler):
@@ -220,9 +764,10 @@ class FileHandler(MethodInterface, api.FileHandler):
         :rtype: dict
         :raises: api.NotFoundError -- if the aircraft cannot be found.
         '''
-        data = self.request(settings.API_FILE_PATHS['aircraft'])
+        data = load_config(settings.API_FILE_PATHS['aircraft']).data
         try:
-            return data[aircraft]
+            # The parsed config is shared within the process.
+            return copy.deepcopy(data[aircraft])
         except KeyError:
             raise api.NotFoundError('Aircraft not found using Local File API: %s' % aircraft)
 
@@ -249,9 +794,10 @@ class FileHandler(MethodInterface, api.FileHandler):
         :rtype: dict
         :raises: api.NotFoundError -- if the aircraft cannot be found.
         '''
-        data = self.request(settings.API_FILE_PATHS['exports'])
+        data = load_config(settings.API_FILE_PATHS['exports']).data
         try:
-            return data[aircraft]
+            # The parsed config is shared within the process.
+            return copy.deepcopy(data[aircraft])
         except (KeyError, TypeError):
             raise api.NotFoundError('Aircraft not found using Local File API: %s' % aircraft)
 
@@ -265,33 +811,91 @@ class FileHandler(MethodInterface, api.FileHandler):
         :rtype: dict
         :raises: api.NotFoundError -- if the aircraft cannot be found.
         '''
-        data = self.request(settings.API_FILE_PATHS['airports'])
-        for airport in data:
-            if code in (airport.get('id'), airport['code'].get('iata'), airport['code'].get('icao')):
-                return airport
+        index = load_config(settings.API_FILE_PATHS['airports'])
+        try:
+            # The parsed config is shared within the process.
+            return copy.deepcopy(index.data[index.airport_codes[code]])
+        except (KeyError, TypeError):
+            pass
         raise api.NotFoundError('Airport not found using Local File API: %s' % code)
 
-    def get_nearest_airport(self, latitude, longitude):
+    def _get_airport_index(self):
         '''
-        Returns the nearest airports to the provided latitude and longitude.
+        Returns the airport index which is built once per process and rebuilt
+        if the airports file is modified.
+
+        :rtype: AirportIndex
+        '''
+        return load_config(settings.API_FILE_PATHS['airports']).airport_index
+
+    def get_nearest_airport(self, latitude, longitude, max_distance=None):
+        '''
+        Returns the nearest airports to the provided latitude and longitude
+        sorted by distance.
 
         :param latitude: latitude in decimal degrees.
         :type latitude: float
         :param longitude: longitude in decimal degrees.
         :type longitude: float
-        :returns: airport info dictionary
-        :rtype: dict
-        :raises: api.NotFoundError -- if the aircraft cannot be found.
+        :param max_distance: maximum distance in metres of airports to
+            return. None uses settings.NEAREST_AIRPORT_MAX_DISTANCE which
+            returns all airports by default.
+        :type max_distance: float or None
+        :returns: airport info dictionaries with the distance of each airport
+        :rtype: list of dict
+        :raises: api.NotFoundError -- if no airports are within max_distance.
         '''
-        data = self.request(settings.API_FILE_PATHS['airports'])
-        airports = []
-        for airport in data:
-            if 'latitude' not in airport or 'longitude' not in airport:
-                continue
-            args = (latitude, longitude, airport['latitude'], airport['longitude'])
-            airport['distance'] = library.bearing_and_distance(*args)[1]
-            airports.append(airport)
-        try:
-            return airports
-        except:
+        if max_distance is None:
+            max_distance = settings.NEAREST_AIRPORT_MAX_DISTANCE
+        airports = self._get_airport_index().nearest(
+            latitude, longitude, max_distance=max_distance)
+        if not airports:
             raise api.NotFoundError('Airport not found using Local File API: %f,%f' % (latitude, longitude))
+        return airports
+
+    def get_nearest_airports(self, coordinates, max_distance=None):
+        '''
+        Returns the nearest airports to each of the provided coordinates
+        using a single airport index lookup.
+
+        :param coordinates: latitude and longitude pairs in decimal degrees.
+        :type coordinates: list of (float, float)
+        :param max_distance: maximum distance in metres of airports to
+            return. None uses settings.NEAREST_AIRPORT_MAX_DISTANCE which
+            returns all airports by default.
+        :type max_distance: float or None
+        :returns: nearest airports (see get_nearest_airport) or the
+            api.NotFoundError raised for each of the coordinates.
+        :rtype: list
+        '''
+        if max_distance is None:
+            max_distance = settings.NEAREST_AIRPORT_MAX_DISTANCE
+        index = self._get_airport_index()
+        results = []
+        for latitude, longitude in coordinates:
+            airports = index.nearest(latitude, longitude,
+                                     max_distance=max_distance)
+            results.append(airports or api.NotFoundError(
+                'Airport not found using Local File API: %f,%f' % (latitude, longitude)))
+        return results
+
+
+##############################################################################
+# Program
+
+
+if __name__ == '__main__':
+    import argparse
+    # Pickle indexes as analysis_engine.api_handler.ConfigIndex rather than
+    # __main__.ConfigIndex.
+    from analysis_engine.api_handler import compile_config, _config_index_path
+    parser = argparse.ArgumentParser(
+        description='Compile the indexes of the File API Handler YAML files.')
+    parser.add_argument('paths', nargs='*', metavar='PATH',
+                        help='YAML files to compile. Defaults to settings.API_FILE_PATHS.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for path in args.paths or sorted(settings.API_FILE_PATHS.values()):
+        if os.path.exists(path):
+            compile_config(path)
+            logger.info("Compiled config index: %s", _config_index_path(path))
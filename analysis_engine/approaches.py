@@ -17,6 +17,7 @@ from operator import itemgetter
 from flightdatautilities import api, units as ut
 
 from analysis_engine import settings
+from analysis_engine.api_handler import geodata_handler
 from analysis_engine.exceptions import AFRMissmatchError
 from analysis_engine.node import A, aeroplane, ApproachNode, KPV, P, S, helicopter, M, KTI
 
@@ -24,7 +25,6 @@ from analysis_engine.node import A, aeroplane, ApproachNode, KPV, P, S, helicopt
 from analysis_engine.library import (
     all_of,
     bearing_and_distance,
-    filter_runway_heading,
     ils_established,
     index_at_value,
     is_index_within_slice,
@@ -36,10 +36,9 @@ from analysis_engine.library import (
     find_rig_approach,
     valid_between,
     repair_mask,
+    runway_table,
 )
 
-from flightdatautilities.geometry import great_circle_distance__haversine
-
 ##############################################################################
 # Nodes
 
@@ -122,22 +121,17 @@ class ApproachInformation(ApproachNode):
         annotated_airports = {}
         for airport in airports:
             ils_match = None
-            heading_match = False
             min_rwy_start_dist = None
-            for runway in airport.get('runways', []):
-                if not filter_runway_heading(runway, lowest_hdg):
-                    # Heading does not match runway
-                    continue
-                heading_match = True
-                if ut.convert(runway.get('localizer', {}).get('frequency', 0), ut.KHZ, ut.MHZ) == appr_ils_freq:
-                    ils_match = True
-                if runway.get('start') and lowest_lat is not None and lowest_lon is not None:
-                    start_dist = great_circle_distance__haversine(
-                        runway['start']['latitude'],
-                        runway['start']['longitude'],
-                        lowest_lat, lowest_lon,
-                    )
-                    min_rwy_start_dist = min(min_rwy_start_dist, start_dist) if min_rwy_start_dist else start_dist
+            table = runway_table(airport)
+            matches = table.heading_match(lowest_hdg)
+            heading_match = bool(np.any(matches))
+            if np.any(ut.convert(table.frequencies[matches], ut.KHZ, ut.MHZ) == appr_ils_freq):
+                ils_match = True
+            if heading_match and lowest_lat is not None and lowest_lon is not None:
+                start_dists = table.start_distances(lowest_lat, lowest_lon)[matches]
+                start_dists = start_dists[~np.isnan(start_dists)]
+                if len(start_dists):
+                    min_rwy_start_dist = float(np.min(start_dists))
 
             annotated_airports[airport['id']] = {'airport': airport,
                                                  'heading_match': heading_match,
@@ -151,7 +145,7 @@ class ApproachInformation(ApproachNode):
                                    lowest_lon, lowest_hdg, appr_ils_freq,
                                    land_afr_apt=None, land_afr_rwy=None,
                                    hint='approach', ac_type=aeroplane):
-        handler = api.get_handler(settings.API_HANDLER)
+        handler = geodata_handler(api.get_handler(settings.API_HANDLER))
         kwargs = {}
         airport, runway, match = None, None, None
 
@@ -260,42 +254,20 @@ class ApproachInformation(ApproachNode):
 
         return airport, runway
 
-    def derive(self,
-               alt_aal=P('Altitude AAL'),
-               alt_agl=P('Altitude AGL'),
-               ac_type=A('Aircraft Type'),
-               app=S('Approach And Landing'),
-               hdg=P('Heading Continuous'),
-               lat=P('Latitude Prepared'),
-               lon=P('Longitude Prepared'),
-               ils_loc=P('ILS Localizer'),
-               ils_gs=S('ILS Glideslope'),
-               ils_freq=P('ILS Frequency'),
-               land_afr_apt=A('AFR Landing Airport'),
-               land_afr_rwy=A('AFR Landing Runway'),
-               lat_land=KPV('Latitude At Touchdown'),
-               lon_land=KPV('Longitude At Touchdown'),
-               precision=A('Precise Positioning'),
-               fast=S('Fast'),
-               
-               lat_smoothed=P('Latitude Smoothed'),
-               lon_smoothed=P('Longitude Smoothed'),
-               u=P('Airspeed'),
-               gspd=P('Groundspeed'),
-               height_from_rig=P('Altitude ADH'),
-               hdot=P('Vertical Speed'),
-               roll=P('Roll'),
-               heading=P('Heading'),
-               distance_land=P('Distance To Landing'),
-               tdwns=KTI('Touchdown'), 
-               offshore=M('Offshore'),
-               takeoff=S('Takeoff')
-               ):
-
-        precise = bool(getattr(precision, 'value', False))
-        alt = alt_agl if ac_type == helicopter else alt_aal
+    def _reference_points(self, alt, alt_aal, ac_type, app, hdg, lat, lon,
+                          lat_land, lon_land, fast):
+        '''
+        Determine the type of each approach and the reference point used to
+        look up its airport and runway. The coordinates of go-arounds are
+        extrapolated to the threshold.
+
+        :returns: The approach slice, approach type, whether landing, whether
+            the last approach, reference index, turnoff index and the heading,
+            latitude and longitude at the reference point of each approach.
+        :rtype: list of tuple
+        '''
         app_slices = sorted(app.get_slices())
-
+        points = []
         for index, _slice in enumerate(app_slices):
             type_landing = False
             # a) The last approach is assumed to be landing:
@@ -385,6 +357,64 @@ class ApproachInformation(ApproachNode):
                     lowest_lat = lat_land[0].value or None
                     lowest_lon = lon_land[0].value or None
 
+            points.append((_slice, approach_type, landing, type_landing,
+                           ref_idx, turnoff, lowest_hdg, lowest_lat,
+                           lowest_lon))
+        return points
+
+    def airport_coordinates(self, alt_aal=None, alt_agl=None, ac_type=None,
+                            app=None, hdg=None, lat=None, lon=None,
+                            lat_land=None, lon_land=None, fast=None,
+                            **kwargs):
+        '''
+        The coordinates which derive looks up the airports of approaches
+        near, so that they can be looked up for the whole flight at once.
+        '''
+        alt = alt_agl if ac_type == helicopter else alt_aal
+        points = self._reference_points(alt, alt_aal, ac_type, app, hdg, lat,
+                                        lon, lat_land, lon_land, fast)
+        return [(point[7], point[8]) for point in points]
+
+    def derive(self,
+               alt_aal=P('Altitude AAL'),
+               alt_agl=P('Altitude AGL'),
+               ac_type=A('Aircraft Type'),
+               app=S('Approach And Landing'),
+               hdg=P('Heading Continuous'),
+               lat=P('Latitude Prepared'),
+               lon=P('Longitude Prepared'),
+               ils_loc=P('ILS Localizer'),
+               ils_gs=S('ILS Glideslope'),
+               ils_freq=P('ILS Frequency'),
+               land_afr_apt=A('AFR Landing Airport'),
+               land_afr_rwy=A('AFR Landing Runway'),
+               lat_land=KPV('Latitude At Touchdown'),
+               lon_land=KPV('Longitude At Touchdown'),
+               precision=A('Precise Positioning'),
+               fast=S('Fast'),
+               
+               lat_smoothed=P('Latitude Smoothed'),
+               lon_smoothed=P('Longitude Smoothed'),
+               u=P('Airspeed'),
+               gspd=P('Groundspeed'),
+               height_from_rig=P('Altitude ADH'),
+               hdot=P('Vertical Speed'),
+               roll=P('Roll'),
+               heading=P('Heading'),
+               distance_land=P('Distance To Landing'),
+               tdwns=KTI('Touchdown'), 
+               offshore=M('Offshore'),
+               takeoff=S('Takeoff')
+               ):
+
+        precise = bool(getattr(precision, 'value', False))
+        alt = alt_agl if ac_type == helicopter else alt_aal
+        points = self._reference_points(alt, alt_aal, ac_type, app, hdg, lat,
+                                        lon, lat_land, lon_land, fast)
+
+        for (_slice, approach_type, landing, type_landing, ref_idx, turnoff,
+             lowest_hdg, lowest_lat, lowest_lon) in points:
+
             kwargs = dict(
                 precise=precise,
                 _slice=_slice,
@@ -318,6 +318,52 @@ def any_predecessors_in_requested(node_name, requested, graph):
         return False
 
 
+def dependent_nodes(graph, node_names):
+    '''
+    Find the nodes which must be derived again if the provided nodes change,
+    i.e. the nodes themselves and every node which depends upon them either
+    directly or indirectly (the downstream closure within the tree).
+
+    Node names which are not within the graph are ignored.
+
+    :param graph: Dependency tree graph (edges point from a node towards its
+        dependencies).
+    :type graph: nx.DiGraph
+    :param node_names: Names of nodes which have changed.
+    :type node_names: iterable of str
+    :returns: Names of all nodes affected by the change, excluding 'root'.
+    :rtype: set of str
+    '''
+    affected = set()
+    for node_name in node_names:
+        if node_name not in graph or node_name in affected:
+            continue
+        affected.add(node_name)
+        # Predecessors are the nodes which depend upon this node.
+        affected.update(nx.ancestors(graph, node_name))
+    affected.discard('root')
+    return affected
+
+
+def dependency_graph(derived_nodes):
+    '''
+    Build a graph of the declared dependencies of derived nodes regardless of
+    whether the nodes can operate, e.g. to find the nodes affected by changes
+    before the available parameters are known (see dependent_nodes).
+
+    :param derived_nodes: Derived node classes keyed by name.
+    :type derived_nodes: dict
+    :returns: Graph with edges from each node towards its dependencies.
+    :rtype: nx.DiGraph
+    '''
+    graph = nx.DiGraph()
+    for node_name, node_obj in six.iteritems(derived_nodes):
+        graph.add_node(node_name)
+        graph.add_edges_from((node_name, dep)
+                             for dep in node_obj.get_dependency_names())
+    return graph
+
+
 def graph_adjacencies(graph):
     '''
     Create a dictionary of each nodes adjacencies within the graph. Useful for
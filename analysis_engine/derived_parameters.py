@@ -2,7 +2,6 @@
 
 from __future__ import print_function
 
-import geomag
 import numpy as np
 import six
 
@@ -59,6 +58,7 @@ from analysis_engine.library import (air_track,
                                      lookup_table,
                                      machsat2tat,
                                      machtat2sat,
+                                     magnetic_declination,
                                      mask_inside_slices,
                                      mask_outside_slices,
                                      match_altitudes,
@@ -103,6 +103,7 @@ from analysis_engine.library import (air_track,
                                      straighten_headings,
                                      track_linking,
                                      value_at_index,
+                                     stack_params,
                                      vstack_params,
                                      vstack_params_sw)
 
@@ -2067,9 +2068,9 @@ class Brake_TempAvg(DerivedParameterNode):
                brake8=P('Brake (8) Temp')):
 
         brake_params = (brake1, brake2, brake3, brake4, brake5, brake6, brake7, brake8)
-        brakes = vstack_params(*brake_params)
-        self.array = np.ma.average(brakes, axis=0)
-        self.offset = offset_select('mean', brake_params)
+        brakes = stack_params(brake_params, cache=self._cache)
+        self.array = brakes.average()
+        self.offset = brakes.offset
 
 
 class Brake_TempMax(DerivedParameterNode):
@@ -2099,9 +2100,9 @@ class Brake_TempMax(DerivedParameterNode):
                brake8=P('Brake (8) Temp')):
 
         brake_params = (brake1, brake2, brake3, brake4, brake5, brake6, brake7, brake8)
-        brakes = vstack_params(*brake_params)
-        self.array = np.ma.max(brakes, axis=0)
-        self.offset = offset_select('mean', brake_params)
+        brakes = stack_params(brake_params, cache=self._cache)
+        self.array = brakes.max()
+        self.offset = brakes.offset
 
 
 class Brake_TempMin(DerivedParameterNode):
@@ -2131,9 +2132,9 @@ class Brake_TempMin(DerivedParameterNode):
                brake8=P('Brake (8) Temp')):
 
         brake_params = (brake1, brake2, brake3, brake4, brake5, brake6, brake7, brake8)
-        brakes = vstack_params(*brake_params)
-        self.array = np.ma.min(brakes, axis=0)
-        self.offset = offset_select('mean', brake_params)
+        brakes = stack_params(brake_params, cache=self._cache)
+        self.array = brakes.min()
+        self.offset = brakes.offset
 
 ##############################################################################
 # Engine EPR
@@ -2158,9 +2159,9 @@ class Eng_EPRAvg(DerivedParameterNode):
                eng3=P('Eng (3) EPR'),
                eng4=P('Eng (4) EPR')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
+        self.offset = engines.offset
 
 
 class Eng_EPRMax(DerivedParameterNode):
@@ -2182,9 +2183,9 @@ class Eng_EPRMax(DerivedParameterNode):
                eng3=P('Eng (3) EPR'),
                eng4=P('Eng (4) EPR')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
+        self.offset = engines.offset
 
 
 class Eng_EPRMin(DerivedParameterNode):
@@ -2206,9 +2207,9 @@ class Eng_EPRMin(DerivedParameterNode):
                eng3=P('Eng (3) EPR'),
                eng4=P('Eng (4) EPR')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
+        self.offset = engines.offset
 
 
 class Eng_EPRMinFor5Sec(DerivedParameterNode):
@@ -2271,9 +2272,9 @@ class Eng_TPRMax(DerivedParameterNode):
                eng3=P('Eng (3) TPR'),
                eng4=P('Eng (4) TPR')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
+        self.offset = engines.offset
 
 
 class Eng_TPRMin(DerivedParameterNode):
@@ -2295,9 +2296,9 @@ class Eng_TPRMin(DerivedParameterNode):
                eng3=P('Eng (3) TPR'),
                eng4=P('Eng (4) TPR')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
+        self.offset = engines.offset
 
 
 ##############################################################################
@@ -2353,8 +2354,8 @@ class Eng_FuelFlowMin(DerivedParameterNode):
                eng3=P('Eng (3) Fuel Flow'),
                eng4=P('Eng (4) Fuel Flow')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
 
 
 class Eng_FuelFlowMax(DerivedParameterNode):
@@ -2381,8 +2382,8 @@ class Eng_FuelFlowMax(DerivedParameterNode):
                eng3=P('Eng (3) Fuel Flow'),
                eng4=P('Eng (4) Fuel Flow')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
 
 
 ##############################################################################
@@ -2496,9 +2497,9 @@ class Eng_GasTempAvg(DerivedParameterNode):
                eng3=P('Eng (3) Gas Temp'),
                eng4=P('Eng (4) Gas Temp')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
+        self.offset = engines.offset
 
 
 class Eng_GasTempMax(DerivedParameterNode):
@@ -2520,9 +2521,9 @@ class Eng_GasTempMax(DerivedParameterNode):
                eng3=P('Eng (3) Gas Temp'),
                eng4=P('Eng (4) Gas Temp')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
+        self.offset = engines.offset
 
 
 class Eng_GasTempMin(DerivedParameterNode):
@@ -2544,9 +2545,9 @@ class Eng_GasTempMin(DerivedParameterNode):
                eng3=P('Eng (3) Gas Temp'),
                eng4=P('Eng (4) Gas Temp')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
+        self.offset = engines.offset
 
 
 ##############################################################################
@@ -2577,8 +2578,8 @@ class Eng_N1Avg(DerivedParameterNode):
                eng3=P('Eng (3) N1'),
                eng4=P('Eng (4) N1')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
 
 
 class Eng_N1AvgFor10Sec(DerivedParameterNode):
@@ -2618,8 +2619,8 @@ class Eng_N1Max(DerivedParameterNode):
                eng3=P('Eng (3) N1'),
                eng4=P('Eng (4) N1')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
 
 
 class Eng_N1Min(DerivedParameterNode):
@@ -2646,8 +2647,8 @@ class Eng_N1Min(DerivedParameterNode):
                eng3=P('Eng (3) N1'),
                eng4=P('Eng (4) N1')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
 
 
 class Eng_N1Split(DerivedParameterNode):
@@ -2718,8 +2719,8 @@ class Eng_N2Avg(DerivedParameterNode):
                eng3=P('Eng (3) N2'),
                eng4=P('Eng (4) N2')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
 
 
 class Eng_N2Max(DerivedParameterNode):
@@ -2746,8 +2747,8 @@ class Eng_N2Max(DerivedParameterNode):
                eng3=P('Eng (3) N2'),
                eng4=P('Eng (4) N2')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
 
 
 class Eng_N2Min(DerivedParameterNode):
@@ -2774,8 +2775,8 @@ class Eng_N2Min(DerivedParameterNode):
                eng3=P('Eng (3) N2'),
                eng4=P('Eng (4) N2')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
 
 
 ##############################################################################
@@ -2806,8 +2807,8 @@ class Eng_N3Avg(DerivedParameterNode):
                eng3=P('Eng (3) N3'),
                eng4=P('Eng (4) N3')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
 
 
 class Eng_N3Max(DerivedParameterNode):
@@ -2834,8 +2835,8 @@ class Eng_N3Max(DerivedParameterNode):
                eng3=P('Eng (3) N3'),
                eng4=P('Eng (4) N3')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
 
 
 class Eng_N3Min(DerivedParameterNode):
@@ -2862,8 +2863,8 @@ class Eng_N3Min(DerivedParameterNode):
                eng3=P('Eng (3) N3'),
                eng4=P('Eng (4) N3')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
 
 
 ##############################################################################
@@ -2894,8 +2895,8 @@ class Eng_NpAvg(DerivedParameterNode):
                eng3=P('Eng (3) Np'),
                eng4=P('Eng (4) Np')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
 
 
 class Eng_NpMax(DerivedParameterNode):
@@ -2922,8 +2923,8 @@ class Eng_NpMax(DerivedParameterNode):
                eng3=P('Eng (3) Np'),
                eng4=P('Eng (4) Np')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
 
 
 class Eng_NpMin(DerivedParameterNode):
@@ -2950,8 +2951,8 @@ class Eng_NpMin(DerivedParameterNode):
                eng3=P('Eng (3) Np'),
                eng4=P('Eng (4) Np')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
 
 
 ##############################################################################
@@ -2977,9 +2978,9 @@ class Eng_OilPressAvg(DerivedParameterNode):
                eng3=P('Eng (3) Oil Press'),
                eng4=P('Eng (4) Oil Press')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
+        self.offset = engines.offset
 
 
 class Eng_OilPressMax(DerivedParameterNode):
@@ -3001,9 +3002,9 @@ class Eng_OilPressMax(DerivedParameterNode):
                eng3=P('Eng (3) Oil Press'),
                eng4=P('Eng (4) Oil Press')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
+        self.offset = engines.offset
 
 
 class Eng_OilPressMin(DerivedParameterNode):
@@ -3025,9 +3026,9 @@ class Eng_OilPressMin(DerivedParameterNode):
                eng3=P('Eng (3) Oil Press'),
                eng4=P('Eng (4) Oil Press')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
+        self.offset = engines.offset
 
 
 ##############################################################################
@@ -3053,9 +3054,9 @@ class Eng_OilQtyAvg(DerivedParameterNode):
                eng3=P('Eng (3) Oil Qty'),
                eng4=P('Eng (4) Oil Qty')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
+        self.offset = engines.offset
 
 
 class Eng_OilQtyMax(DerivedParameterNode):
@@ -3077,9 +3078,9 @@ class Eng_OilQtyMax(DerivedParameterNode):
                eng3=P('Eng (3) Oil Qty'),
                eng4=P('Eng (4) Oil Qty')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
+        self.offset = engines.offset
 
 
 class Eng_OilQtyMin(DerivedParameterNode):
@@ -3101,9 +3102,9 @@ class Eng_OilQtyMin(DerivedParameterNode):
                eng3=P('Eng (3) Oil Qty'),
                eng4=P('Eng (4) Oil Qty')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
+        self.offset = engines.offset
 
 
 ##############################################################################
@@ -3129,11 +3130,11 @@ class Eng_OilTempAvg(DerivedParameterNode):
                eng3=P('Eng (3) Oil Temp'),
                eng4=P('Eng (4) Oil Temp')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        avg_array = np.ma.average(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        avg_array = engines.average()
         if np.ma.count(avg_array) != 0:
             self.array = avg_array
-            self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+            self.offset = engines.offset
         else:
             # Some aircraft have no oil temperature sensors installed, so
             # quit now if there is no valid result.
@@ -3159,11 +3160,11 @@ class Eng_OilTempMax(DerivedParameterNode):
                eng3=P('Eng (3) Oil Temp'),
                eng4=P('Eng (4) Oil Temp')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        max_array = np.ma.max(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        max_array = engines.max()
         if np.ma.count(max_array) != 0:
             self.array = max_array
-            self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+            self.offset = engines.offset
         else:
             # Some aircraft have no oil temperature sensors installed, so
             # quit now if there is no valid result.
@@ -3189,11 +3190,11 @@ class Eng_OilTempMin(DerivedParameterNode):
                eng3=P('Eng (3) Oil Temp'),
                eng4=P('Eng (4) Oil Temp')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        min_array = np.ma.min(engines, axis=0)
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        min_array = engines.min()
         if np.ma.count(min_array) != 0:
             self.array = min_array
-            self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+            self.offset = engines.offset
         else:
             # Some aircraft have no oil temperature sensors installed, so
             # quit now if there is no valid result.
@@ -3223,9 +3224,9 @@ class Eng_TorqueAvg(DerivedParameterNode):
                eng3=P('Eng (3) Torque'),
                eng4=P('Eng (4) Torque')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.average(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.average()
+        self.offset = engines.offset
 
 
 class Eng_TorqueMax(DerivedParameterNode):
@@ -3247,9 +3248,9 @@ class Eng_TorqueMax(DerivedParameterNode):
                eng3=P('Eng (3) Torque'),
                eng4=P('Eng (4) Torque')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.max(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.max()
+        self.offset = engines.offset
 
 
 class Eng_TorqueMin(DerivedParameterNode):
@@ -3270,9 +3271,9 @@ class Eng_TorqueMin(DerivedParameterNode):
                eng3=P('Eng (3) Torque'),
                eng4=P('Eng (4) Torque')):
 
-        engines = vstack_params(eng1, eng2, eng3, eng4)
-        self.array = np.ma.min(engines, axis=0)
-        self.offset = offset_select('mean', [eng1, eng2, eng3, eng4])
+        engines = stack_params((eng1, eng2, eng3, eng4), cache=self._cache)
+        self.array = engines.min()
+        self.offset = engines.offset
 
 
 class TorqueAsymmetry(DerivedParameterNode):
@@ -5267,28 +5268,21 @@ class MagneticVariation(DerivedParameterNode):
 
         lat = lat or lat_coarse
         lon = lon or lon_coarse
-        mag_var_frequency = 64 * self.frequency
-        mag_vars = []
+        mag_var_frequency = int(64 * self.frequency)
         start_date = start_datetime.value.date() if start_datetime.value else date.today()
 
-        # TODO: Optimize.
-        for lat_val, lon_val, alt_aal_val in zip(lat.array[::mag_var_frequency],
-                                                 lon.array[::mag_var_frequency],
-                                                 alt_aal.array[::mag_var_frequency]):
-            if np.ma.masked in (lat_val, lon_val, alt_aal_val):
-                mag_vars.append(np.ma.masked)
-            else:
-                mag_vars.append(geomag.declination(lat_val, lon_val,
-                                                   alt_aal_val,
-                                                   time=start_date))
+        mag_vars = magnetic_declination(lat.array[::mag_var_frequency],
+                                        lon.array[::mag_var_frequency],
+                                        alt_aal.array[::mag_var_frequency],
+                                        start_date)
 
-        if not any(mag_vars):
+        if not np.ma.any(mag_vars):
             # all masked array
             self.array = np_ma_masked_zeros_like(lat.array)
             return
 
         # Repair mask to avoid interpolating between masked values.
-        mag_vars = repair_mask(np.ma.array(mag_vars),
+        mag_vars = repair_mask(mag_vars,
                                repair_duration=None,
                                extrapolate=True)
         m = np.arange(0, len(lat.array), mag_var_frequency)
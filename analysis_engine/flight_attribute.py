@@ -11,6 +11,7 @@ from operator import itemgetter
 from flightdatautilities import api
 
 from analysis_engine import __version__, settings
+from analysis_engine.api_handler import geodata_handler
 
 from analysis_engine.library import (
     all_of,
@@ -197,7 +198,7 @@ class DestinationAirport(FlightAttributeNode):
         if value is None or not value.isalpha():
             return
 
-        handler = api.get_handler(settings.API_HANDLER)
+        handler = geodata_handler(api.get_handler(settings.API_HANDLER))
         try:
             airport = handler.get_airport(value)
         except api.NotFoundError:
@@ -431,7 +432,7 @@ class TakeoffAirport(FlightAttributeNode):
         lat = lat_source.get_first()
         lon = lon_source.get_first()
         if lat and lon:
-            handler = api.get_handler(settings.API_HANDLER)
+            handler = geodata_handler(api.get_handler(settings.API_HANDLER))
             try:
                 airports = handler.get_nearest_airport(lat.value, lon.value)
             except api.NotFoundError:
@@ -450,6 +451,21 @@ class TakeoffAirport(FlightAttributeNode):
             self.warning('No coordinates for looking up takeoff airport.')
             # No suitable coordinates, so fall through and try AFR.
 
+    def airport_coordinates(self, toff_lat=None, toff_lon=None,
+                            off_block_lat=None, off_block_lon=None, **kwargs):
+        '''
+        The coordinates at liftoff and off blocks which derive looks up the
+        takeoff airport near, so that they can be looked up for the whole
+        flight at once.
+        '''
+        coordinates = []
+        for lat_source, lon_source in ((toff_lat, toff_lon), (off_block_lat, off_block_lon)):
+            lat = lat_source.get_first() if lat_source else None
+            lon = lon_source.get_first() if lon_source else None
+            if lat and lon:
+                coordinates.append((lat.value, lon.value))
+        return coordinates
+
     def derive(self,
                toff_lat=KPV('Latitude At Liftoff'),
                toff_lon=KPV('Longitude At Liftoff'),
@@ -0,0 +1,796 @@
+'''
+Background reading and writing of HDF parameters during processing.
+'''
+import copy
+import logging
+import numpy as np
+import six
+import sys
+import threading
+
+from collections import Counter
+from datetime import timedelta
+from six.moves import queue
+
+from hdfaccess.file import hdf_file
+from hdfaccess.parameter import MappedArray
+from hdfaccess.utils import segment_boundaries
+
+from analysis_engine.library import np_ma_masked_zeros
+
+from analysis_engine.settings import (
+    PREFETCH_LOOKAHEAD,
+    PREFETCH_MEMORY_LIMIT,
+    WRITE_QUEUE_SIZE,
+)
+
+
+logger = logging.getLogger(name=__name__)
+
+
+def _param_nbytes(param):
+    '''
+    :returns: Approximate memory used by the parameter's array in bytes.
+    :rtype: int
+    '''
+    array = param.array
+    return array.nbytes + getattr(array.mask, 'nbytes', 0)
+
+
+class LockedHDF(object):
+    '''
+    hdf_file-like proxy which holds a lock while getting or setting
+    attributes and calling methods of an HDF file.
+
+    ParameterPrefetcher reads from and ParameterWriter writes to the HDF file
+    on background threads while the main thread also reads from it. h5py
+    serialises calls to the HDF5 library itself, but hdf_file keeps caches of
+    parameter names which set_param updates without synchronisation, so every
+    thread must access the HDF file through the same LockedHDF. Holding the
+    lock while reading does not reduce the overlap of reads and writes with
+    the derivation of nodes as h5py would serialise them regardless.
+    '''
+    def __init__(self, hdf):
+        '''
+        :param hdf: HDF file to synchronise access to.
+        :type hdf: hdf_file
+        '''
+        self.__dict__['_hdf'] = hdf
+        self.__dict__['lock'] = threading.RLock()
+
+    def __getattr__(self, name):
+        with self.lock:
+            value = getattr(self._hdf, name)
+        if not callable(value):
+            return value
+        lock = self.lock
+
+        def locked(*args, **kwargs):
+            with lock:
+                return value(*args, **kwargs)
+
+        return locked
+
+    def __setattr__(self, name, value):
+        with self.lock:
+            setattr(self._hdf, name, value)
+
+    def __contains__(self, name):
+        with self.lock:
+            return name in self._hdf
+
+    def __getitem__(self, name):
+        with self.lock:
+            return self._hdf[name]
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self._hdf))
+
+    def __len__(self):
+        with self.lock:
+            return len(self._hdf)
+
+
+def _locked(hdf):
+    '''
+    :returns: The HDF file if it is already a LockedHDF, otherwise a new
+        LockedHDF for it.
+    :rtype: LockedHDF
+    '''
+    return hdf if isinstance(hdf, LockedHDF) else LockedHDF(hdf)
+
+
+class ParameterPrefetcher(object):
+    '''
+    Reads the HDF dependencies of upcoming nodes within the process order on
+    a background thread while the current node is being derived. h5py
+    releases the GIL while reading and decompressing datasets so the reads
+    overlap with the numpy calculations of the main thread.
+
+    Parameters are read for at most lookahead nodes ahead of the current
+    position and reading pauses while the prefetched arrays exceed
+    memory_limit bytes. Each prefetched parameter is released once its last
+    dependent node has requested it or the process order has advanced past
+    its last dependent node, e.g. when the node is not derived, and all are
+    released when the prefetcher is stopped at the end of the flight.
+
+    The HDF file is read through a LockedHDF (see LockedHDF) which must be
+    shared with the main thread and ParameterWriter.
+
+    Usage:
+
+    prefetcher = ParameterPrefetcher(hdf, process_order, dependencies)
+    prefetcher.start()
+    for index, name in enumerate(process_order):
+        prefetcher.advance(index)
+        param = prefetcher.get_param('Airspeed')
+    prefetcher.stop()
+    '''
+    def __init__(self, hdf, process_order, dependencies,
+                 lookahead=PREFETCH_LOOKAHEAD,
+                 memory_limit=PREFETCH_MEMORY_LIMIT):
+        '''
+        :param hdf: HDF file to read parameters from.
+        :type hdf: LockedHDF or hdf_file
+        :param process_order: Node names in the order they will be processed.
+        :type process_order: [str]
+        :param dependencies: HDF parameter names required by each node in the
+            process order.
+        :type dependencies: {str: [str]}
+        :param lookahead: Number of nodes to prefetch dependencies for.
+        :type lookahead: int
+        :param memory_limit: Maximum size of prefetched arrays in bytes.
+        :type memory_limit: int
+        '''
+        self.hdf = _locked(hdf)
+        self.lookahead = lookahead
+        self.memory_limit = memory_limit
+        self._order = [dependencies.get(name, []) for name in process_order]
+        self._uses = Counter(n for deps in self._order for n in deps)
+        # index of the last node within the process order using each param
+        self._last_use = dict((n, index)
+                              for index, deps in enumerate(self._order)
+                              for n in deps)
+        self._index = 0
+        self._params = {}
+        self._failed = set()
+        self._fetching = None
+        self._memory = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name='ParameterPrefetcher')
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        '''
+        Start prefetching parameters on the background thread.
+        '''
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop the background thread and release prefetched parameters.
+        '''
+        with self._condition:
+            self._stopped = True
+            self._params.clear()
+            self._memory = 0
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def advance(self, index):
+        '''
+        Move the prefetch window to the node at index within the process
+        order.
+
+        :type index: int
+        '''
+        with self._condition:
+            self._index = index
+            # release parameters which are no longer used by any node
+            for name in list(self._params):
+                if self._last_use[name] < index:
+                    self._release(name)
+            self._condition.notify_all()
+
+    def _release(self, name):
+        '''
+        Release a prefetched parameter. The condition must be held.
+
+        :returns: The released parameter.
+        :rtype: Parameter
+        '''
+        param = self._params.pop(name)
+        self._memory -= _param_nbytes(param)
+        self._uses[name] = 0
+        return param
+
+    def _next_name(self):
+        '''
+        :returns: Name of the next parameter to prefetch or None if there are
+            no parameters to prefetch within the window or the memory limit
+            has been reached.
+        :rtype: str or None
+        '''
+        if self._memory >= self.memory_limit:
+            return None
+        window = self._order[self._index:self._index + self.lookahead + 1]
+        for deps in window:
+            for name in deps:
+                if (self._uses[name] and name not in self._params and
+                        name not in self._failed):
+                    return name
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                name = self._next_name()
+                while name is None and not self._stopped:
+                    self._condition.wait()
+                    name = self._next_name()
+                if self._stopped:
+                    return
+                self._fetching = name
+            try:
+                param = self.hdf.get_param(name, valid_only=True)
+            except Exception:
+                # Invalid parameters or read errors are left to the main
+                # thread which will read the parameter itself.
+                param = None
+            with self._condition:
+                self._fetching = None
+                if self._stopped:
+                    return
+                if param is None:
+                    self._failed.add(name)
+                else:
+                    self._params[name] = param
+                    self._memory += _param_nbytes(param)
+                self._condition.notify_all()
+
+    def get_param(self, name, consume=True):
+        '''
+        Get a prefetched parameter. A copy is returned unless this is the
+        last use of the parameter within the process order so that nodes may
+        modify their dependencies.
+
+        :param name: Name of the parameter.
+        :type name: str
+        :param consume: Whether to count this as a use of the parameter
+            within the process order. Otherwise a copy is always returned.
+        :type consume: bool
+        :returns: Prefetched parameter or None if the parameter was not
+            prefetched and should be read from the HDF file.
+        :rtype: Parameter or None
+        '''
+        with self._condition:
+            while self._fetching == name:
+                self._condition.wait()
+            if consume and self._uses[name]:
+                self._uses[name] -= 1
+            param = self._params.get(name)
+            if param is None:
+                return None
+            if self._uses[name] or not consume:
+                return copy.deepcopy(param)
+            self._release(name)
+            self._condition.notify_all()
+            return param
+
+
+class ParameterWriter(object):
+    '''
+    Writes derived parameters to the HDF file on a background thread so that
+    compression and disk I/O do not stall the derivation of the following
+    nodes. Parameters are written in the order they are queued and queueing
+    blocks while queue_size parameters are waiting to be written.
+
+    Once writing a parameter raises an error, no further parameters are
+    written and the error is re-raised within the main thread by every
+    following call to put, get_param, flush or close, so that the derivation
+    of dependent nodes does not continue without the unwritten parameters.
+
+    The HDF file is written through a LockedHDF (see LockedHDF) which must
+    be shared with the main thread and ParameterPrefetcher.
+
+    Usage:
+
+    with ParameterWriter(hdf) as writer:
+        writer.put(node)
+        param = writer.get_param(node.name)
+    '''
+    _stop = object()
+
+    def __init__(self, hdf, queue_size=WRITE_QUEUE_SIZE):
+        '''
+        :param hdf: HDF file to write parameters to.
+        :type hdf: LockedHDF or hdf_file
+        :param queue_size: Maximum number of parameters waiting to be written.
+        :type queue_size: int
+        '''
+        self.hdf = _locked(hdf)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run,
+                                        name='ParameterWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not mask the original exception with write errors.
+            self.stop()
+
+    def _run(self):
+        while True:
+            node = self._queue.get()
+            try:
+                if node is self._stop:
+                    return
+                if self._exc_info is None:
+                    self.hdf.set_param(node)
+                    with self._lock:
+                        if self._pending.get(node.name) is node:
+                            del self._pending[node.name]
+            except Exception:
+                self._exc_info = sys.exc_info()
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        '''
+        Re-raise an exception raised by the background thread.
+        '''
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+
+    def stop(self):
+        '''
+        Stop the background thread once queued parameters have been written
+        without raising errors.
+        '''
+        if self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join()
+
+    def put(self, node):
+        '''
+        Queue a parameter to be written to the HDF file. The node must not be
+        modified after being queued.
+
+        :type node: DerivedParameterNode
+        '''
+        self._raise()
+        with self._lock:
+            self._pending[node.name] = node
+        self._queue.put(node)
+
+    def get_param(self, name):
+        '''
+        Get a parameter which is waiting to be written. The queued parameter
+        is shared rather than copied so it must not be modified, e.g. wrap it
+        with lazy_param_copy which copies the array when it is first accessed.
+
+        :param name: Name of the parameter.
+        :type name: str
+        :returns: The queued parameter or None if the parameter is not
+            waiting to be written.
+        :rtype: DerivedParameterNode or None
+        '''
+        self._raise()
+        with self._lock:
+            return self._pending.get(name)
+
+    def flush(self):
+        '''
+        Wait until all queued parameters have been written.
+        '''
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        '''
+        Write all queued parameters and stop the background thread.
+        '''
+        self.stop()
+        self._raise()
+
+
+def segment_bounds(segment_slice, boundary):
+    '''
+    :param segment_slice: Slice of the segment in seconds.
+    :type segment_slice: slice
+    :param boundary: Superframe boundary in seconds which the segment is
+        extended to.
+    :type boundary: int
+    :returns: Start and stop of the segment in seconds extended to superframe
+        boundaries followed by the start and stop of the segment slice in
+        seconds relative to the superframe start (see
+        hdfaccess.utils.segment_boundaries). The stops are None for segments
+        extending to the end of the data.
+    :rtype: (int or float, int or float or None, int or float,
+             int or float or None)
+    '''
+    supf_start_secs, supf_stop_secs = \
+        segment_boundaries(segment_slice, boundary)[:2]
+    if segment_slice.start is None:
+        supf_start_secs = 0
+        array_start_secs = 0
+    else:
+        array_start_secs = segment_slice.start - supf_start_secs
+    if segment_slice.stop is None:
+        supf_stop_secs = None
+        array_stop_secs = None
+    else:
+        array_stop_secs = segment_slice.stop - supf_start_secs
+    return supf_start_secs, supf_stop_secs, array_start_secs, array_stop_secs
+
+
+def slice_segment_param(param, supf_start_secs, supf_stop_secs, submasks,
+                        array_start_secs=0, array_stop_secs=None):
+    '''
+    Slice a parameter to a segment's superframe boundaries. Samples outside
+    of array_start_secs and array_stop_secs and arrays which end before
+    supf_stop_secs are padded with masked values and a 'padding' submask.
+
+    :param param: Parameter from the source HDF file.
+    :type param: Parameter
+    :param supf_start_secs: Start of the segment in seconds.
+    :type supf_start_secs: int or float
+    :param supf_stop_secs: Stop of the segment in seconds or None for the end
+        of the data.
+    :type supf_stop_secs: int or float or None
+    :param submasks: Names of submasks to keep.
+    :type submasks: iterable of str
+    :param array_start_secs: Start of the segment slice in seconds relative
+        to supf_start_secs.
+    :type array_start_secs: int or float
+    :param array_stop_secs: Stop of the segment slice in seconds relative to
+        supf_start_secs or None for the end of the data.
+    :type array_stop_secs: int or float or None
+    :returns: Copy of the parameter for the segment.
+    :rtype: Parameter
+    '''
+    start = int(supf_start_secs * param.frequency)
+    if supf_stop_secs is None:
+        stop = len(param.array)
+    else:
+        stop = int(supf_stop_secs * param.frequency)
+    array = param.array[start:stop]
+    padding = (stop - start) - len(array)
+    segment_submasks = {}
+    for name in submasks:
+        submask = getattr(param, 'submasks', {}).get(name)
+        if submask is not None:
+            segment_submasks[name] = submask[start:stop]
+    if padding > 0:
+        padded = np.ma.concatenate([array, np_ma_masked_zeros(padding)])
+        if isinstance(array, MappedArray):
+            padded = MappedArray(padded, values_mapping=array.values_mapping)
+        array = padded
+        for name, submask in segment_submasks.items():
+            segment_submasks[name] = np.concatenate(
+                [submask, np.zeros(padding, dtype=bool)])
+    # Mask samples outside of the segment slice as well as the padding.
+    padding_mask = np.zeros(len(array), dtype=bool)
+    padding_mask[:int(array_start_secs * param.frequency)] = True
+    if array_stop_secs is not None:
+        padding_mask[int(array_stop_secs * param.frequency):] = True
+    if padding > 0:
+        padding_mask[-padding:] = True
+    if padding_mask.any():
+        if padding <= 0:
+            # do not mask the source parameter's array
+            array = array.copy()
+        array[padding_mask] = np.ma.masked
+        if 'padding' in segment_submasks:
+            padding_mask |= segment_submasks['padding']
+        segment_submasks['padding'] = padding_mask
+    segment_param = copy.copy(param)
+    segment_param.array = array
+    segment_param.submasks = segment_submasks
+    return segment_param
+
+
+class SegmentView(object):
+    '''
+    Read-only hdf_file-like view of a segment of a parent HDF file.
+    Parameters are read as slices of the parent HDF file extended to
+    superframe boundaries in the same way as segments written by
+    split_hdf_to_segments, so a segment can be processed without writing it
+    to a new file first.
+    '''
+    def __init__(self, hdf_path, segment_slice, boundary=None):
+        '''
+        :param hdf_path: Path to the parent HDF file.
+        :type hdf_path: str
+        :param segment_slice: Slice of the segment in seconds.
+        :type segment_slice: slice
+        :param boundary: Superframe boundary in seconds. If None, 64 seconds
+            is used if superframes are present, otherwise 4 seconds.
+        :type boundary: int or None
+        '''
+        self.parent = hdf_file(hdf_path, read_only=True)
+        if boundary is None:
+            boundary = 64 if self.parent.superframe_present else 4
+        self.supf_start_secs, supf_stop_secs, self.array_start_secs, \
+            self.array_stop_secs = segment_bounds(segment_slice, boundary)
+        if supf_stop_secs is None:
+            supf_stop_secs = self.parent.duration
+        self.supf_stop_secs = supf_stop_secs
+        self.duration = supf_stop_secs - self.supf_start_secs
+        self.file_path = self.parent.file_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        # Delegate anything else to the parent HDF file.
+        return getattr(self.__dict__['parent'], name)
+
+    def __contains__(self, name):
+        return name in self.parent
+
+    def __getitem__(self, name):
+        return self.get_param(name)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def close(self):
+        self.parent.close()
+
+    @property
+    def start_datetime(self):
+        start_datetime = self.parent.start_datetime
+        if start_datetime is None:
+            return None
+        return start_datetime + timedelta(seconds=self.supf_start_secs)
+
+    def get(self, name, default=None):
+        try:
+            return self.get_param(name)
+        except KeyError:
+            return default
+
+    def get_param(self, name, valid_only=False, _slice=None,
+                  load_submasks=False):
+        '''
+        Get a parameter sliced to the segment (see hdf_file.get_param).
+        _slice is relative to the start of the segment.
+        '''
+        if load_submasks:
+            # Submasks are sliced along with the array.
+            param = self.parent.get_param(name, valid_only=valid_only,
+                                          load_submasks=True)
+            param = slice_segment_param(
+                param, self.supf_start_secs, self.supf_stop_secs,
+                getattr(param, 'submasks', {}),
+                array_start_secs=self.array_start_secs,
+                array_stop_secs=self.array_stop_secs)
+        else:
+            param = self.parent.get_param(
+                name, valid_only=valid_only,
+                _slice=slice(self.supf_start_secs, self.supf_stop_secs))
+            # Pad arrays which end before the segment and mask samples
+            # outside of the segment slice.
+            param = slice_segment_param(
+                param, 0, self.duration, (),
+                array_start_secs=self.array_start_secs,
+                array_stop_secs=self.array_stop_secs)
+        if _slice is not None:
+            start = int((_slice.start or 0) * param.frequency)
+            stop = None if _slice.stop is None else \
+                int(_slice.stop * param.frequency)
+            param.array = param.array[start:stop]
+        return param
+
+
+def _overlay_attr(name):
+    '''
+    Create a property which reads a file attribute from the sidecar HDF file
+    falling back to the raw HDF file and writes it to the sidecar HDF file.
+    '''
+    def fget(self):
+        value = getattr(self.sidecar, name)
+        return getattr(self.raw, name) if value is None else value
+
+    def fset(self, value):
+        setattr(self.sidecar, name, value)
+
+    return property(fget, fset)
+
+
+class HDFOverlay(object):
+    '''
+    hdf_file-like view of a raw HDF file, which is opened read-only, overlaid
+    with a sidecar HDF file. Derived parameters and attributes are written
+    to the sidecar HDF file so that the raw data does not need to be copied
+    before processing. Parameters within the sidecar HDF file take
+    precedence over parameters of the same name within the raw HDF file.
+    Other attributes which are set, e.g. those of hdf_file subclasses, are
+    also set on the sidecar HDF file and read back from it, so the raw HDF
+    file is never modified.
+
+    Usage:
+
+    with HDFOverlay('flight.hdf5', 'flight_derived.hdf5') as hdf:
+        hdf.set_param(node)
+    '''
+    analysis_version = _overlay_attr('analysis_version')
+    dependency_tree = _overlay_attr('dependency_tree')
+    duration = _overlay_attr('duration')
+    reliable_frame_counter = _overlay_attr('reliable_frame_counter')
+    start_datetime = _overlay_attr('start_datetime')
+    superframe_present = _overlay_attr('superframe_present')
+
+    # Attributes of the overlay itself.
+    _own_attrs = ('raw', 'sidecar', 'file_path', '_sidecar_attrs')
+
+    def __init__(self, raw, sidecar_path):
+        '''
+        :param raw: Path to the raw HDF file or a read-only hdf_file-like
+            object such as a SegmentView.
+        :type raw: str or SegmentView
+        :param sidecar_path: Path to the sidecar HDF file which will be
+            created if it does not exist.
+        :type sidecar_path: str
+        '''
+        if isinstance(raw, six.string_types):
+            raw = hdf_file(raw, read_only=True)
+        # names of other attributes which have been set on the sidecar
+        self._sidecar_attrs = set()
+        self.raw = raw
+        self.sidecar = hdf_file(sidecar_path, create=True)
+        if self.sidecar.duration is None:
+            self.sidecar.duration = self.raw.duration
+        self.file_path = self.raw.file_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('_sidecar_attrs', ()):
+            return getattr(self.__dict__['sidecar'], name)
+        # Delegate anything else to the raw HDF file.
+        return getattr(self.__dict__['raw'], name)
+
+    def __setattr__(self, name, value):
+        if name in self._own_attrs or \
+                isinstance(getattr(type(self), name, None), property):
+            object.__setattr__(self, name, value)
+        else:
+            # The raw HDF file is read-only.
+            setattr(self.sidecar, name, value)
+            self._sidecar_attrs.add(name)
+
+    def __contains__(self, name):
+        return name in self.sidecar or name in self.raw
+
+    def __getitem__(self, name):
+        return self.get_param(name)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def close(self):
+        self.sidecar.close()
+        self.raw.close()
+
+    def keys(self):
+        '''
+        :returns: Sorted names of parameters within both HDF files.
+        :rtype: [str]
+        '''
+        return sorted(set(self.raw.keys()) | set(self.sidecar.keys()))
+
+    def _merge_names(self, raw_names, sidecar_names):
+        '''
+        :returns: Sorted names from the raw HDF file which have not been
+            overridden by the sidecar HDF file and names from the sidecar HDF
+            file.
+        :rtype: [str]
+        '''
+        sidecar_keys = set(self.sidecar.keys())
+        names = set(n for n in raw_names if n not in sidecar_keys)
+        return sorted(names | set(sidecar_names))
+
+    def valid_param_names(self):
+        return self._merge_names(self.raw.valid_param_names(),
+                                 self.sidecar.valid_param_names())
+
+    def valid_lfl_param_names(self):
+        return self._merge_names(self.raw.valid_lfl_param_names(),
+                                 self.sidecar.valid_lfl_param_names())
+
+    def derived_keys(self):
+        return self._merge_names(self.raw.derived_keys(),
+                                 self.sidecar.derived_keys())
+
+    def get_param(self, name, *args, **kwargs):
+        '''
+        Get a parameter from the sidecar HDF file if it exists within it,
+        otherwise from the raw HDF file (see hdf_file.get_param).
+        '''
+        hdf = self.sidecar if name in self.sidecar else self.raw
+        return hdf.get_param(name, *args, **kwargs)
+
+    def get(self, name, default=None):
+        try:
+            return self.get_param(name)
+        except KeyError:
+            return default
+
+    def set_param(self, param, *args, **kwargs):
+        '''
+        Write a parameter to the sidecar HDF file (see hdf_file.set_param).
+        '''
+        return self.sidecar.set_param(param, *args, **kwargs)
+
+    def delete_params(self, names):
+        '''
+        Delete parameters from the sidecar HDF file. The raw HDF file is
+        read-only.
+
+        :type names: [str]
+        '''
+        self.sidecar.delete_params([n for n in names if n in self.sidecar])
+
+    def get_attr(self, name, default=None):
+        value = self.sidecar.get_attr(name)
+        return self.raw.get_attr(name, default) if value is None else value
+
+    def set_attr(self, name, value):
+        self.sidecar.set_attr(name, value)
+
+
+def open_hdf(hdf_path, sidecar_path=None, segment_slice=None):
+    '''
+    Open an HDF file, overlaid with a sidecar HDF file if sidecar_path is
+    provided.
+
+    :type hdf_path: str
+    :type sidecar_path: str or None
+    :param segment_slice: Slice in seconds of a virtual segment of the HDF
+        file to open. Requires sidecar_path for derived parameters.
+    :type segment_slice: slice or None
+    :rtype: hdf_file or HDFOverlay
+    '''
+    if segment_slice is not None:
+        if not sidecar_path:
+            raise ValueError(
+                "A sidecar HDF file is required to process a virtual segment.")
+        return HDFOverlay(SegmentView(hdf_path, segment_slice), sidecar_path)
+    if sidecar_path:
+        return HDFOverlay(hdf_path, sidecar_path)
+    return hdf_file(hdf_path)
@@ -1170,8 +1170,7 @@ class Airspeed35To1000FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                initial_climb=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 35, 1000)
-        alt_climb_sections = valid_slices_within_array(alt_band, initial_climb)
+        alt_climb_sections = alt_aal.slices_within_band(35, 1000, initial_climb)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_climb_sections,
@@ -1190,8 +1189,7 @@ class Airspeed35To1000FtMin(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                initial_climb=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 35, 1000)
-        alt_climb_sections = valid_slices_within_array(alt_band, initial_climb)
+        alt_climb_sections = alt_aal.slices_within_band(35, 1000, initial_climb)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_climb_sections,
@@ -1211,8 +1209,7 @@ class Airspeed1000To5000FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 1000, 5000)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(1000, 5000, climbs)
         self.create_kpvs_within_slices(air_spd.array, alt_climb_sections,
                                        max_value)
 
@@ -1302,8 +1299,7 @@ class Airspeed8000To10000FtMax(KeyPointValueNode):
                alt_std=P('Altitude STD Smoothed'),
                climb=S('Climb')):
 
-        alt_band = np.ma.masked_outside(alt_std.array, 8000, 10000)
-        alt_climb_sections = valid_slices_within_array(alt_band, climb)
+        alt_climb_sections = alt_std.slices_within_band(8000, 10000, climb)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_climb_sections,
@@ -1403,8 +1399,7 @@ class Airspeed10000To8000FtMax(KeyPointValueNode):
                alt_std=P('Altitude STD Smoothed'),
                descent=S('Descent')):
 
-        alt_band = np.ma.masked_outside(alt_std.array, 10000, 8000)
-        alt_descent_sections = valid_slices_within_array(alt_band, descent)
+        alt_descent_sections = alt_std.slices_within_band(10000, 8000, descent)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1448,8 +1443,7 @@ class Airspeed5000To3000FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                descent=S('Descent')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 5000, 3000)
-        alt_descent_sections = valid_slices_within_array(alt_band, descent)
+        alt_descent_sections = alt_aal.slices_within_band(5000, 3000, descent)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1504,8 +1498,7 @@ class Airspeed1000To500FtMax(KeyPointValueNode):
                ac_type=A('Aircraft Type')):
 
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 1000, 500)
-            alt_descent_sections = valid_slices_within_array(alt_band, descending)
+            alt_descent_sections = alt_agl.slices_within_band(1000, 500, descending)
             self.create_kpvs_within_slices(
                 air_spd.array,
                 alt_descent_sections,
@@ -1513,8 +1506,7 @@ class Airspeed1000To500FtMax(KeyPointValueNode):
                 min_duration=HOVER_MIN_DURATION,
                 freq=air_spd.frequency)
         else:
-            alt_band = np.ma.masked_outside(alt_aal.array, 1000, 500)
-            alt_descent_sections = valid_slices_within_array(alt_band, final_app)
+            alt_descent_sections = alt_aal.slices_within_band(1000, 500, final_app)
             self.create_kpvs_within_slices(
                 air_spd.array,
                 alt_descent_sections,
@@ -1533,8 +1525,7 @@ class Airspeed1000To500FtMin(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                final_app=S('Final Approach')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 1000, 500)
-        alt_descent_sections = valid_slices_within_array(alt_band, final_app)
+        alt_descent_sections = alt_aal.slices_within_band(1000, 500, final_app)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1556,8 +1547,7 @@ class Airspeed500To100FtMax(KeyPointValueNode):
                alt_agl=P('Altitude AGL For Flight Phases'),
                descending=S('Descent')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 500, 100)
-        alt_descent_sections = valid_slices_within_array(alt_band, descending)
+        alt_descent_sections = alt_agl.slices_within_band(500, 100, descending)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1581,8 +1571,7 @@ class Airspeed500To100FtMin(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 500, 100)
-        alt_descent_sections = valid_slices_within_array(alt_band, descending)
+        alt_descent_sections = alt_agl.slices_within_band(500, 100, descending)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1606,8 +1595,7 @@ class Airspeed100To20FtMax(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 100, 20)
-        alt_descent_sections = valid_slices_within_array(alt_band, descending)
+        alt_descent_sections = alt_agl.slices_within_band(100, 20, descending)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1631,8 +1619,7 @@ class Airspeed100To20FtMin(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 100, 20)
-        alt_descent_sections = valid_slices_within_array(alt_band, descending)
+        alt_descent_sections = alt_agl.slices_within_band(100, 20, descending)
         self.create_kpvs_within_slices(
             air_spd.array,
             alt_descent_sections,
@@ -1667,8 +1654,7 @@ class Airspeed500To20FtMax(KeyPointValueNode):
                ac_type=A('Aircraft Type')):
 
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 500, 20)
-            alt_descent_sections = valid_slices_within_array(alt_band, descending)
+            alt_descent_sections = alt_agl.slices_within_band(500, 20, descending)
             self.create_kpvs_within_slices(
                 air_spd.array,
                 alt_descent_sections,
@@ -3717,8 +3703,7 @@ class AirspeedSelectedFMCMinusFlapManoeuvreSpeed1000to5000FtMin(KeyPointValueNod
                flap_spd=P('Flap Manoeuvre Speed'),
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Climb')):
-        alt_band = np.ma.masked_outside(alt_aal.array, 1000, 5000)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(1000, 5000, climbs)
         array = spd_sel.array - flap_spd.array
 
         self.create_kpvs_within_slices(array, alt_climb_sections, min_value)
@@ -7324,8 +7309,7 @@ class HeightLoss35To1000Ft(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                init_climb=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 35, 1000)
-        alt_climb_sections = valid_slices_within_array(alt_band, init_climb)
+        alt_climb_sections = alt_aal.slices_within_band(35, 1000, init_climb)
 
         for climb in alt_climb_sections:
             index, value = min_value(ht_loss.array, climb)
@@ -7348,8 +7332,7 @@ class HeightLoss1000To2000Ft(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 1000, 2000)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(1000, 2000, climbs)
 
         for climb in alt_climb_sections:
             index, value = min_value(ht_loss.array, climb)
@@ -12418,8 +12401,7 @@ class HeadingVariation300To50Ft(KeyPointValueNode):
                descending=S('Descending'),
                ac_type=A('Aircraft Type')):
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 50, 300)
-            alt_app_sections = valid_slices_within_array(alt_band, descending)
+            alt_app_sections = alt_agl.slices_within_band(50, 300, descending)
             for band in alt_app_sections:
                 if slice_duration(band, head.frequency) < HOVER_MIN_DURATION:
                     continue
@@ -13939,8 +13921,7 @@ class Pitch35To400FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 35, 400)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(35, 400, climbs)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_climb_sections,
@@ -13960,8 +13941,7 @@ class Pitch35To400FtMin(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 35, 400)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(35, 400, climbs)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_climb_sections,
@@ -13981,8 +13961,7 @@ class Pitch400To1000FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 400, 1000)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(400, 1000, climbs)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_climb_sections,
@@ -14002,8 +13981,7 @@ class Pitch400To1000FtMin(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                climbs=S('Initial Climb')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 400, 1000)
-        alt_climb_sections = valid_slices_within_array(alt_band, climbs)
+        alt_climb_sections = alt_aal.slices_within_band(400, 1000, climbs)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_climb_sections,
@@ -14040,8 +14018,7 @@ class Pitch1000To500FtMax(KeyPointValueNode):
                ac_type=A('Aircraft Type')):
 
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 1000, 500)
-            alt_app_sections = valid_slices_within_array(alt_band, descending)
+            alt_app_sections = alt_agl.slices_within_band(1000, 500, descending)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14049,8 +14026,7 @@ class Pitch1000To500FtMax(KeyPointValueNode):
                 min_duration=HOVER_MIN_DURATION,
                 freq=pitch.frequency)
         else:
-            alt_band = np.ma.masked_outside(alt_aal.array, 1000, 500)
-            alt_app_sections = valid_slices_within_array(alt_band, fin_app)
+            alt_app_sections = alt_aal.slices_within_band(1000, 500, fin_app)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14086,8 +14062,7 @@ class Pitch1000To500FtMin(KeyPointValueNode):
                ac_type=A('Aircraft Type')):
 
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 1000, 500)
-            alt_app_sections = valid_slices_within_array(alt_band, descending)
+            alt_app_sections = alt_agl.slices_within_band(1000, 500, descending)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14095,8 +14070,7 @@ class Pitch1000To500FtMin(KeyPointValueNode):
                 min_duration=HOVER_MIN_DURATION,
                 freq=pitch.frequency)
         else:
-            alt_band = np.ma.masked_outside(alt_aal.array, 1000, 500)
-            alt_app_sections = valid_slices_within_array(alt_band, fin_app)
+            alt_app_sections = alt_aal.slices_within_band(1000, 500, fin_app)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14132,8 +14106,7 @@ class Pitch500To50FtMax(KeyPointValueNode):
                ac_type=A('Aircraft Type')):
 
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 50, 500)
-            alt_app_sections = valid_slices_within_array(alt_band, descending)
+            alt_app_sections = alt_agl.slices_within_band(50, 500, descending)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14141,8 +14114,7 @@ class Pitch500To50FtMax(KeyPointValueNode):
                 min_duration=HOVER_MIN_DURATION,
                 freq=pitch.frequency)
         else:
-            alt_band = np.ma.masked_outside(alt_aal.array, 500, 50)
-            alt_app_sections = valid_slices_within_array(alt_band, fin_app)
+            alt_app_sections = alt_aal.slices_within_band(500, 50, fin_app)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14178,8 +14150,7 @@ class Pitch500To50FtMin(KeyPointValueNode):
                ac_type=A('Aircraft Type')):
 
         if ac_type and ac_type.value == 'helicopter':
-            alt_band = np.ma.masked_outside(alt_agl.array, 50, 500)
-            alt_app_sections = valid_slices_within_array(alt_band, descending)
+            alt_app_sections = alt_agl.slices_within_band(50, 500, descending)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14187,8 +14158,7 @@ class Pitch500To50FtMin(KeyPointValueNode):
                 min_duration=HOVER_MIN_DURATION,
                 freq=pitch.frequency)
         else:
-            alt_band = np.ma.masked_outside(alt_aal.array, 500, 50)
-            alt_app_sections = valid_slices_within_array(alt_band, fin_app)
+            alt_app_sections = alt_aal.slices_within_band(500, 50, fin_app)
             self.create_kpvs_within_slices(
                 pitch.array,
                 alt_app_sections,
@@ -14210,8 +14180,7 @@ class Pitch500To100FtMax(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 100, 500)
-        alt_app_sections = valid_slices_within_array(alt_band, descending)
+        alt_app_sections = alt_agl.slices_within_band(100, 500, descending)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_app_sections,
@@ -14235,8 +14204,7 @@ class Pitch500To100FtMin(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 100, 500)
-        alt_app_sections = valid_slices_within_array(alt_band, descending)
+        alt_app_sections = alt_agl.slices_within_band(100, 500, descending)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_app_sections,
@@ -14314,8 +14282,7 @@ class Pitch100To20FtMax(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 20, 100)
-        alt_app_sections = valid_slices_within_array(alt_band, descending)
+        alt_app_sections = alt_agl.slices_within_band(20, 100, descending)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_app_sections,
@@ -14339,8 +14306,7 @@ class Pitch100To20FtMin(KeyPointValueNode):
                descending=S('Descent'),
                ac_type=A('Aircraft Type')):
 
-        alt_band = np.ma.masked_outside(alt_agl.array, 20, 100)
-        alt_app_sections = valid_slices_within_array(alt_band, descending)
+        alt_app_sections = alt_agl.slices_within_band(20, 100, descending)
         self.create_kpvs_within_slices(
             pitch.array,
             alt_app_sections,
@@ -15025,8 +14991,7 @@ class RateOfDescentBelow10000FtMax(KeyPointValueNode):
                vrt_spd=P('Vertical Speed'),
                alt_std=P('Altitude STD Smoothed'),
                descents=S('Descent')):
-        alt_band = np.ma.masked_outside(alt_std.array, 0, 10000)
-        alt_descent_sections = valid_slices_within_array(alt_band, descents)
+        alt_descent_sections = alt_std.slices_within_band(0, 10000, descents)
         self.create_kpv_from_slices(
             vrt_spd.array,
             alt_descent_sections,
@@ -15047,8 +15012,7 @@ class RateOfDescent10000To5000FtMax(KeyPointValueNode):
                alt_std=P('Altitude STD Smoothed'),
                descent=S('Descent')):
 
-        alt_band = np.ma.masked_outside(alt_std.array, 10000, 5000)
-        alt_descent_sections = valid_slices_within_array(alt_band, descent)
+        alt_descent_sections = alt_std.slices_within_band(10000, 5000, descent)
         self.create_kpvs_within_slices(
             vrt_spd.array,
             alt_descent_sections,
@@ -15557,8 +15521,7 @@ class Roll1000To300FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                fin_app=S('Final Approach')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 1000, 300)
-        alt_app_sections = valid_slices_within_array(alt_band, fin_app)
+        alt_app_sections = alt_aal.slices_within_band(1000, 300, fin_app)
         self.create_kpvs_within_slices(
             roll.array,
             alt_app_sections,
@@ -15578,8 +15541,7 @@ class Roll1000To500FtMax(KeyPointValueNode):
                alt_aal=P('Altitude AAL For Flight Phases'),
                fin_app=S('Final Approach')):
 
-        alt_band = np.ma.masked_outside(alt_aal.array, 1000, 500)
-        alt_app_sections = valid_slices_within_array(alt_band, fin_app)
+        alt_app_sections = alt_aal.slices_within_band(1000, 500, fin_app)
         self.create_kpvs_within_slices(
             roll.array,
             alt_app_sections,
@@ -15615,8 +15577,7 @@ class Roll100To20FtMax(KeyPointValueNode):
     can_operate = helicopter_only
 
     def derive(self, roll=P('Roll'), alt_agl=P('Altitude AGL For Flight Phases'), descending=S('Descent')):
-        alt_band = np.ma.masked_outside(alt_agl.array, 100, 20)
-        alt_app_sections = valid_slices_within_array(alt_band, descending)
+        alt_app_sections = alt_agl.slices_within_band(100, 20, descending)
         self.create_kpvs_within_slices(
             roll.array,
             alt_app_sections,
@@ -14,7 +14,6 @@ from analysis_engine.library import (
     find_toc_tod,
     first_valid_sample,
     hysteresis,
-    index_at_distance,
     index_at_value,
     is_index_within_slice,
     last_valid_sample,
@@ -2106,7 +2105,7 @@ class LastEngFuelFlowStop(KeyTimeInstanceNode):
 class DistanceFromLocationMixin(object):
 
     def calculate(
-            self, datum_lat, datum_lon, lat, lon, distance, direction='forward',
+            self, datum_lat, datum_lon, lat, lon, distances, direction='forward',
             repair_mask_duration=None, _slice=slice(None, None, None)):
         assert direction in ('forward', 'backward'), 'Unsupported direction: "%s"' % direction
 
@@ -2120,19 +2119,21 @@ class DistanceFromLocationMixin(object):
             lat_array = repair_mask(lat_array, repair_duration=repair_mask_duration)
             lon_array = repair_mask(lon_array, repair_duration=repair_mask_duration)
 
-        distances = great_circle_distance__haversine(lat_array, lon_array, [datum_lat], [datum_lon], units=ut.NM)
-        if direction == 'backward':
-            back_slice = slice(_slice.stop, _slice.start, -1)
-            index = index_at_value(distances, distance, back_slice, endpoint='nearest')
-        else:
-            index = index_at_value(distances, distance, _slice)
+        # The distances from the datum are computed once for all thresholds.
+        track = great_circle_distance__haversine(lat_array, lon_array, [datum_lat], [datum_lon], units=ut.NM)
+        for distance in distances:
+            if direction == 'backward':
+                back_slice = slice(_slice.stop, _slice.start, -1)
+                index = index_at_value(track, distance, back_slice, endpoint='nearest')
+            else:
+                index = index_at_value(track, distance, _slice)
 
-        if index:
-            # Check result is valid, as it may be the nearest but not an acceptable solution.
-            error = abs(value_at_index(distances, index) - distance)
-            # Allow 1/20th of a mile to reject wrong runway cases (normally > 1/10th NM apart).
-            if error<0.05:
-                self.create_kti(index, replace_values={'distance': distance})
+            if index:
+                # Check result is valid, as it may be the nearest but not an acceptable solution.
+                error = abs(value_at_index(track, index) - distance)
+                # Allow 1/20th of a mile to reject wrong runway cases (normally > 1/10th NM apart).
+                if error<0.05:
+                    self.create_kti(index, replace_values={'distance': distance})
 
 
 class DistanceFromTakeoffAirport(KeyTimeInstanceNode, DistanceFromLocationMixin):
@@ -2159,11 +2160,10 @@ class DistanceFromTakeoffAirport(KeyTimeInstanceNode, DistanceFromLocationMixin)
 
         apt_lat = apt.value.get('latitude')
         apt_lon = apt.value.get('longitude')
-        for distance in self.NAME_VALUES['distance']:
-            self.calculate(
-                apt_lat, apt_lon, lat, lon, distance,
-                direction='forward', repair_mask_duration=60,
-                _slice=airs[0].slice)
+        self.calculate(
+            apt_lat, apt_lon, lat, lon, self.NAME_VALUES['distance'],
+            direction='forward', repair_mask_duration=60,
+            _slice=airs[0].slice)
 
 
 class DistanceFromLandingAirport(KeyTimeInstanceNode, DistanceFromLocationMixin):
@@ -2192,11 +2192,10 @@ class DistanceFromLandingAirport(KeyTimeInstanceNode, DistanceFromLocationMixin)
 
         apt_lat = apt.value.get('latitude')
         apt_lon = apt.value.get('longitude')
-        for distance in self.NAME_VALUES['distance']:
-            self.calculate(
-                apt_lat, apt_lon, lat, lon, distance,
-                direction='forward', repair_mask_duration=60,
-                _slice=airs[0].slice)
+        self.calculate(
+            apt_lat, apt_lon, lat, lon, self.NAME_VALUES['distance'],
+            direction='forward', repair_mask_duration=60,
+            _slice=airs[0].slice)
 
 
 class DistanceFromThreshold(KeyTimeInstanceNode, DistanceFromLocationMixin):
@@ -2218,8 +2217,8 @@ class DistanceFromThreshold(KeyTimeInstanceNode, DistanceFromLocationMixin):
         if len(airs)!=1:
             return # Only going to handle simple cases for now.
 
-        for distance in self.NAME_VALUES['distance']:
-            self.calculate(
-                rwy.value['start']['latitude'],
-                rwy.value['start']['longitude'],
-                lat, lon, distance, direction='backward', _slice=airs[0].slice)
+        self.calculate(
+            rwy.value['start']['latitude'],
+            rwy.value['start']['longitude'],
+            lat, lon, self.NAME_VALUES['distance'], direction='backward',
+            _slice=airs[0].slice)
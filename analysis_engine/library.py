@@ -4,6 +4,7 @@
 
 from __future__ import print_function
 
+import geomag
 import itertools
 import logging
 import math
@@ -18,7 +19,8 @@ from decimal import Decimal
 from hashlib import sha256
 from math import ceil, copysign, cos, floor, log, radians, sin, sqrt, pow
 from operator import attrgetter
-from scipy import interpolate as scipy_interpolate, optimize
+from scipy import interpolate as scipy_interpolate
+from scipy.linalg import LinAlgError, solveh_banded
 from scipy.ndimage import filters
 from scipy.signal import medfilt
 
@@ -34,6 +36,8 @@ from flightdatautilities.geometry import cross_track_distance, great_circle_dist
 
 from analysis_engine.settings import (
     BUMP_HALF_WIDTH,
+    DECLINATION_CACHE_SIZE,
+    DECLINATION_GRID_LEVELS,
     ILS_CAPTURE,
     ILS_CAPTURE_ROC,
     ILS_ESTABLISHED_DURATION,
@@ -639,6 +643,229 @@ def bearings_and_distances(latitudes, longitudes, reference):
 
     return brg_array, dist_array
 
+
+class WorldMagneticModel(object):
+    '''
+    Vectorised evaluation of the World Magnetic Model used by the geomag
+    package. The Gauss coefficients are loaded from the geomag package once
+    and declination is calculated for whole arrays of positions rather than
+    evaluating the spherical harmonic expansion for each position in turn.
+
+    The declinations of grid points calculated by magnetic_declination are
+    cached in the grid_cache dictionary.
+    '''
+    def __init__(self):
+        self.grid_cache = {}
+        model = geomag.geomag.GeoMag()
+        self.epoch = model.epoch
+        self.maxord = model.maxord
+        self.c = np.array(model.c)
+        self.cd = np.array(model.cd)
+        self.k = np.array(model.k)
+        self.fn = np.array(model.fn)
+        self.fm = np.array(model.fm)
+        self.re = model.re
+        self.a2 = model.a2
+        self.b2 = model.b2
+        self.c2 = model.c2
+        self.a4 = model.a4
+        self.c4 = model.c4
+
+    def declination(self, latitudes, longitudes, altitudes, date):
+        '''
+        Calculate the magnetic declination at each position on a date. The
+        results match geomag.declination for each position.
+
+        :param latitudes: Latitudes in degrees.
+        :type latitudes: np.array
+        :param longitudes: Longitudes in degrees.
+        :type longitudes: np.array
+        :param altitudes: Altitudes in feet.
+        :type altitudes: np.array
+        :param date: Date of the declination.
+        :type date: datetime.date
+        :returns: Declination in degrees.
+        :rtype: np.array
+        '''
+        lat = np.asarray(latitudes, dtype=float)
+        lon = np.asarray(longitudes, dtype=float)
+        alt = np.asarray(altitudes, dtype=float) / 3280.8399
+        time = date.year + ((date - date.replace(month=1, day=1)).days / 365.0)
+        dt = time - self.epoch
+        maxord = self.maxord
+
+        rlat = np.radians(lat)
+        rlon = np.radians(lon)
+        srlat = np.sin(rlat)
+        crlat = np.cos(rlat)
+        srlat2 = srlat * srlat
+        crlat2 = crlat * crlat
+
+        # Convert from geodetic coordinates to spherical coordinates.
+        q = np.sqrt(self.a2 - self.c2 * srlat2)
+        q1 = alt * q
+        q2 = ((q1 + self.a2) / (q1 + self.b2)) ** 2
+        ct = srlat / np.sqrt(q2 * crlat2 + srlat2)
+        st = np.sqrt(1.0 - (ct * ct))
+        r2 = (alt * alt) + 2.0 * q1 + (self.a4 - self.c4 * srlat2) / (q * q)
+        r = np.sqrt(r2)
+        d = np.sqrt(self.a2 * crlat2 + self.b2 * srlat2)
+        ca = (alt + d) / r
+        sa = self.c2 * crlat * srlat / (r * d)
+
+        sp = [np.zeros_like(lat), np.sin(rlon)]
+        cp = [np.ones_like(lat), np.cos(rlon)]
+        for m in range(2, maxord + 1):
+            sp.append(sp[1] * cp[m - 1] + cp[1] * sp[m - 1])
+            cp.append(cp[1] * cp[m - 1] - sp[1] * sp[m - 1])
+
+        # Time adjust the Gauss coefficients.
+        tc = self.c + dt * self.cd
+
+        zeros = np.zeros_like(lat)
+        p = {(0, 0): np.ones_like(lat)}
+        dp = {(0, 0): zeros}
+        pp = [np.ones_like(lat)]
+        aor = self.re / r
+        ar = aor * aor
+        br = np.zeros_like(lat)
+        bt = np.zeros_like(lat)
+        bp = np.zeros_like(lat)
+        bpp = np.zeros_like(lat)
+        for n in range(1, maxord + 1):
+            ar = ar * aor
+            for m in range(n + 1):
+                # Compute unnormalised associated Legendre polynomials and
+                # derivatives via recursion relations.
+                if n == m:
+                    p[m, n] = st * p[m - 1, n - 1]
+                    dp[m, n] = st * dp[m - 1, n - 1] + ct * p[m - 1, n - 1]
+                elif n == 1 and m == 0:
+                    p[m, n] = ct * p[m, n - 1]
+                    dp[m, n] = ct * dp[m, n - 1] - st * p[m, n - 1]
+                else:
+                    p_2 = p.get((m, n - 2), zeros) if m <= n - 2 else zeros
+                    dp_2 = dp.get((m, n - 2), zeros) if m <= n - 2 else zeros
+                    p[m, n] = ct * p[m, n - 1] - self.k[m][n] * p_2
+                    dp[m, n] = ct * dp[m, n - 1] - st * p[m, n - 1] - \
+                        self.k[m][n] * dp_2
+
+                # Accumulate terms of the spherical harmonic expansions.
+                par = ar * p[m, n]
+                if m == 0:
+                    temp1 = tc[m][n] * cp[m]
+                    temp2 = tc[m][n] * sp[m]
+                else:
+                    temp1 = tc[m][n] * cp[m] + tc[n][m - 1] * sp[m]
+                    temp2 = tc[m][n] * sp[m] - tc[n][m - 1] * cp[m]
+                bt = bt - ar * temp1 * dp[m, n]
+                bp = bp + (self.fm[m] * temp2 * par)
+                br = br + (self.fn[n] * temp1 * par)
+
+                # Special case: north/south geographic poles.
+                if m == 1:
+                    if n == 1:
+                        pp.append(pp[n - 1])
+                    else:
+                        pp.append(ct * pp[n - 1] - self.k[m][n] * pp[n - 2])
+                    bpp = bpp + (self.fm[m] * temp2 * ar * pp[n])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bp = np.where(st == 0.0, bpp, bp / st)
+
+        # Rotate magnetic vector components from spherical to geodetic
+        # coordinates.
+        bx = -bt * ca - br * sa
+        by = bp
+        return np.degrees(np.arctan2(by, bx))
+
+
+_world_magnetic_model = None
+
+
+def magnetic_declination(latitudes, longitudes, altitudes, date,
+                         resolution=None):
+    '''
+    Calculate the magnetic declination at each position on a date using the
+    World Magnetic Model, which is loaded once per process.
+
+    If resolution is provided, positions are rounded to the resolution and
+    the declination of each grid point is calculated once and cached within
+    the process. Declination changes more rapidly with longitude towards the
+    poles, so the latitude and longitude resolution is halved each time the
+    cosine of the latitude halves, up to DECLINATION_GRID_LEVELS times. This
+    keeps the error of a 0.1 degree grid below about 0.6 degrees at any
+    latitude, except in the vicinity of the magnetic poles where declination
+    is undefined and any grid may be in error by tens of degrees.
+
+    Usage:
+
+    mag_var = magnetic_declination(lat.array, lon.array, alt.array, date)
+
+    :param latitudes: Latitudes in degrees.
+    :type latitudes: np.ma.array
+    :param longitudes: Longitudes in degrees.
+    :type longitudes: np.ma.array
+    :param altitudes: Altitudes in feet.
+    :type altitudes: np.ma.array
+    :param date: Date of the declination.
+    :type date: datetime.date
+    :param resolution: Resolution in degrees of latitude and longitude and
+        in feet of altitude of the cached grid, e.g. (0.1, 0.1, 1000).
+    :type resolution: (float, float, float) or None
+    :returns: Declination in degrees masked where any input is masked.
+    :rtype: np.ma.array
+    '''
+    global _world_magnetic_model
+    if _world_magnetic_model is None:
+        _world_magnetic_model = WorldMagneticModel()
+    latitudes = np.ma.asarray(latitudes, dtype=float)
+    longitudes = np.ma.asarray(longitudes, dtype=float)
+    altitudes = np.ma.asarray(altitudes, dtype=float)
+    mask = np.ma.getmaskarray(latitudes) | np.ma.getmaskarray(longitudes) | \
+        np.ma.getmaskarray(altitudes)
+    result = np_ma_masked_zeros(len(mask))
+    valid = ~mask
+    if not valid.any():
+        return result
+    lat = latitudes.data[valid]
+    lon = longitudes.data[valid]
+    alt = altitudes.data[valid]
+
+    if resolution is None:
+        result[valid] = _world_magnetic_model.declination(lat, lon, alt, date)
+        return result
+
+    # Number of times the latitude and longitude resolution is halved.
+    cosine = np.maximum(np.cos(np.radians(lat)),
+                        2.0 ** -DECLINATION_GRID_LEVELS)
+    levels = np.clip(np.floor(-np.log2(cosine)), 0, DECLINATION_GRID_LEVELS)
+    scale = 2.0 ** -levels
+    grid = np.column_stack((levels,
+                            np.round(lat / (resolution[0] * scale)),
+                            np.round(lon / (resolution[1] * scale)),
+                            np.round(alt / resolution[2])))
+    points, inverse = np.unique(grid, axis=0, return_inverse=True)
+    # grid points of different resolutions are distinct positions
+    keys = [(date, tuple(resolution)) + tuple(point)
+            for point in points.tolist()]
+    cache = _world_magnetic_model.grid_cache
+    values = np.array([cache.get(key, np.nan) for key in keys])
+    missing = np.isnan(values)
+    if missing.any():
+        scale = 2.0 ** -points[missing, 0]
+        values[missing] = _world_magnetic_model.declination(
+            points[missing, 1] * resolution[0] * scale,
+            points[missing, 2] * resolution[1] * scale,
+            points[missing, 3] * resolution[2], date)
+        if len(cache) > DECLINATION_CACHE_SIZE:
+            cache.clear()
+        cache.update(
+            (key, value) for key, value, is_missing
+            in zip(keys, values.tolist(), missing) if is_missing)
+    result[valid] = values[np.ravel(inverse)]
+    return result
+
 """
 Landing stopping distances.
 
@@ -1102,24 +1329,20 @@ def cycle_counter(array, min_step, max_time, hz, offset=0):
     if idxs is None:
         return Value(None, None)
 
-    index, half_cycles = None, 0
-    max_index, max_half_cycles = None, 0
-
-    # Determine the half cycle times and look for the most cycling:
+    # Determine the half cycle times and the runs of half cycles within the
+    # max time:
     half_cycle_times = np.ediff1d(idxs) / hz
-    for n, half_cycle_time in enumerate(half_cycle_times):
-        # If we are within the max time, keep track of the half cycle:
-        if half_cycle_time < max_time:
-            half_cycles += 1
-            index = idxs[n + 1]
-        # Otherwise check if this is the most cycling and reset:
-        elif 0 < half_cycles >= max_half_cycles:
-            max_index, max_half_cycles = index, half_cycles
+    starts, stops = _runs_of_ones_bounds(half_cycle_times < max_time)
+
+    # Look for the most cycling. A run with fewer half cycles than the most
+    # cycling so far is counted together with the following run:
+    half_cycles = 0
+    max_index, max_half_cycles = None, 0
+    for stop, count in zip(stops, (stops - starts).tolist()):
+        half_cycles += count
+        if half_cycles >= max_half_cycles:
+            max_index, max_half_cycles = idxs[stop], half_cycles
             half_cycles = 0
-    else:
-        # Finally check whether the last loop had most cycling:
-        if 0 < half_cycles >= max_half_cycles:
-            max_index, max_half_cycles = index, half_cycles
 
     # Ignore single direction movements (we only want full cycles):
     if max_half_cycles < 2:
@@ -1233,7 +1456,53 @@ def cycle_finder(array, min_step=0.0, include_ends=True):
 
     # This section progressively removes reversals smaller than the step size of
     # interest, hence the arrays shrink until just the desired answer is left.
+    return _remove_small_reversals(idxs, vals, min_step)
+
+
+def _remove_small_reversals(idxs, vals, min_step):
+    '''
+    Progressively removes the smallest reversal between turning points until
+    no reversal is smaller than min_step.
+
+    While the reversals alternate in direction, merging a reversal with its
+    neighbours only makes the merged reversal larger, so every reversal which
+    is smaller than those within two turning points of it would be removed in
+    turn, and all such reversals are removed together. Otherwise the smallest
+    reversal is removed one at a time.
+
+    :param idxs: Indexes of the turning points.
+    :type idxs: np.array
+    :param vals: Values at the turning points.
+    :type vals: np.array
+    :param min_step: Minimum step, below which fluctuations will be removed.
+    :type min_step: float
+    :returns: A tuple containing the remaining turning point indexes and
+        values.
+    :rtype: (np.array, np.array)
+    '''
     dvals = np.ediff1d(vals)
+    while len(dvals) > 0 and np.min(abs(dvals)) < min_step and \
+            np.all(dvals[1:] * dvals[:-1] < 0):
+        size = len(dvals)
+        abs_dvals = abs(dvals)
+        padded = np.concatenate(([np.inf] * 2, abs_dvals, [np.inf] * 2))
+        # Where reversals are equal, the first is the smallest.
+        smallest = np.flatnonzero(
+            (abs_dvals < min_step) &
+            (abs_dvals < padded[:size]) & (abs_dvals < padded[1:size + 1]) &
+            (abs_dvals <= padded[3:size + 3]) & (abs_dvals <= padded[4:]))
+        keep_vals = np.ones(size + 1, dtype=bool)
+        keep_dvals = np.ones(size, dtype=bool)
+        if smallest[0] == 0:
+            keep_vals[0] = keep_dvals[0] = False
+        if smallest[-1] == size - 1 and size > 1:
+            keep_vals[size] = keep_dvals[size - 1] = False
+        merged = smallest[(smallest > 0) & (smallest < size - 1)]
+        dvals[merged - 1] += dvals[merged] + dvals[merged + 1]
+        keep_vals[merged] = keep_vals[merged + 1] = False
+        keep_dvals[merged] = keep_dvals[merged + 1] = False
+        idxs, vals, dvals = idxs[keep_vals], vals[keep_vals], dvals[keep_dvals]
+
     while len(dvals) > 0 and np.min(abs(dvals)) < min_step:
         sort_idx = np.argmin(abs(dvals))
         last = len(dvals)
@@ -1250,12 +1519,7 @@ def cycle_finder(array, min_step=0.0, include_ends=True):
             vals = np.delete(vals, slice(sort_idx, sort_idx + 2))
             dvals[sort_idx - 1] += dvals[sort_idx] + dvals[sort_idx + 1]
             dvals = np.delete(dvals, slice(sort_idx, sort_idx + 2))
-    if len(dvals) == 0:
-        # All the changes have disappeared, so return the
-        # single array peak index and value.
-        return idxs, vals
-    else:
-        return idxs, vals
+    return idxs, vals
 
 
 def cycle_match(idx, cycle_idxs, dist=None):
@@ -2042,52 +2306,50 @@ def find_edges_on_state_change(state, array, change='entering', phase=None, min_
     :raises: ValueError if change not recognised
     :raises: KeyError if state not recognised
     '''
-    def state_changes(state, array, change, _slice=slice(0, -1), min_samples=1):
-        '''
-        min_samples of 3 means 3 or more samples must be in the state for it to be returned.
-        '''
-        length = len(array[_slice])
-        # The offset allows for phase slices and puts the transition midway
-        # between the two conditions as this is the most probable time that
-        # the change took place.
-        offset = _slice.start - 0.5
-        state_periods = runs_of_ones(array[_slice] == state)
-        # ignore small periods where slice is in state, then remove small
-        # gaps where slices are not in state
-        # we are taking 1 away from min_samples here as
-        # slices_remove_small_slices removes slices of less than count
-        state_periods = slices_remove_small_slices(state_periods, count=min_samples - 1)
-        state_periods = slices_remove_small_gaps(state_periods, count=min_samples)
-        edge_list = []
-        for period in state_periods:
-            if change == 'entering':
-                if period.start > 0:
-                    edge_list.append(period.start + offset)
-
-            elif change == 'leaving':
-                if period.stop < length:
-                    edge_list.append(period.stop + offset)
-
-            elif change == 'entering_and_leaving':
-                if period.start > 0:
-                    edge_list.append(period.start + offset)
-                if period.stop < length:
-                    edge_list.append(period.stop + offset)
-            else:
-                raise  ValueError("Change '%s'in find_edges_on_state_change not recognised" % change)
-
-        return edge_list
+    if change not in ('entering', 'leaving', 'entering_and_leaving'):
+        raise ValueError("Change '%s'in find_edges_on_state_change not recognised" % change)
 
     if phase is None:
-        return state_changes(state, array, change, min_samples=min_samples)
-
-    edge_list = []
-    for period in phase:
-        period = getattr(period, 'slice', period)
-        edges = state_changes(state, array, change, _slice=period,
-                              min_samples=min_samples)
-        edge_list.extend(edges)
-    return edge_list
+        slices = [slice(0, -1)]
+    else:
+        slices = [getattr(period, 'slice', period) for period in phase]
+
+    # The runs in state within all phases are found from a single run length
+    # encoding of the whole array.
+    slice_numbers, starts, stops = runs_of_ones_within_slices(
+        array == state, slices)
+    # ignore small periods where slice is in state, then remove small
+    # gaps where slices are not in state
+    # we are taking 1 away from min_samples here as
+    # slices_remove_small_slices removes slices of less than count
+    keep = stops - starts > min_samples - 1
+    slice_numbers, starts, stops = \
+        slice_numbers[keep], starts[keep], stops[keep]
+    if not len(starts):
+        return []
+    joined = (slice_numbers[1:] == slice_numbers[:-1]) & \
+        (starts[1:] - stops[:-1] < min_samples)
+    periods = np.flatnonzero(~np.concatenate(([False], joined)))
+    slice_numbers = slice_numbers[periods]
+    starts = starts[periods]
+    stops = stops[np.flatnonzero(~np.concatenate((joined, [False])))]
+
+    bounds = [slice_bounds(_slice, len(array)) for _slice in slices]
+    lengths = np.array([stop - start for start, stop in bounds],
+                       dtype=np.intp)[slice_numbers]
+    # The offset allows for phase slices and puts the transition midway
+    # between the two conditions as this is the most probable time that
+    # the change took place.
+    offsets = np.array([(_slice.start or 0) - 0.5 for _slice in slices],
+                       dtype=float)[slice_numbers]
+    edges = np.ma.masked_all((len(starts), 2))
+    if change in ('entering', 'entering_and_leaving'):
+        entering = starts > 0
+        edges[entering, 0] = starts[entering] + offsets[entering]
+    if change in ('leaving', 'entering_and_leaving'):
+        leaving = stops < lengths
+        edges[leaving, 1] = stops[leaving] + offsets[leaving]
+    return edges.compressed().tolist()
 
 
 def first_valid_parameter(*parameters, **kwargs):
@@ -2834,6 +3096,7 @@ def ground_track_precise(lat, lon, speed, hdg, frequency):
 
     hdg_hyst_chg = np.ma.ediff1d(hysteresis(hdg, 10.0))
     all_straights = np.ma.clump_unmasked(np.ma.masked_not_equal(hdg_hyst_chg, 0.0))
+    all_track_straights = []
 
     for track_slice in track_slices:
         straights = slices_remove_small_slices(slices_and(all_straights, [track_slice]))
@@ -2843,12 +3106,7 @@ def ground_track_precise(lat, lon, speed, hdg, frequency):
             count=1,
         )
 
-        for straight in straights:
-            # We compute an average ground track from heading and groundspeed.
-            # This is computed in each direction, then blended progressively so that it meets the
-            # endpoints exactly thereby cancelling out the errors in integrating the ground track.
-            lat_model[straight], lon_model[straight] = av_gnd_trk(lat[straight], lon[straight], speed[straight], hdg[straight], frequency)
-            # plt.plot(lon_model[straight], lat_model[straight], 'o-b')
+        all_track_straights.extend(straights)
 
         for curve in curves:
             # If this has to match the ILS track we need to blend it in nicely.
@@ -2861,6 +3119,14 @@ def ground_track_precise(lat, lon, speed, hdg, frequency):
                 lon_model[curve] = lon[curve]
             # plt.plot(lon_model[curve], lat_model[curve], 'o-r')
 
+    # We compute an average ground track from heading and groundspeed.
+    # This is computed in each direction, then blended progressively so that it meets the
+    # endpoints exactly thereby cancelling out the errors in integrating the ground track.
+    # The tracks of all the straights are integrated together.
+    av_gnd_trks(lat, lon, speed, hdg, frequency, all_track_straights,
+                lat_model, lon_model)
+    # plt.plot(lon_model, lat_model, 'o-b')
+
     # plt.show()
     # We have computed the straight and curved moving sections. Where the aircraft was barely moving,
     # we leave it stationary at the point where the last movement stopped.
@@ -2896,15 +3162,120 @@ def av_gnd_trk(lat, lon, gspd, hdg, hz):
     return my_lat, my_lon
 
 
+def av_gnd_trks(lat, lon, gspd, hdg, hz, slices, lat_track, lon_track):
+    '''
+    Computation of the average ground track of av_gnd_trk within each of the
+    slices, storing the tracks within lat_track and lon_track.
+
+    Where the groundspeed and heading are valid within a slice and the
+    latitude and longitude are valid at its ends, the slices are integrated
+    together with one cumulative sum over all the slices. Other slices are
+    computed by av_gnd_trk one at a time.
+
+    Helper function for ground_track_precise.
+
+    :param lat: Latitude for the duration of the ground track.
+    :type lat: np.ma.masked_array
+    :param lon: Longitude for the duration of the ground track.
+    :type lon: np.ma.masked_array
+    :param gspd: Groundspeed in knots.
+    :type gspd: np.ma.masked_array
+    :param hdg: True heading in degrees.
+    :type hdg: np.ma.masked_array
+    :param hz: Frequency of the array data.
+    :type hz: float
+    :param slices: Slices of at least two samples to compute tracks within.
+    :type slices: [slice]
+    :param lat_track: Latitude of the computed ground track.
+    :type lat_track: np.ma.masked_array
+    :param lon_track: Longitude of the computed ground track.
+    :type lon_track: np.ma.masked_array
+    '''
+    invalid = np.ma.getmaskarray(gspd) | np.ma.getmaskarray(hdg)
+    ends_invalid = np.ma.getmaskarray(lat) | np.ma.getmaskarray(lon)
+    batched = []
+    for _slice in slices:
+        if invalid[_slice].any() or ends_invalid[_slice.start] or \
+           ends_invalid[_slice.stop - 1]:
+            lat_track[_slice], lon_track[_slice] = av_gnd_trk(
+                lat[_slice], lon[_slice], gspd[_slice], hdg[_slice], hz)
+        else:
+            batched.append(_slice)
+    if not batched:
+        return
+
+    starts = np.array([s.start for s in batched], dtype=np.intp)
+    lengths = np.array([s.stop for s in batched], dtype=np.intp) - starts
+    # Concatenate the samples of the slices, keeping the position of each
+    # sample within its slice and the position of each slice's first sample.
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+    indices = positions + np.repeat(starts, lengths)
+    firsts = np.repeat(offsets, lengths)
+    lasts = firsts + np.repeat(lengths, lengths) - 1
+
+    hdg_rad = np.ma.getdata(hdg)[indices] * deg2rad
+    speed = np.ma.getdata(gspd)[indices]
+    k = (ut.multiplier(ut.KT, ut.METER_S) * 0.5) / hz
+    tracks = []
+    for delta in (speed * np.cos(hdg_rad), speed * np.sin(hdg_rad)):
+        # Trapezoidal integration forwards from the first sample of each
+        # slice. Integration backwards from the last sample is the
+        # difference from the integral to the last sample.
+        to_int = np.zeros_like(delta)
+        to_int[1:] = k * (delta[1:] + delta[:-1])
+        to_int[offsets] = 0.0
+        integral = np.cumsum(to_int)
+        forwards = integral - integral[firsts]
+        tracks.append((forwards, forwards - forwards[lasts]))
+    (north_fwd, north_bwd), (east_fwd, east_bwd) = tracks
+
+    # Blend the track from the first sample forwards into the track from
+    # the last sample backwards as av_gnd_trk does.
+    steps = -1.0 / np.repeat(lengths - 1, lengths)
+    scale = positions * steps + 1.0
+    scale[lasts] = 0.0
+    lat_av = np.zeros(len(indices))
+    lon_av = np.zeros(len(indices))
+    for north, east, refs, weight in ((north_fwd, east_fwd, firsts, scale),
+                                      (north_bwd, east_bwd, lasts,
+                                       1.0 - scale)):
+        # latitudes_and_longitudes with a reference point for each sample.
+        lat_ref = np.radians(np.ma.getdata(lat)[indices[refs]])
+        lon_ref = np.radians(np.ma.getdata(lon)[indices[refs]])
+        brg = np.rad2deg(np.arctan2(east, north)) * deg2rad
+        dist = np.sqrt(north ** 2 + east ** 2) / 6371000.0
+        lat_gt = np.arcsin(np.sin(lat_ref) * np.cos(dist) +
+                           np.cos(lat_ref) * np.sin(dist) * np.cos(brg))
+        lon_gt = np.arctan2(np.sin(brg) * np.sin(dist) * np.cos(lat_ref),
+                            np.cos(dist) - np.sin(lat_ref) * np.sin(lat_gt))
+        lon_gt += lon_ref
+        lat_av += np.rad2deg(lat_gt) * weight
+        lon_av += np.rad2deg(lon_gt) * weight
+    lat_track[indices] = lat_av
+    lon_track[indices] = lon_av
+
+
 def hash_array(array, sections, min_samples):
     '''
-    Creates a sha256 hash from the array's tostring() method .
+    Creates a sha256 hash from the array's buffer.
+
+    The hash is updated from views of the array's buffer rather than copies
+    of each section. For masked arrays, the data buffer is hashed followed by
+    the mask buffer of sections which contain masked values, so sections
+    without masked values hash the same as an unmasked array.
     '''
     checksum = sha256()
+    data = np.ma.getdata(array)
+    mask = np.ma.getmask(array)
     for section in sections:
         if section.stop - section.start < min_samples:
             continue
-        checksum.update(array[section].tostring())
+        checksum.update(np.ascontiguousarray(data[section]))
+        if mask is not np.ma.nomask:
+            section_mask = mask[section]
+            if section_mask.any():
+                checksum.update(np.ascontiguousarray(section_mask))
 
     return checksum.hexdigest()
 
@@ -5819,6 +6190,60 @@ def runs_of_ones(bits, min_samples=None):
     return runs
 
 
+def _runs_of_ones_bounds(bits):
+    '''
+    Run length encoding of an array of boolean values.
+
+    :param bits: Array of boolean values without a mask.
+    :type bits: np.array
+    :returns: The start and stop index of each run of ones.
+    :rtype: (np.array, np.array)
+    '''
+    # Bound the runs of ones so that each has a start and a stop.
+    edges = np.diff(np.concatenate(([0], np.asarray(bits, dtype=np.int8),
+                                    [0])))
+    return np.flatnonzero(edges > 0), np.flatnonzero(edges < 0)
+
+
+def runs_of_ones_within_slices(bits, slices):
+    '''
+    Finds the runs of ones within each of the slices with a single run length
+    encoding of the whole array rather than calling runs_of_ones for each
+    slice. Masked samples are not part of a run.
+
+    Example: runs_of_ones_within_slices([0,1,1,1,0,1], [slice(2, 6)])
+        -> (array([0, 0]), array([0, 3]), array([2, 4]))
+
+    :param bits: Array of boolean values.
+    :type bits: np.ma.masked_array or np.array
+    :param slices: Slices to find runs within.
+    :type slices: list of slice
+    :returns: The number of the slice containing each run and the start and
+        stop of each run relative to the start of the slice, as runs_of_ones
+        would return for bits[slice].
+    :rtype: (np.array, np.array, np.array)
+    '''
+    ones = np.ma.getdata(bits) == 1
+    ones &= ~np.ma.getmaskarray(bits)
+    run_starts, run_stops = _runs_of_ones_bounds(ones)
+
+    bounds = np.array([slice_bounds(_slice, len(ones)) for _slice in slices],
+                      dtype=np.intp).reshape(-1, 2)
+    starts, stops = bounds[:, 0], bounds[:, 1]
+    # The runs overlapping each slice are those stopping after the start of
+    # the slice and starting before the stop of the slice.
+    first = np.searchsorted(run_stops, starts, side='right')
+    counts = np.where(stops > starts,
+                      np.searchsorted(run_starts, stops) - first, 0)
+    slice_numbers = np.repeat(np.arange(len(slices)), counts)
+    runs = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts -
+                                               first, counts)
+    slice_starts = starts[slice_numbers]
+    return (slice_numbers,
+            np.maximum(run_starts[runs], slice_starts) - slice_starts,
+            np.minimum(run_stops[runs], stops[slice_numbers]) - slice_starts)
+
+
 def slices_of_runs(array, min_samples=None):
     '''
     Provides a list of slices of runs of each value in the array.
@@ -5890,6 +6315,27 @@ def shift_slices(slicelist, offset):
         return slicelist
 
 
+def slice_bounds(_slice, size):
+    '''
+    The start and stop indices of a slice applied to an array of size
+    samples. Fractional slice bounds are truncated.
+
+    :param _slice: Slice to apply.
+    :type _slice: slice
+    :param size: Size of the array.
+    :type size: int
+    :returns: Start and stop index where start <= stop.
+    :rtype: (int, int)
+    :raises ValueError: If the slice has a step.
+    '''
+    if _slice.step not in (None, 1):
+        raise ValueError("Slice step not supported")
+    start, stop, _ = slice(
+        None if _slice.start is None else int(_slice.start),
+        None if _slice.stop is None else int(_slice.stop)).indices(size)
+    return start, max(start, stop)
+
+
 def slice_duration(_slice, hz):
     '''
     Gets the duration of a slice in taking the frequency into account. While
@@ -6927,6 +7373,23 @@ def track_linking(pos, local_pos):
     return local_pos
 
 
+def smooth_track_weight(ac_type, hz):
+    '''
+    Weight of the errors from a straight line relative to the errors from the
+    recorded data used by smooth_track_cost_function.
+    '''
+    if ac_type and ac_type.value=='helicopter':
+        return 100 # As helicopters fly more slowly so we don't need such smoothing.
+    elif hz == 1.0:
+        return 1000
+    elif hz == 0.5:
+        return 300
+    elif hz == 0.25:
+        return 100
+    else:
+        raise ValueError('Lat/Lon sample rate not recognised in smooth_track_cost_function.')
+
+
 def smooth_track_cost_function(lat_s, lon_s, lat, lon, ac_type, hz):
     # Summing the errors from the recorded data is easy.
     from_data = np.sum((lat_s - lat)**2)+np.sum((lon_s - lon)**2)
@@ -6936,16 +7399,7 @@ def smooth_track_cost_function(lat_s, lon_s, lat, lon, ac_type, hz):
     from_straight = np.sum(np.convolve(lat_s,slider,'valid')**2) + \
         np.sum(np.convolve(lon_s,slider,'valid')**2)
 
-    if ac_type and ac_type.value=='helicopter':
-        weight = 100 # As helicopters fly more slowly so we don't need such smoothing.
-    elif hz == 1.0:
-        weight = 1000
-    elif hz == 0.5:
-        weight = 300
-    elif hz == 0.25:
-        weight = 100
-    else:
-        raise ValueError('Lat/Lon sample rate not recognised in smooth_track_cost_function.')
+    weight = smooth_track_weight(ac_type, hz)
 
     cost = from_data + weight*from_straight
     return cost
@@ -7007,23 +7461,40 @@ def smooth_signal(array, window_len=11, window='hanning'):
     return np.ma.MaskedArray(out[extra_start:-(extra-extra_start)], array.mask)
 
 
-def smooth_track(lat, lon, ac_type, hz):
-    """
-    Input:
-    lat = Recorded latitude array
-    lon = Recorded longitude array
-    ac_type = aircraft type (aeroplane or helicopter)
-    hz = sample rate
-
-    Returns:
-    lat_last = Optimised latitude array
-    lon_last = optimised longitude array
-    Cost = cost function, used for testing satisfactory convergence.
-    """
+def _smooth_track_solve(array, weight):
+    '''
+    Minimise the smooth_track_cost_function terms of a single coordinate,
+    sum((x - array)**2) + weight * sum(second_difference(x)**2), keeping the
+    first and last two samples unchanged as smooth_track always has.
+
+    Setting the gradient with respect to the middle samples to zero gives
+    the symmetric positive definite pentadiagonal system
+    (I + weight * D'D) x = array - weight * D'D ends, where D is the second
+    difference operator restricted to the middle samples.
+    '''
+    slider = np.array([1.0, -2.0, 1.0])
+    size = len(array) - 4
+    ends = np.zeros(len(array))
+    ends[:2] = array[:2]
+    ends[-2:] = array[-2:]
+    # D'D applied to the fixed samples.
+    coupling = np.convolve(np.convolve(ends, slider, 'valid'), slider, 'full')
+    rhs = array[2:-2] - weight * coupling[2:-2]
+    # Upper form of the banded matrix for solveh_banded.
+    banded = np.zeros((3, size))
+    banded[0, 2:] = weight
+    banded[1, 1:] = -4.0 * weight
+    banded[2, :] = 1.0 + 6.0 * weight
+    result = np.array(array, dtype=float)
+    result[2:-2] = solveh_banded(banded, rhs)
+    return result
 
-    if len(lat) <= 5:
-        return lat, lon, 0.0 # Polite return of data too short to smooth.
 
+def _smooth_track_iterative(lat, lon, ac_type, hz):
+    '''
+    Iterative solution of smooth_track, retained in case the direct solution
+    fails.
+    '''
     lat_s = np.ma.copy(lat)
     lon_s = np.ma.copy(lon)
 
@@ -7047,10 +7518,48 @@ def smooth_track(lat, lon, ac_type, hz):
         cost_0 = cost
         cost = smooth_track_cost_function(lat_s, lon_s, lat, lon, ac_type, hz)
 
+    return lat_last, lon_last, cost_0
+
+
+def smooth_track(lat, lon, ac_type, hz):
+    """
+    Input:
+    lat = Recorded latitude array
+    lon = Recorded longitude array
+    ac_type = aircraft type (aeroplane or helicopter)
+    hz = sample rate
+
+    Returns:
+    lat_last = Optimised latitude array
+    lon_last = optimised longitude array
+    Cost = cost function, used for testing satisfactory convergence.
+
+    The track minimising smooth_track_cost_function, with the first and last
+    two samples unchanged, is solved directly as a banded linear system for
+    each coordinate. Should the solution fail, the cost function is
+    minimised iteratively by repeatedly applying a sliding average.
+    """
+
+    if len(lat) <= 5:
+        return lat, lon, 0.0 # Polite return of data too short to smooth.
+
+    weight = smooth_track_weight(ac_type, hz)
+    try:
+        lat_s = np.ma.array(_smooth_track_solve(np.ma.getdata(lat), weight),
+                            mask=np.ma.getmaskarray(lat).copy())
+        lon_s = np.ma.array(_smooth_track_solve(np.ma.getdata(lon), weight),
+                            mask=np.ma.getmaskarray(lon).copy())
+        cost = smooth_track_cost_function(lat_s, lon_s, lat, lon, ac_type, hz)
+        if not np.isfinite(cost):
+            raise LinAlgError('Smooth Track solution is not finite.')
+    except (LinAlgError, ValueError) as err:
+        logger.warning("Smooth Track direct solution failed (%s); iterating.", err)
+        lat_s, lon_s, cost = _smooth_track_iterative(lat, lon, ac_type, hz)
+
     if cost>0.1:
         logger.warn("Smooth Track Cost Function closed with cost %f.3",cost)
 
-    return lat_last, lon_last, cost_0
+    return lat_s, lon_s, cost
 
 def straighten_altitudes(fine_array, coarse_array, limit, copy=False):
     '''
@@ -7238,7 +7747,10 @@ def index_at_distance(distance, index_ref, latitude_ref, longitude_ref, latitude
     This routine computes the index into arrays latitude and longitude that
     is a specified distance from the reference point.
 
-    :param distance: Distance from the reference point required.
+    :param distance: Distance from the reference point required. The sign
+        only indicates whether the index is expected to be after (positive)
+        or before (negative) index_ref; the crossing of abs(distance)
+        nearest to the expected index is returned.
     :type distance: int, units nautical miles
     :param index_ref: Index into the latitude and longitude arrays at reference point
     :type index_ref: int. Note: This is only a help to speed the algorithm; accuracy is not important.
@@ -7253,81 +7765,77 @@ def index_at_distance(distance, index_ref, latitude_ref, longitude_ref, latitude
     :param hz: Sample rate of latitude and longitude arrays
     :type hz: float
 
-    :returns: Index into the latitude and longitude arrays
-    :rtype: float
-    :raises: ValueError
+    :returns: Index into the latitude and longitude arrays or None if the
+        track does not reach the distance within the data, excluding the
+        last 60 samples of valid latitude.
+    :rtype: float or None
     '''
+    return index_at_distances([distance], index_ref, latitude_ref,
+                              longitude_ref, latitude, longitude, hz)[0]
 
-    def distance_error(index, *args):
-        radius = args[0]
-        latitude_ref = args[1]
-        longitude_ref = args[2]
-        latitude = args[3]
-        longitude = args[4]
-        index_ref = args[5]
-
-        rad = distance_at_index(index[0], latitude, longitude, latitude_ref, longitude_ref)
-        # and simply squaring the error allows robust minimum searching.
-        error = (rad - radius) ** 2.0
-        return error
-
-    # It is natural to hold the distance as an integer, but locally we need a float
-    _distance = float(distance)
-
-    # We start by guessing an index based on some sample results.
-    #   the distance estimate
-    abs_d = abs(_distance)
-    if abs_d < 10:
-        # Flown at low speed; about a minute for the last two miles
-        secs = abs_d * 30.0
-    else:
-        # More distant ranges at higher speeds
-        secs = abs_d * 15
-    guess = copysign(secs * hz, _distance)
-    end_data = np.ma.flatnotmasked_edges(latitude)[1]-60
-    estimate = max(0, min(index_ref + guess, end_data))
-
-    # By constraining the boundaries we ensure the iteration does not
-    # stray outside the available array.
-    boundaries = [(0, end_data)]
-
-    kti = optimize.fmin_l_bfgs_b(
-        distance_error, estimate,
-        fprime=None,
-        args = (
-            abs(_distance),
-            latitude_ref,
-            longitude_ref,
-            latitude,
-            longitude,
-            index_ref,
-        ),
-        approx_grad=True,
-        epsilon=0.005,
-        factr=1e8,
-        bounds=boundaries, maxfun=100)
-
-    solution_index = kti[0][0]
-    # To find out if this was a good answer, we compute the actual range and compare the error.
-    solution_range = distance_at_index(solution_index, latitude, longitude, latitude_ref, longitude_ref)
-    _dist_err = abs(abs(distance) - solution_range)
-
-    error = kti[2]['warnflag']
-    if solution_index == boundaries[0][0] or solution_index == boundaries[0][1]:
-        logger.warning('Attempted to scan further than data permits.')
-        return
-    elif _dist_err > 0.02:
-        # This can happen if the flight is too short (i.e. less than 250nm if that is the distance requested)
-        # It can also arise if the wrong runway has been identified, so the actual position is the closest point
-        # on the approach to the correct (but unidentified) runway.
-        logger.warning('Converged on the wrong minimum.')
-        return
-    elif error:
-        logger.warning('Returned early from iteration algorithm: %d', error)
-        # ...but the solution is still good, so return this...
-        return solution_index
-    else:
-        return solution_index
+
+def index_at_distances(distances, index_ref, latitude_ref, longitude_ref, latitude, longitude, hz):
+    '''
+    Computes the indices into arrays latitude and longitude at each of the
+    specified distances from the reference point (see index_at_distance).
+    The distances of the track from the reference point are computed once
+    and every crossing of each requested distance is found from them, rather
+    than searching for each distance with an optimiser.
+
+    See index_at_distance for the parameters.
+
+    :param distances: Distances from the reference point required.
+    :type distances: iterable of float, units nautical miles
+    :returns: Indices into the latitude and longitude arrays, or None where
+        the track does not reach the distance, in the order of distances.
+    :rtype: list of float or None
+    '''
+    distances = [float(d) for d in distances]
+    edges = np.ma.flatnotmasked_edges(latitude)
+    if edges is None:
+        return [None] * len(distances)
+    # The end of the data is not searched as the track is often unreliable.
+    end_data = min(edges[1] - 60, len(longitude) - 1)
+    if end_data < 1:
+        return [None] * len(distances)
+    _, track = bearings_and_distances(
+        latitude[:end_data + 1], longitude[:end_data + 1],
+        {'latitude': latitude_ref, 'longitude': longitude_ref})
+    track = ut.convert(track, ut.METER, ut.NM)
+    valid = np.flatnonzero(~np.ma.getmaskarray(track))
+    track = np.ma.getdata(track)[valid].astype(float)
+
+    results = []
+    for distance in distances:
+        abs_d = abs(distance)
+        # We start by guessing an index based on some sample results.
+        if abs_d < 10:
+            # Flown at low speed; about a minute for the last two miles
+            secs = abs_d * 30.0
+        else:
+            # More distant ranges at higher speeds
+            secs = abs_d * 15
+        estimate = max(0, min(index_ref + copysign(secs * hz, distance),
+                              end_data))
+        # Crossings between consecutive valid samples.
+        above = track >= abs_d
+        crossings = np.flatnonzero(above[1:] != above[:-1])
+        if not len(crossings):
+            logger.warning('Attempted to scan further than data permits.')
+            results.append(None)
+            continue
+        before = valid[crossings]
+        after = valid[crossings + 1]
+        # Interpolate between adjacent samples, otherwise take the first
+        # valid sample beyond the distance.
+        adjacent = after - before == 1
+        low = track[crossings]
+        high = track[crossings + 1]
+        indices = after.astype(float)
+        indices[adjacent] = before[adjacent] + \
+            (abs_d - low[adjacent]) / (high[adjacent] - low[adjacent])
+        results.append(float(indices[np.argmin(np.abs(indices - estimate))]))
+    return results
 
 
 def distance_at_index(i, latitude, longitude, latitude_ref, longitude_ref):
@@ -7559,6 +8067,129 @@ def _value(array, _slice, operator, start_edge=None, stop_edge=None):
         return Value(None, None)
 
 
+def values_within_slices(array, slices, function):
+    '''
+    Apply function (for instance max_value) to the array within each of the
+    slices. max_value, min_value and max_abs_value are computed for all
+    slices at once by segmented reductions of the array, giving the same
+    results as calling the function for each slice. Other functions are
+    called for each slice.
+
+    :param array: Array to source values from.
+    :type array: np.ma.masked_array
+    :param slices: Slices with their start and stop edges.
+    :type slices: list of (slice, start_edge, stop_edge)
+    :param function: Function which will return an index and value from the array.
+    :type function: function
+    :returns: The index and value of each slice.
+    :rtype: list of Value
+    '''
+    if function is max_abs_value:
+        values = values_within_slices(np.ma.abs(array), slices, max_value)
+        return [Value(None, None) if value is None else
+                Value(index, array[index]) for index, value in values]
+    elif function is max_value:
+        ufunc, operator = np.maximum, np.ma.argmax
+    elif function is min_value:
+        ufunc, operator = np.minimum, np.ma.argmin
+    else:
+        ufunc = operator = None
+
+    if ufunc is None or not _segmented_reduction_supported(array, slices):
+        return [function(array, _slice, start_edge=start_edge,
+                         stop_edge=stop_edge)
+                for _slice, start_edge, stop_edge in slices]
+
+    # Apply the slice and edge logic of _value to each slice.
+    size = len(array)
+    starts = []
+    stops = []
+    edges = []
+    for _slice, start_edge, stop_edge in slices:
+        slice_start = _slice.start
+        slice_stop = _slice.stop
+        if slice_start and slice_start % 1:
+            start_edge = slice_start
+            slice_start = ceil(slice_start)
+        if slice_stop and slice_stop % 1:
+            stop_edge = slice_stop
+            slice_stop = floor(slice_stop)
+        start = min(int(slice_start or 0), size)
+        stop = size if slice_stop is None else min(int(slice_stop), size)
+        starts.append(start)
+        stops.append(max(start, stop))
+        edges.append((start_edge, stop_edge))
+    starts = np.array(starts, dtype=np.intp)
+    lengths = np.array(stops, dtype=np.intp) - starts
+
+    # Concatenate the indices of the samples within each slice so that the
+    # reductions of all slices are computed at once.
+    segments = np.flatnonzero(lengths)
+    offsets = np.cumsum(lengths[segments]) - lengths[segments]
+    indices = np.arange(lengths.sum()) - np.repeat(
+        offsets - starts[segments], lengths[segments])
+    # Masked samples are filled as np.ma.argmax and np.ma.argmin do.
+    fill_value = np.ma.maximum_fill_value(array) if ufunc is np.maximum \
+        else np.ma.minimum_fill_value(array)
+    filled = np.ma.filled(array, fill_value)[indices]
+    counts = np.zeros(len(slices), dtype=np.intp)
+    results = np.zeros(len(slices), dtype=np.intp)
+    if len(segments):
+        counts[segments] = np.add.reduceat(
+            ~np.ma.getmaskarray(array)[indices], offsets)
+        reduced = ufunc.reduceat(filled, offsets)
+        # The first sample of each slice equal to the reduced value.
+        matches = np.flatnonzero(
+            filled == np.repeat(reduced, lengths[segments]))
+        results[segments] = indices[
+            matches[np.searchsorted(matches, offsets)]]
+
+    values = []
+    for count, value_index, (start_edge, stop_edge) in \
+            zip(counts, results, edges):
+        if not count:
+            values.append(Value(None, None))
+            continue
+        value_index = np.intp(value_index)
+        if not start_edge and not stop_edge:
+            values.append(Value(value_index, array[value_index]))
+            continue
+        candidates = []
+        if start_edge:
+            start_result = value_at_index(array, start_edge)
+            if start_result is not None and start_result is not np.ma.masked:
+                candidates.append((start_result, start_edge))
+        candidates.append((array[value_index], value_index))
+        if stop_edge:
+            stop_result = value_at_index(array, stop_edge)
+            if stop_result is not None and stop_result is not np.ma.masked:
+                candidates.append((stop_result, stop_edge))
+        result_idx = operator(np.ma.array(candidates)[:, 0])
+        values.append(Value(candidates[result_idx][1],
+                            candidates[result_idx][0]))
+    return values
+
+
+def _segmented_reduction_supported(array, slices):
+    '''
+    Whether values_within_slices can reduce all slices of the array at once.
+    Arrays of other types, arrays containing NaN and slices with steps or
+    negative bounds are reduced one slice at a time.
+    '''
+    if type(array) is not np.ma.MaskedArray or array.ndim != 1 or \
+       array.dtype.kind not in 'iuf':
+        return False
+    if array.dtype.kind == 'f' and np.isnan(np.ma.getdata(array)).any():
+        return False
+    for _slice, start_edge, stop_edge in slices:
+        if _slice.step not in (None, 1):
+            return False
+        if (_slice.start or 0) < 0 or \
+           (_slice.stop is not None and _slice.stop < 0):
+            return False
+    return True
+
+
 def value_at_time(array, hz, offset, time_index):
     '''
     Finds the value of the data in array at the time given by the time_index.
@@ -7670,6 +8301,62 @@ def vstack_params(*params):
     return np.ma.vstack([getattr(p, 'array', p) for p in params if p is not None])
 
 
+class ParameterStack(object):
+    '''
+    Parameters stacked onto a new dimension with vstack_params along with the
+    mean offset of the parameters (offset_select('mean', params)), from which
+    the minimum, maximum and average of the parameters can be computed.
+
+    Use stack_params to share a stack between the nodes which reduce the
+    same parameters, e.g. the Eng (*) N1 Avg, Max and Min nodes.
+    '''
+    def __init__(self, params):
+        '''
+        :param params: Parameters to stack. Allows some None values.
+        :type params: iterable of Parameter or None
+        :raises: ValueError if all params are None
+        '''
+        params = tuple(params)
+        self.array = vstack_params(*params)
+        self.offset = offset_select('mean', params)
+
+    def average(self):
+        return np.ma.average(self.array, axis=0)
+
+    def max(self):
+        return np.ma.max(self.array, axis=0)
+
+    def min(self):
+        return np.ma.min(self.array, axis=0)
+
+
+def stack_params(params, cache=None):
+    '''
+    Create a ParameterStack of the parameters, which is stored within the
+    node cache of the flight so that the parameters are only stacked once
+    for all the nodes reducing them. Like aligned parameters, stacks are
+    cached by the name, frequency and offset of each parameter.
+
+    :param params: Parameters to stack. Allows some None values.
+    :type params: iterable of Parameter or None
+    :param cache: Node cache of the flight (Node._cache).
+    :type cache: dict or None
+    :rtype: ParameterStack
+    :raises: ValueError if all params are None
+    '''
+    params = tuple(params)
+    if cache is None or not all(p is None or hasattr(p, 'cache_key')
+                                for p in params):
+        return ParameterStack(params)
+    key = ('Parameter Stack',) + tuple(
+        None if p is None else p.cache_key(p.name, p.frequency, p.offset)
+        for p in params)
+    stack = cache.get(key)
+    if stack is None:
+        stack = cache[key] = ParameterStack(params)
+    return stack
+
+
 def vstack_params_filtered(window, *params, **kw):
     '''
     Create a multi-dimensional masked array with a dimension per param.
@@ -8050,6 +8737,147 @@ def lookup_table(obj, name, _am, _as, _af, _et=None, _es=None):
     obj.warning(message, name, *attributes)
     return None
 
+_runway_tables = OrderedDict()
+RUNWAY_TABLE_CACHE_SIZE = 1000
+
+
+def _runway_row(runway):
+    '''
+    :returns: The magnetic heading, localizer frequency and start and end
+        coordinates of a runway with NaN for missing values.
+    :rtype: tuple of float
+    '''
+    def value(*keys):
+        item = runway
+        for key in keys:
+            item = item.get(key) if item else None
+        return float(item) if item is not None else np.nan
+
+    return (value('magnetic_heading'), value('localizer', 'frequency'),
+            value('start', 'latitude'), value('start', 'longitude'),
+            value('end', 'latitude'), value('end', 'longitude'))
+
+
+class RunwayTable(object):
+    '''
+    The headings, coordinates and localizer frequencies of an airport's
+    runways held in arrays so that runways can be filtered for all runways at
+    once. Missing values are held as NaN and never match.
+
+    Use runway_table(airport) to share tables between approaches and flights.
+    '''
+    def __init__(self, rows):
+        '''
+        :param rows: The _runway_row of each of the airport's runways.
+        :type rows: list of tuple
+        '''
+        table = np.array(rows, dtype=float).reshape(-1, 6)
+        self.headings = table[:, 0]
+        # A heading of zero is treated as missing, as in filter_runway_heading.
+        self.headings[self.headings == 0] = np.nan
+        self.frequencies = table[:, 1]
+        self.start_latitudes = table[:, 2]
+        self.start_longitudes = table[:, 3]
+        self.end_latitudes = table[:, 4]
+        self.end_longitudes = table[:, 5]
+
+    def __len__(self):
+        return len(self.headings)
+
+    def heading_match(self, heading):
+        '''
+        Vectorised filter_runway_heading.
+
+        :param heading: The magnetic heading of the aircraft.
+        :type heading: float
+        :returns: Whether each runway's heading is within
+            RUNWAY_HEADING_TOLERANCE of the heading.
+        :rtype: np.array(dtype=bool)
+        '''
+        rh = self.headings
+        h1 = heading - RUNWAY_HEADING_TOLERANCE
+        h2 = heading + RUNWAY_HEADING_TOLERANCE
+        if h1 < 0:
+            q1 = ((h1 + 360 <= rh) & (rh <= 360)) | ((0 <= rh) & (rh <= heading))
+        else:
+            q1 = (h1 <= rh) & (rh <= heading)
+        if h2 > 360:
+            q2 = ((heading <= rh) & (rh <= 360)) | ((0 <= rh) & (rh <= h2 % 360))
+        else:
+            q2 = (heading <= rh) & (rh <= h2)
+        return q1 | q2
+
+    def frequency_match(self, frequency, tolerance=0):
+        '''
+        :param frequency: Localizer frequency in kHz.
+        :type frequency: float
+        :param tolerance: Tolerance of the frequency in kHz.
+        :type tolerance: float
+        :returns: Whether each runway's localizer frequency matches.
+        :rtype: np.array(dtype=bool)
+        '''
+        return (frequency - tolerance <= self.frequencies) & \
+            (self.frequencies <= frequency + tolerance)
+
+    def start_distances(self, latitude, longitude):
+        '''
+        :returns: Great circle distances from the start of each runway to the
+            coordinates in metres (NaN if the start of a runway is unknown).
+        :rtype: np.array
+        '''
+        return great_circle_distance__haversine(
+            self.start_latitudes, self.start_longitudes, latitude, longitude)
+
+    def cross_track_distances(self, latitude, longitude):
+        '''
+        :param latitude: Latitude or latitudes of the aircraft.
+        :type latitude: float or np.array
+        :param longitude: Longitude or longitudes of the aircraft.
+        :type longitude: float or np.array
+        :returns: The average absolute cross track distance of the coordinates
+            from the centreline of each runway (NaN if a runway has no
+            coordinates).
+        :rtype: np.array
+        '''
+        column = lambda a: a[:, np.newaxis]
+        dxt = cross_track_distance(
+            column(self.start_latitudes), column(self.start_longitudes),
+            column(self.end_latitudes), column(self.end_longitudes),
+            np.atleast_1d(latitude)[np.newaxis, :],
+            np.atleast_1d(longitude)[np.newaxis, :])
+        dxt = np.average(np.abs(dxt), axis=1)
+        coordinates = np.column_stack((
+            self.start_latitudes, self.start_longitudes,
+            self.end_latitudes, self.end_longitudes))
+        # Runways with all coordinates zero have no coordinates.
+        dxt[~np.any(np.nan_to_num(coordinates) != 0, axis=1)] = np.nan
+        return dxt
+
+
+def runway_table(airport):
+    '''
+    Get the RunwayTable of an airport's runways. Tables are cached by the
+    airport and runway ids so that they are shared by all approaches of a
+    flight and by the flights processed in a worker without extracting the
+    runways again. Airports without an id are not cached.
+
+    :param airport: The airport with runways.
+    :type airport: dict
+    :rtype: RunwayTable
+    '''
+    runways = airport.get('runways', [])
+    if airport.get('id') is None:
+        return RunwayTable([_runway_row(r) for r in runways])
+    key = (airport['id'], tuple(r.get('id') for r in runways))
+    table = _runway_tables.get(key)
+    if table is None:
+        table = _runway_tables[key] = RunwayTable(
+            [_runway_row(r) for r in runways])
+        if len(_runway_tables) > RUNWAY_TABLE_CACHE_SIZE:
+            _runway_tables.popitem(last=False)
+    return table
+
+
 def filter_runway_heading(r, h):
     rh = r.get('magnetic_heading')
     if not rh:
@@ -8093,12 +8921,6 @@ def nearest_runway(airport, heading, ilsfreq=None, latitude=None, longitude=None
     :raises: IndexError
     '''
 
-    def _filter_ilsfreq(r, f):
-        rf = r.get('localizer').get('frequency')
-        f0 = ilsfreq - RUNWAY_ILSFREQ_TOLERANCE
-        f1 = ilsfreq + RUNWAY_ILSFREQ_TOLERANCE
-        return (f0 <= rf <= f1) if rf is not None else False
-
     if not airport:
         return None
 
@@ -8110,7 +8932,11 @@ def nearest_runway(airport, heading, ilsfreq=None, latitude=None, longitude=None
 
     # 1. Attempt to identify the runway by magnetic heading:
     assert 0 <= heading <= 360, u'Heading must be between 0° and 360° degrees.'
-    runways = [runway for runway in runways if filter_runway_heading(runway, heading)]
+    table = runway_table(airport)
+    for index in np.flatnonzero(np.isnan(table.headings)):
+        logger.warning('No heading information available for runway #%d.', runways[index]['id'])
+    matches = np.flatnonzero(table.heading_match(heading))
+    runways = [runways[index] for index in matches]
     if len(runways) == 0:
         logger.warning('No runways found at airport #%d for heading %03.1f degrees.', airport['id'], heading)
         return None
@@ -8127,10 +8953,11 @@ def nearest_runway(airport, heading, ilsfreq=None, latitude=None, longitude=None
             ilsfreq = None
             logger.warning("Localiser frequency '%s' must have odd 100 kHz digit.", ilsfreq)
         else:
-            x = [runway for runway in runways if _filter_ilsfreq(runway, ilsfreq)]
+            x = np.flatnonzero(table.frequency_match(
+                ilsfreq, RUNWAY_ILSFREQ_TOLERANCE)[matches])
             if len(x) == 1:
-                logger.info("Runway '%s' selected: Identified by ILS.", x[0]['identifier'])
-                return x[0]
+                logger.info("Runway '%s' selected: Identified by ILS.", runways[x[0]]['identifier'])
+                return runways[x[0]]
             elif len(x) == 0:
                 logger.warning("ILS '%s' frequency provided, no matching runway found at '%s'.", ilsfreq, airport['id'])
             else:
@@ -8143,31 +8970,18 @@ def nearest_runway(airport, heading, ilsfreq=None, latitude=None, longitude=None
         # TODO: Compare true heading with one calculated from runway end points?
         assert hint in ('takeoff', 'landing', 'approach')
         for limit in (20, 10):
-            x = [runway for runway in runways if abs(float(runway['magnetic_heading']) - heading) < limit]
+            x = np.flatnonzero(np.abs(table.headings[matches] - heading) < limit)
             if len(x) == 1:
-                logger.info("Runway '%s' selected: Only runway within %d degrees of provided heading.", x[0]['identifier'], limit)
-                return x[0]
+                logger.info("Runway '%s' selected: Only runway within %d degrees of provided heading.", runways[x[0]]['identifier'], limit)
+                return runways[x[0]]
 
     # 4. Attempt to identify by nearest runway:
     if latitude is not None and longitude is not None:
         assert np.all(-90 <= latitude) and np.all(latitude <= 90), 'Latitude must be between -90 and 90 degrees.'
         assert np.all(-180 < longitude) and np.all(longitude <= 180), 'Longitude must be between -180 and 180 degrees.'
-        p3y, p3x = latitude, longitude
-        distance = float('inf')
-        runway = None
-        for r in runways:
-            p1x = r['start']['longitude']
-            p1y = r['start']['latitude']
-            p2x = r['end']['longitude']
-            p2y = r['end']['latitude']
-            args = (p1y, p1x, p2y, p2x, p3y, p3x)
-            if not any(args):
-                continue
-            abs_dxt = np.average(np.abs(cross_track_distance(*args)))
-            if abs_dxt < distance:
-                distance = abs_dxt
-                runway = r
-        if runway:
+        distances = table.cross_track_distances(latitude, longitude)[matches]
+        if not np.all(np.isnan(distances)):
+            runway = runways[np.nanargmin(distances)]
             logger.info("Runway '%s' selected: Closest to provided coordinates.", runway['identifier'])
             return runway
 
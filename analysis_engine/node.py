@@ -26,8 +26,10 @@ from analysis_engine.library import (
     is_index_within_slice,
     is_index_within_slices,
     is_slice_within_slice,
+    mask_outside_slices,
     repair_mask,
     runs_of_ones,
+    runs_of_ones_within_slices,
     slice_duration,
     slice_multiply,
     slice_round,
@@ -38,6 +40,7 @@ from analysis_engine.library import (
     slices_remove_small_gaps,
     value_at_index,
     value_at_time,
+    values_within_slices,
 )
 from analysis_engine.recordtype import recordtype
 from analysis_engine.settings import NODE_CACHE_OFFSET_DP
@@ -398,6 +401,34 @@ def can_operate(cls, available, actype=A('Aircraft Type')):
         :returns: self after having aligned dependencies and called derive.
         :rtype: self
         """
+        args = self._align_dependencies(args)
+
+        try:
+            res = self.derive(*args)
+        except Exception:
+            self.exception('Failed to derive node `%s`.\n'
+                           'Nodes used to derive:\n  %s',
+                           self.name, '\n  '.join(repr(n) for n in args))
+            raise
+
+        if res is NotImplemented:
+            raise NotImplementedError("Class '%s' derive method is not implemented." %
+                                      self.__class__.__name__)
+        elif res:
+            raise UserWarning("Class '%s' should not have returned anything. Got: %s" % (
+                self.__class__.__name__, res))
+        return self
+
+    def _align_dependencies(self, args):
+        """
+        Aligns the dependencies to the first to be passed to derive, setting
+        the frequency and offset of the node.
+
+        :param args: List of available Parameter objects
+        :type args: list
+        :returns: The aligned dependencies.
+        :rtype: list
+        """
         assert len(args) == len(self.get_dependency_names()), \
             '%s: incorrect number of arguments for derive() method' % self.__class__.__name__
         dependencies_to_align = \
@@ -443,21 +474,24 @@ def can_operate(cls, available, actype=A('Aircraft Type')):
             self.frequency = dependencies_to_align[0].frequency
             self.offset = dependencies_to_align[0].offset
 
-        try:
-            res = self.derive(*args)
-        except Exception:
-            self.exception('Failed to derive node `%s`.\n'
-                           'Nodes used to derive:\n  %s',
-                           self.name, '\n  '.join(repr(n) for n in args))
-            raise
+        return args
 
-        if res is NotImplemented:
-            raise NotImplementedError("Class '%s' derive method is not implemented." %
-                                      self.__class__.__name__)
-        elif res:
-            raise UserWarning("Class '%s' should not have returned anything. Got: %s" % (
-                self.__class__.__name__, res))
-        return self
+    def get_airport_coordinates(self, args):
+        """
+        Accessor for the airport_coordinates method of nodes which look up
+        airports, aligning the dependencies as get_derived does.
+
+        :param args: List of available Parameter objects
+        :type args: list
+        :returns: latitude and longitude pairs which derive will look up.
+        :rtype: list of (float, float)
+        """
+        args = self._align_dependencies(args)
+        try:
+            names = inspect.getargspec(self.derive).args[1:]
+        except AttributeError:
+            names = inspect.getfullargspec(self.derive).args[1:]
+        return self.airport_coordinates(**dict(zip(names, args)))
 
     def derive(self, **kwargs):
         """
@@ -647,6 +681,26 @@ class DerivedParameterNode(Node):
         super(DerivedParameterNode, self).__init__(
             name=name, frequency=frequency, offset=offset, *args, **kwargs)
 
+    def __getattr__(self, name):
+        '''
+        Load the array of a lazily loaded parameter when it is first accessed
+        (see lazy_param_from_hdf).
+        '''
+        loader = self.__dict__.get('_array_loader')
+        if name != 'array' or loader is None:
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (self.__class__.__name__, name))
+        self.array = loader()
+        del self.__dict__['_array_loader']
+        return self.__dict__['array']
+
+    def __getstate__(self):
+        '''
+        Load the array of a lazily loaded parameter before pickling.
+        '''
+        self.array
+        return super(DerivedParameterNode, self).__getstate__()
+
     def at(self, secs):
         """
         Gets the value within the array at time secs. Interpolates to retrieve
@@ -701,6 +755,35 @@ class DerivedParameterNode(Node):
 
         return aligned_param
 
+    def _cached_slices(self, key, function, *args, **kwargs):
+        '''
+        Memoise slices of the parameter's array within the node cache, so
+        that slices of the same band of a parameter (e.g. Altitude AAL For
+        Flight Phases from 1000 to 500 ft) are computed once per flight
+        rather than by every node using them. Like aligned parameters, the
+        parameter is identified by its name, frequency and offset, so copies
+        of the parameter loaded separately share the slices. The length of
+        the array and the parameter's version are also part of the key;
+        slices are recomputed once the parameter is derived or written again
+        (see invalidate_cached_slices).
+
+        :param key: Arguments identifying the slices.
+        :type key: tuple
+        :param function: Function computing the slices from the arguments.
+        :type function: callable
+        :returns: A copy of the cached slices.
+        :rtype: list of slice
+        '''
+        if self._cache is None:
+            return function(*args, **kwargs)
+        key = ('Slices',) + self.cache_key(self.name, self.frequency,
+                                           self.offset) + (
+            self._cache.get(('Version', self.name), 0), len(self.array)) + key
+        slices = self._cache.get(key)
+        if slices is None:
+            slices = self._cache[key] = function(*args, **kwargs)
+        return list(slices)
+
     def slices_above(self, value):
         '''
         Get slices where the parameter's array is above value.
@@ -761,7 +844,35 @@ class DerivedParameterNode(Node):
         :returns: Slices of the array where values are between from_ and to and either ascending or descending depending on comparing from_ and to.
         :rtype: list of slice
         '''
-        return slices_from_to(self.array, from_, to, threshold=threshold)[1]
+        return self._cached_slices(
+            ('from_to', from_, to, threshold),
+            lambda: slices_from_to(self.array, from_, to, threshold=threshold)[1])
+
+    def slices_within_band(self, min_, max_, sections):
+        '''
+        Get slices of valid data where the parameter's array is within the
+        band from min_ to max_ (inclusive) and within the sections. This is
+        equivalent to:
+
+        valid_slices_within_array(
+            np.ma.masked_outside(param.array, min_, max_), sections)
+
+        :param min_: One limit of the band.
+        :type min_: float or int
+        :param max_: Other limit of the band.
+        :type max_: float or int
+        :param sections: Sections to find slices within.
+        :type sections: SectionNode or list of Section
+        :returns: Slices where the array is within the band.
+        :rtype: list of slice
+        '''
+        section_slices = [s.slice for s in sections]
+        return self._cached_slices(
+            ('within_band', min_, max_,
+             tuple((s.start, s.stop) for s in section_slices)),
+            lambda: np.ma.clump_unmasked(mask_outside_slices(
+                np.ma.masked_outside(self.array, min_, max_),
+                section_slices)))
 
     def slices_to_kti(self, ht, tdwns):
         '''
@@ -773,7 +884,7 @@ class DerivedParameterNode(Node):
         :param tdwns: Reference to the Touchdown KTIs
         '''
         result = []  # We are going to return a list of slices.
-        _, basics = slices_from_to(self.array, ht, 0)
+        basics = self.slices_from_to(ht, 0)
         for basic in basics:
             new_basic = slice(basic.start, min(basic.stop + 20, len(self.array)))  # In case the touchdown is behind the basic slice.
             for tdwn in tdwns:
@@ -951,6 +1062,7 @@ class MultistateDerivedParameterNode(DerivedParameterNode):
 
         :rtype: dict
         '''
+        self.array
         odict = self.__dict__.copy()
         return odict
 
@@ -969,6 +1081,22 @@ class MultistateDerivedParameterNode(DerivedParameterNode):
 M = MultistateDerivedParameterNode  # shorthand
 
 
+def invalidate_cached_slices(cache, name):
+    '''
+    Invalidate the slices of a parameter memoised within the node cache (see
+    DerivedParameterNode._cached_slices), e.g. when the parameter is derived
+    or written.
+
+    :param cache: Node cache of the flight.
+    :type cache: dict or None
+    :param name: Name of the parameter.
+    :type name: str
+    '''
+    if cache is not None:
+        key = ('Version', name)
+        cache[key] = cache.get(key, 0) + 1
+
+
 def derived_param_from_hdf(hdf_parameter, cache=None):
     '''
     Loads and wraps an HDF parameter with either DerivedParameterNode or
@@ -995,6 +1123,58 @@ def derived_param_from_hdf(hdf_parameter, cache=None):
         )
 
 
+def lazy_param_from_hdf(hdf, name, cache=None):
+    '''
+    Wraps an HDF parameter with either DerivedParameterNode or
+    MultistateDerivedParameterNode classes without loading its array. The
+    parameter's attributes are read immediately while the array is only
+    loaded from the HDF file when it is first accessed, so dependencies which
+    are only used through cached aligned copies are never read.
+
+    :param hdf: HDF file to load the parameter from.
+    :type hdf: hdf_file
+    :param name: Name of the parameter.
+    :type name: str
+    :raises KeyError: If the parameter is not valid within the HDF file.
+    :rtype: DerivedParameterNode or MultistateDerivedParameterNode
+    '''
+    # Read a single second of data to establish the parameter's attributes.
+    node = derived_param_from_hdf(
+        hdf.get_param(name, valid_only=True, _slice=slice(0, 1)), cache=cache)
+
+    def loader():
+        return hdf.get_param(name, valid_only=True).array
+
+    del node.__dict__['array']
+    node._array_loader = loader
+    return node
+
+
+def lazy_param_copy(param, cache=None):
+    '''
+    Wraps a parameter which must not be modified, e.g. one waiting to be
+    written to the HDF file (see ParameterWriter.get_param), with either
+    DerivedParameterNode or MultistateDerivedParameterNode classes. The
+    parameter's array is only copied when it is first accessed, so
+    dependencies which are only used through cached aligned copies are never
+    copied.
+
+    :param param: Parameter to wrap.
+    :type param: DerivedParameterNode
+    :param cache: Node cache of the flight.
+    :type cache: dict or None
+    :rtype: DerivedParameterNode or MultistateDerivedParameterNode
+    '''
+    node = derived_param_from_hdf(param, cache=cache)
+
+    def loader():
+        return param.array.copy()
+
+    del node.__dict__['array']
+    node._array_loader = loader
+    return node
+
+
 class SectionNode(Node, list):
     '''
     Derives from list to implement iteration and list methods.
@@ -1946,21 +2126,27 @@ class KeyPointValueNode(FormattedNameNode):
         if min_duration:
             assert freq
 
+        items = []
         for slice_ in slices:
 
             if isinstance(slice_, Section):
-                index, value = function(array, slice_.slice,
-                                        start_edge=slice_.start_edge,
-                                        stop_edge=slice_.stop_edge)
-                begin = slice_.start_edge
-                end = slice_.stop_edge
+                items.append((slice_.slice, slice_.start_edge,
+                              slice_.stop_edge))
             else:
                 # Where slice.stop is not a whole number, it is assumed that the
                 # value is an stop_edge rather than an inclusive pythonic end to a
                 # range (stop+1) as a slice should be.
                 stop = slice_.stop if slice_.stop % 1 else None
-                index, value = function(array, slice_, start_edge=slice_.start,
-                                        stop_edge=stop)
+                items.append((slice_, slice_.start, stop))
+
+        # The values of all slices are computed together where possible.
+        values = values_within_slices(array, items, function)
+
+        for slice_, (index, value) in zip(slices, values):
+            if isinstance(slice_, Section):
+                begin = slice_.start_edge
+                end = slice_.stop_edge
+            else:
                 begin = slice_.start
                 end = slice_.stop
 
@@ -2172,26 +2358,24 @@ class KeyPointValueNode(FormattedNameNode):
             # Handle slices and phases with slice attributes
             slices = [getattr(p, 'slice', p) for p in phase]
 
-        for _slice in slices:
-            start = _slice.start or 0
-            if _slice.stop is not None and _slice.stop == _slice.start:
-                continue # e.g. if section is aligned to lower frequency
-            # NOTE: TypeError: 'bool' object is not subscriptable:
-            #     If condition is False check Values Mapping has correct
-            #     state being checked against in condition.
-            events = runs_of_ones(condition[_slice])
-            # for each period where the condition is met within the phase slice
-            for event in events:
-                index = event.start
-                if index == 0 and exclude_leading_edge:
-                    logger.debug("Excluding leading edge at index %d", start)
-                    continue
-                #TODO: If Section, ensure we check decimal start/stop edges
-                duration = (event.stop - event.start) / float(frequency)
-                if duration >= min_duration:
-                    self.create_kpv(start + index, duration)
-            #endfor
-        #endfor
+        # The periods where the condition is met within all phase slices are
+        # found from a single run length encoding of the condition.
+        # NOTE: TypeError: len() of unsized object:
+        #     If condition is False check Values Mapping has correct
+        #     state being checked against in condition.
+        slice_numbers, starts, stops = runs_of_ones_within_slices(condition,
+                                                                  slices)
+        durations = (stops - starts) / float(frequency)
+        for slice_number, index, duration in zip(slice_numbers.tolist(),
+                                                 starts.tolist(),
+                                                 durations.tolist()):
+            start = slices[slice_number].start or 0
+            if index == 0 and exclude_leading_edge:
+                logger.debug("Excluding leading edge at index %d", start)
+                continue
+            #TODO: If Section, ensure we check decimal start/stop edges
+            if duration >= min_duration:
+                self.create_kpv(start + index, duration)
         return
 
 
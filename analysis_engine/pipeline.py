@@ -0,0 +1,312 @@
+'''
+Pipelined splitting and processing of raw HDF files.
+'''
+import json
+import logging
+import os
+import six
+import sqlite3
+import sys
+import threading
+
+from six.moves import cPickle, queue
+
+from analysis_engine import __version__
+from analysis_engine.process_flight import process_flight
+from analysis_engine.settings import INGEST_QUEUE_SIZE
+from analysis_engine.split_hdf_to_segments import split_hdf_to_segments
+
+
+logger = logging.getLogger(name=__name__)
+
+
+def _datetime_key(dt):
+    return None if dt is None else dt.isoformat()
+
+
+class SegmentIndex(object):
+    '''
+    Local index of the results of processed segments, stored within an
+    SQLite database, so that identical segments (e.g. when data is
+    downloaded again with overlapping flights) are not processed again.
+    Segments are identified by their content: the hash, type, start and
+    stop datetimes and the aircraft's tail number, as the results of
+    process_flight depend on more than the segment's speed hash. The
+    segment's slice is not part of the key as the same flight is found at a
+    different offset within data downloaded again. Results are only returned
+    for segments processed by the same version of the analysis engine. The
+    index should only be shared by processing with the same process_flight
+    arguments.
+
+    Usage:
+
+    with SegmentIndex('segments.db') as index:
+        res = index.get(segment, tail_number)
+        if res is None:
+            res = process_flight(...)
+            index.put(segment, res, tail_number)
+    '''
+    def __init__(self, path, version=__version__):
+        '''
+        :param path: Path to the SQLite database which will be created if it
+            does not exist.
+        :type path: str
+        :param version: Version of the results.
+        :type version: str
+        '''
+        self.path = path
+        self.version = version
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS segments ('
+                'key TEXT PRIMARY KEY, version TEXT, results BLOB)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def _key(segment, tail_number):
+        '''
+        :returns: Key identifying the segment. The duration of the segment is
+            identified by its stop datetime.
+        :rtype: str
+        '''
+        return json.dumps([
+            segment.hash, segment.type, _datetime_key(segment.start_dt),
+            _datetime_key(segment.stop_dt), tail_number])
+
+    def get(self, segment, tail_number=None):
+        '''
+        Get the results of a previously processed segment.
+
+        :param segment: The segment.
+        :type segment: Segment
+        :param tail_number: Tail number of the aircraft.
+        :type tail_number: str or None
+        :returns: The results of process_flight or None if an identical
+            segment has not been processed by this version.
+        :rtype: dict or None
+        '''
+        row = self._conn.execute(
+            'SELECT results FROM segments WHERE key = ? AND version = ?',
+            (self._key(segment, tail_number), self.version)).fetchone()
+        if row is None:
+            return None
+        return cPickle.loads(bytes(row[0]))
+
+    def put(self, segment, results, tail_number=None):
+        '''
+        Store the results of a processed segment, replacing previous results.
+
+        :param segment: The segment.
+        :type segment: Segment
+        :param results: The results of process_flight.
+        :type results: dict
+        :param tail_number: Tail number of the aircraft.
+        :type tail_number: str or None
+        '''
+        data = cPickle.dumps(results, protocol=cPickle.HIGHEST_PROTOCOL)
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO segments VALUES (?, ?, ?)',
+                (self._key(segment, tail_number), self.version,
+                 sqlite3.Binary(data)))
+
+
+class IngestPipeline(object):
+    '''
+    Splits raw HDF files into segments on a background thread while the
+    segments of previously split files are processed, so that the I/O bound
+    splitting of the next file overlaps the CPU bound processing of the
+    current file's segments. Segments are handed from the split stage to the
+    process stage through a queue of up to queue_size segments and the split
+    stage blocks while the queue is full.
+
+    Errors raised while splitting are re-raised within the processing thread
+    once the segments of the previous files have been processed.
+
+    If a SegmentIndex is provided, the stored results of segments which have
+    already been processed are returned rather than processing them again.
+    process_flight is not called for these segments, so derived parameters
+    are not written to their HDF files (or sidecar HDF files).
+
+    Usage:
+
+    with IngestPipeline(hdf_paths, aircraft_info) as pipeline:
+        for segment, res in pipeline:
+            ...
+    '''
+    _stop = object()
+
+    def __init__(self, hdf_paths, aircraft_info, split_kwargs={},
+                 process_kwargs={}, queue_size=INGEST_QUEUE_SIZE,
+                 index=None):
+        '''
+        :param hdf_paths: Paths of the raw HDF files to split. May be a
+            generator which yields paths as files are downloaded.
+        :type hdf_paths: iterable of str
+        :param aircraft_info: Aircraft information passed to
+            split_hdf_to_segments and process_flight.
+        :type aircraft_info: dict
+        :param split_kwargs: Keyword arguments for split_hdf_to_segments. If
+            virtual segments are split, derived parameters are written to a
+            sidecar HDF file for each segment named as the segment file would
+            have been.
+        :type split_kwargs: dict
+        :param process_kwargs: Keyword arguments for process_flight.
+        :type process_kwargs: dict
+        :param queue_size: Maximum number of split segments waiting to be
+            processed.
+        :type queue_size: int
+        :param index: Index of the results of processed segments.
+        :type index: SegmentIndex or None
+        '''
+        self.hdf_paths = hdf_paths
+        self.aircraft_info = aircraft_info
+        self.split_kwargs = split_kwargs
+        self.process_kwargs = process_kwargs
+        self.index = index
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._iterated = False
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run,
+                                        name='IngestPipeline')
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __iter__(self):
+        '''
+        Process the segments of each file in the order they were split. A
+        pipeline can only be iterated once as segments are consumed from the
+        queue.
+
+        :returns: Generator of the segment and the results of process_flight.
+        :rtype: generator of (Segment, dict)
+        :raises RuntimeError: If the pipeline has already been iterated or
+            has been stopped.
+        '''
+        if self._iterated or self._stopping.is_set():
+            raise RuntimeError(
+                "IngestPipeline can only be iterated once and not after "
+                "being stopped.")
+        self._iterated = True
+        if self._thread.ident is None:
+            self.start()
+        return self._process_segments()
+
+    def _process_segments(self):
+        while True:
+            segment = self._queue.get()
+            if segment is self._stop:
+                break
+            yield segment, self.process_segment(segment)
+        self._thread.join()
+        if self._exc_info is not None:
+            exc_info, self._exc_info = self._exc_info, None
+            six.reraise(*exc_info)
+
+    def _put(self, item):
+        '''
+        Queue an item, blocking while the queue is full unless the pipeline
+        is stopped.
+
+        :returns: Whether the item was queued.
+        :rtype: bool
+        '''
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def _run(self):
+        try:
+            for hdf_path in self.hdf_paths:
+                if self._stopping.is_set():
+                    return
+                logger.info("Splitting file: %s", hdf_path)
+                segments = split_hdf_to_segments(
+                    hdf_path, self.aircraft_info, **self.split_kwargs)
+                for segment in segments:
+                    if not self._put(segment):
+                        return
+        except Exception:
+            self._exc_info = sys.exc_info()
+        finally:
+            self._put(self._stop)
+
+    def start(self):
+        '''
+        Start splitting files on the background thread.
+        '''
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop splitting files and discard segments waiting to be processed.
+        '''
+        self._stopping.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def process_segment(self, segment):
+        '''
+        Process a segment with process_flight unless the segment's results
+        are stored within the index, in which case the segment's HDF file is
+        left as it was split.
+
+        :type segment: Segment
+        :returns: The results of process_flight.
+        :rtype: dict
+        '''
+        tail_number = self.aircraft_info.get('Tail Number')
+        if self.index is not None and segment.hash:
+            res = self.index.get(segment, tail_number)
+            if res is not None:
+                # process_flight is skipped so derived parameters are not
+                # written to the segment's HDF file or sidecar.
+                logger.info("Segment %d of file '%s' has already been "
+                            "processed, derived parameters are not written: "
+                            "%s", segment.part, segment.path, segment.hash)
+                return res
+        segment_info = {
+            'File': segment.path,
+            'Start Datetime': segment.start_dt,
+            'Segment Type': segment.type,
+        }
+        kwargs = dict(self.process_kwargs)
+        if self.split_kwargs.get('virtual'):
+            segment_info['Slice'] = segment.slice
+            root = os.path.splitext(os.path.basename(segment.path))[0]
+            dest_dir = self.split_kwargs.get('dest_dir') or \
+                os.path.dirname(segment.path)
+            kwargs['sidecar'] = os.path.join(
+                dest_dir, root + '.%03d.hdf5' % segment.part)
+        logger.info("Processing segment %d of file: %s", segment.part,
+                    segment.path)
+        res = process_flight(segment_info, tail_number,
+                             aircraft_info=self.aircraft_info, **kwargs)
+        if self.index is not None and segment.hash:
+            self.index.put(segment, res, tail_number)
+        return res
@@ -15,6 +15,7 @@ from hdfaccess.file import hdf_file
 from flightdatautilities import units as ut
 from flightdatautilities.print_table import indent
 
+from analysis_engine.hdf_io import open_hdf
 from analysis_engine.library import (
     bearing_and_distance, 
     latitudes_and_longitudes, 
@@ -162,7 +163,7 @@ def draw_centreline(kml, rwy):
 
 
 def track_to_kml(hdf_path, kti_list, kpv_list, approach_list,
-                 plot_altitude=None, dest_path=None):
+                 plot_altitude=None, dest_path=None, sidecar_path=None):
     '''
     Plot results of process_flight onto a KML track.
     
@@ -170,10 +171,12 @@ def track_to_kml(hdf_path, kti_list, kpv_list, approach_list,
     :type flight_attrs: list
     :param plot_altitude: Name of Altitude parameter to use in KML
     :type plot_altitude: String
+    :param sidecar_path: Sidecar HDF file containing derived parameters.
+    :type sidecar_path: str
     '''
     one_hz = Parameter()
     kml = simplekml.Kml()
-    with hdf_file(hdf_path) as hdf:
+    with open_hdf(hdf_path, sidecar_path=sidecar_path) as hdf:
         # Latitude param, Longitude param, track name, colour
         coord_params = (
             {'lat': 'Latitude Smoothed',
@@ -477,7 +480,8 @@ def _index_or_slice(x):
 
 
 def csv_flight_details(hdf_path, kti_list, kpv_list, phase_list,
-                       dest_path=None, append_to_file=True):
+                       dest_path=None, append_to_file=True,
+                       sidecar_path=None):
     """
     Currently writes to csv and prints to a table.
     
@@ -485,6 +489,7 @@ def csv_flight_details(hdf_path, kti_list, kpv_list, phase_list,
     
     :param dest_path: Outputs CSV to dest_path (removing if exists). If None,
       collates results by appending to a single file: 'combined_test_output.csv'
+    :param sidecar_path: Sidecar HDF file containing derived parameters.
     """
     rows = []
     params = ['Airspeed', 'Altitude AAL']
@@ -527,7 +532,7 @@ def csv_flight_details(hdf_path, kti_list, kpv_list, phase_list,
         rows.append(end)
     
     # Append values of useful parameters at this time
-    with hdf_file(hdf_path) as hdf:
+    with open_hdf(hdf_path, sidecar_path=sidecar_path) as hdf:
         for param in params:
             # Create DerivedParameterNode to utilise the .at() method
             if param not in hdf:
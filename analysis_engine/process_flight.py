@@ -16,18 +16,27 @@ from flightdatautilities.filesystem_tools import copy_file
 from hdfaccess.file import hdf_file
 
 from analysis_engine import hooks, settings, __version__
-from analysis_engine.dependency_graph import dependency_order
+from analysis_engine.api_handler import flight_geodata, prefetch_airports
+from analysis_engine.dependency_graph import (dependency_graph,
+                                              dependency_order,
+                                              dependent_nodes)
+from analysis_engine.hdf_io import (LockedHDF, open_hdf, ParameterPrefetcher,
+                                    ParameterWriter)
 from analysis_engine.json_tools import json_to_process_flight, process_flight_to_nodes
 from analysis_engine.library import np_ma_masked_zeros, repair_mask
 from analysis_engine.node import (ApproachNode, Attribute,
                                   derived_param_from_hdf,
                                   DerivedParameterNode,
                                   FlightAttributeNode,
+                                  invalidate_cached_slices,
                                   KeyPointValueNode,
                                   KeyTimeInstanceNode,
+                                  lazy_param_copy,
+                                  lazy_param_from_hdf,
                                   NodeManager, P, Section, SectionNode,
                                   NODE_SUBCLASSES)
-from analysis_engine.settings import NODE_CACHE
+from analysis_engine.settings import (LAZY_PARAMETER_LOADING, NODE_CACHE,
+                                     PREFETCH_LOOKAHEAD, WRITE_QUEUE_SIZE)
 from analysis_engine.utils import get_aircraft_info, get_derived_nodes
 
 
@@ -94,6 +103,42 @@ def get_node_type(node, node_subclasses):
     return node.__class__.__name__
 
 
+def _prefetch_dependencies(node_mgr, process_order, params):
+    '''
+    HDF dependencies of each node to prefetch (see ParameterPrefetcher).
+
+    With lazy parameter loading and the node cache, only the first use of
+    each dependency is prefetched. Later uses are mostly served by aligned
+    copies within the node cache in which case the lazily loaded array is
+    never read, so prefetching them would read the whole array regardless.
+
+    :type node_mgr: NodeManager
+    :param process_order: Node names in the order they will be processed.
+    :type process_order: [str]
+    :param params: Nodes which have already been derived.
+    :type params: dict
+    :returns: HDF parameter names to prefetch for each node.
+    :rtype: {str: [str]}
+    '''
+    first_use_only = LAZY_PARAMETER_LOADING and NODE_CACHE
+    prefetched = set()
+    dependencies = {}
+    for param_name in process_order:
+        if (param_name in node_mgr.hdf_keys or param_name in params or
+                param_name not in node_mgr.derived_nodes):
+            continue
+        dep_names = [
+            dep_name for dep_name in
+            node_mgr.derived_nodes[param_name].get_dependency_names()
+            if dep_name in node_mgr.hdf_keys]
+        if first_use_only:
+            dep_names = [dep_name for dep_name in dep_names
+                         if dep_name not in prefetched]
+            prefetched.update(dep_names)
+        dependencies[param_name] = dep_names
+    return dependencies
+
+
 def derive_parameters(hdf, node_mgr, process_order, params=None, force=False):
     '''
     Derives parameters in process_order. Dependencies are sourced via the
@@ -110,6 +155,174 @@ def derive_parameters(hdf, node_mgr, process_order, params=None, force=False):
     '''
     if not params:
         params = {}
+
+    process_order = _defer_airport_nodes(node_mgr, process_order, params)
+    if PREFETCH_LOOKAHEAD or WRITE_QUEUE_SIZE:
+        # the HDF file is shared with background threads
+        hdf = LockedHDF(hdf)
+    prefetcher = None
+    if PREFETCH_LOOKAHEAD:
+        # read HDF dependencies of upcoming nodes in the background
+        dependencies = _prefetch_dependencies(node_mgr, process_order, params)
+        prefetcher = ParameterPrefetcher(hdf, process_order, dependencies)
+        prefetcher.start()
+    # write derived parameters in the background
+    writer = ParameterWriter(hdf) if WRITE_QUEUE_SIZE else None
+    try:
+        result = _derive_parameters(hdf, node_mgr, process_order, params,
+                                    force, prefetcher, writer)
+    except:
+        if writer:
+            writer.stop()
+        raise
+    finally:
+        if prefetcher:
+            prefetcher.stop()
+    if writer:
+        # all derived parameters must be written before returning
+        writer.close()
+    return result
+
+
+def _get_dependencies(hdf, node_mgr, node_class, params, cache, prefetcher,
+                      writer, consume=True):
+    '''
+    Dependencies of a node in the order of its derive method's arguments
+    (see _derive_parameters). Unavailable dependencies are None.
+
+    :param consume: Whether the node is about to be derived and so uses up
+        its prefetched dependencies (see ParameterPrefetcher.get_param).
+    :type consume: bool
+    :rtype: list
+    '''
+    deps = []
+    node_deps = node_class.get_dependency_names()
+    for dep_name in node_deps:
+        if dep_name in params:  # already calculated KPV/KTI/Phase
+            deps.append(params[dep_name])
+        elif node_mgr.get_attribute(dep_name) is not None:
+            deps.append(node_mgr.get_attribute(dep_name))
+        elif dep_name in node_mgr.hdf_keys:
+            # LFL/Derived parameter
+            # all parameters (LFL or other) need get_aligned which is
+            # available on DerivedParameterNode
+            hdf_parameter = pending = None
+            if writer:
+                # parameter may still be waiting to be written
+                pending = writer.get_param(dep_name)
+            if pending is None and prefetcher:
+                hdf_parameter = prefetcher.get_param(dep_name,
+                                                     consume=consume)
+            try:
+                if pending is not None:
+                    # shared with the writer so copied only when accessed
+                    dp = lazy_param_copy(pending, cache=cache)
+                elif hdf_parameter is not None:
+                    dp = derived_param_from_hdf(hdf_parameter, cache=cache)
+                elif LAZY_PARAMETER_LOADING:
+                    dp = lazy_param_from_hdf(hdf, dep_name, cache=cache)
+                else:
+                    dp = derived_param_from_hdf(hdf.get_param(
+                        dep_name, valid_only=True), cache=cache)
+            except KeyError:
+                # Parameter is invalid.
+                dp = None
+            deps.append(dp)
+        else:  # dependency not available
+            deps.append(None)
+    return deps
+
+
+def _prefetch_airports(hdf, node_mgr, process_order, index, airport_nodes,
+                       params, cache, prefetcher, writer):
+    '''
+    Look up the airports near the coordinates of all nodes which look up
+    airports (see Node.get_airport_coordinates) and whose dependencies have
+    been derived before the node at index in the process order, with a
+    single call to the API handler (see prefetch_airports).
+
+    :param airport_nodes: Names of nodes which look up airports and have not
+        been prefetched. Prefetched nodes are removed.
+    :type airport_nodes: [str]
+    '''
+    remaining = set(process_order[index:])
+    coordinates = []
+    for param_name in list(airport_nodes):
+        node_class = node_mgr.derived_nodes[param_name]
+        if any(dep_name in remaining
+               for dep_name in node_class.get_dependency_names()):
+            continue
+        airport_nodes.remove(param_name)
+        # the node is derived later so prefetched dependencies are kept
+        deps = _get_dependencies(hdf, node_mgr, node_class, params, cache,
+                                 prefetcher, writer, consume=False)
+        try:
+            coordinates.extend(
+                node_class(cache=cache).get_airport_coordinates(deps))
+        except Exception:
+            # The node reports the error when it is derived.
+            logger.debug("Unable to determine the airport coordinates of "
+                         "`%s`.", param_name, exc_info=True)
+    prefetch_airports(coordinates)
+
+
+def _airport_nodes(node_mgr, process_order, params):
+    '''
+    :returns: Names of nodes within the process order which look up airports
+        near coordinates (see Node.get_airport_coordinates).
+    :rtype: [str]
+    '''
+    return [
+        param_name for param_name in process_order
+        if param_name not in node_mgr.hdf_keys and param_name not in params
+        and hasattr(node_mgr.derived_nodes.get(param_name),
+                    'airport_coordinates')]
+
+
+def _defer_airport_nodes(node_mgr, process_order, params):
+    '''
+    Move nodes which look up airports to just before the first node which
+    depends upon them so that the airports of as many nodes as possible are
+    looked up together (see _prefetch_airports). The dependencies of each
+    node are processed before its original position so the order remains
+    valid.
+
+    :param process_order: Node names in the order they will be processed.
+    :type process_order: [str]
+    :returns: Node names in the order they will be processed.
+    :rtype: [str]
+    '''
+    airport_nodes = _airport_nodes(node_mgr, process_order, params)
+    if not airport_nodes:
+        return process_order
+    deferred = set(airport_nodes)
+    order = [name for name in process_order if name not in deferred]
+    # later nodes first so that airport nodes which depend upon earlier
+    # airport nodes are placed before them
+    for param_name in reversed(airport_nodes):
+        index = len(order)
+        for position, name in enumerate(order):
+            node_class = node_mgr.derived_nodes.get(name)
+            if (node_class is not None and name not in node_mgr.hdf_keys and
+                    param_name in node_class.get_dependency_names()):
+                index = position
+                break
+        order.insert(index, param_name)
+    return order
+
+
+def _derive_parameters(hdf, node_mgr, process_order, params, force,
+                       prefetcher, writer):
+    '''
+    Derives parameters in process_order (see derive_parameters).
+
+    :param prefetcher: Reads HDF dependencies of upcoming nodes in the
+        background.
+    :type prefetcher: ParameterPrefetcher or None
+    :param writer: Writes derived parameters to the HDF file in the
+        background.
+    :type writer: ParameterWriter or None
+    '''
     # OPT: local lookup is faster than module-level (small).
     node_subclasses = NODE_SUBCLASSES
     
@@ -124,8 +337,12 @@ def derive_parameters(hdf, node_mgr, process_order, params=None, force=False):
     # cache of nodes to avoid repeated array alignment
     cache = {} if NODE_CACHE else None
     duration = hdf.duration
+    # nodes which look up airports near coordinates
+    airport_nodes = _airport_nodes(node_mgr, process_order, params)
 
-    for param_name in process_order:
+    for index, param_name in enumerate(process_order):
+        if prefetcher:
+            prefetcher.advance(index)
         if param_name in node_mgr.hdf_keys:
             continue
         
@@ -152,27 +369,15 @@ def derive_parameters(hdf, node_mgr, process_order, params=None, force=False):
         #NB raises KeyError if Node is "unknown"
         node_class = node_mgr.derived_nodes[param_name]
 
+        if param_name in airport_nodes:
+            # look up airports for all nodes of the flight at once
+            _prefetch_airports(hdf, node_mgr, process_order, index,
+                               airport_nodes, params, cache, prefetcher,
+                               writer)
+
         # build ordered dependencies
-        deps = []
-        node_deps = node_class.get_dependency_names()
-        for dep_name in node_deps:
-            if dep_name in params:  # already calculated KPV/KTI/Phase
-                deps.append(params[dep_name])
-            elif node_mgr.get_attribute(dep_name) is not None:
-                deps.append(node_mgr.get_attribute(dep_name))
-            elif dep_name in node_mgr.hdf_keys:
-                # LFL/Derived parameter
-                # all parameters (LFL or other) need get_aligned which is
-                # available on DerivedParameterNode
-                try:
-                    dp = derived_param_from_hdf(hdf.get_param(
-                        dep_name, valid_only=True), cache=cache)
-                except KeyError:
-                    # Parameter is invalid.
-                    dp = None
-                deps.append(dp)
-            else:  # dependency not available
-                deps.append(None)
+        deps = _get_dependencies(hdf, node_mgr, node_class, params, cache,
+                                 prefetcher, writer)
         if all([d is None for d in deps]):
             raise RuntimeError(
                 "No dependencies available - Nodes cannot "
@@ -296,7 +501,11 @@ def derive_parameters(hdf, node_mgr, process_order, params=None, force=False):
                                                        expected_length,
                                                        array_length))
 
-            hdf.set_param(node)
+            if writer:
+                writer.put(node)
+            else:
+                hdf.set_param(node)
+            invalidate_cached_slices(cache, param_name)
             # Keep hdf_keys up to date.
             node_mgr.hdf_keys.append(param_name)
         elif issubclass(node.node_type, ApproachNode):
@@ -358,7 +567,7 @@ def parse_analyser_profiles(analyser_profiles, filter_modules=None):
 def process_flight(segment_info, tail_number, aircraft_info={}, achieved_flight_record={},
                    requested=[], required=[], include_flight_attributes=True,
                    additional_modules=[], pre_flight_kwargs={}, force=False,
-                   initial={}, reprocess=False):
+                   initial={}, reprocess=False, changed=None, sidecar=None):
     '''
     Processes the HDF file (segment_info['File']) to derive the required_params (Nodes)
     within python modules (settings.NODE_MODULES).
@@ -389,6 +598,11 @@ def process_flight(segment_info, tail_number, aircraft_info={}, achieved_flight_
     :param initial: Initial content for nodes to avoid reprocessing (excluding parameter nodes which are saved to the hdf).
     :type initial: dict
     :param reprocess: Force reprocessing of all Nodes (including derived Nodes already saved to the HDF file).
+    :type reprocess: bool
+    :param changed: Names of Nodes which have changed (e.g. following a release). Only these Nodes and the Nodes which depend upon them are derived again; all other derived parameters are loaded from the HDF file and all other Nodes are sourced from initial.
+    :type changed: [str] or None
+    :param sidecar: Path to a sidecar HDF file which derived parameters and attributes are written to. The HDF file (segment_info['File']) is opened read-only and not modified.
+    :type sidecar: str or None
 
     :returns: See below:
     :rtype: Dict
@@ -399,6 +613,7 @@ def process_flight(segment_info, tail_number, aircraft_info={}, achieved_flight_
         'File':  # Path to HDF5 file to process
         'Start Datetime':  # Datetime of the origin of the data (at index 0)
         'Segment Type': # segment type obtained from split segments e.g. START_AND_STOP
+        'Slice':  # Optional slice in seconds of a virtual segment within 'File' (requires sidecar)
     }
 
     Sample aircraft_info
@@ -584,13 +799,28 @@ def process_flight(segment_info, tail_number, aircraft_info={}, achieved_flight_
                 ['analysis_engine.flight_attribute']).keys())))
     
     initial = process_flight_to_nodes(initial)
-    for node_name in requested:
-        initial.pop(node_name, None)
+    if changed is None:
+        for node_name in requested:
+            initial.pop(node_name, None)
 
     # open HDF for reading
-    with hdf_file(hdf_path) as hdf:
+    with open_hdf(hdf_path, sidecar_path=sidecar,
+                  segment_slice=segment_info.get('Slice')) as hdf:
         hdf.start_datetime = segment_info['Start Datetime']
-        param_names = hdf.valid_lfl_param_names() if reprocess else hdf.valid_param_names()
+        if reprocess:
+            param_names = hdf.valid_lfl_param_names()
+        elif changed:
+            # Stored parameters which depend upon the changed nodes are
+            # derived again, including by the pre-processing nodes.
+            all_nodes = dict(derived_nodes)
+            all_nodes.update(
+                get_derived_nodes(settings.PRE_PROCESSING_MODULE_PATHS))
+            affected = dependent_nodes(dependency_graph(all_nodes), changed)
+            affected.update(changed)
+            param_names = [n for n in hdf.valid_param_names()
+                           if n not in affected]
+        else:
+            param_names = hdf.valid_param_names()
         hook = hooks.PRE_FLIGHT_ANALYSIS
         if hook:
             logger.info("Performing PRE_FLIGHT_ANALYSIS action '%s' with options: %s",
@@ -605,27 +835,41 @@ def process_flight(segment_info, tail_number, aircraft_info={}, achieved_flight_
                                aircraft_info, achieved_flight_record, force=force)
 
         # Track nodes.
-        param_names = hdf.valid_lfl_param_names() if reprocess else hdf.valid_param_names()
+        if changed is not None:
+            # Build the complete dependency tree from the parameters which
+            # are available before derivation (LFL and pre-processed
+            # parameters) so that derived parameters stored within the HDF
+            # file are linked to their dependencies.
+            lfl_names = set(hdf.valid_lfl_param_names())
+            param_names = [n for n in hdf.valid_param_names()
+                           if n in lfl_names or n not in derived_nodes]
+        else:
+            param_names = hdf.valid_lfl_param_names() if reprocess else hdf.valid_param_names()
         node_mgr = NodeManager(
             segment_info, hdf.duration, param_names,
             requested, required, derived_nodes, aircraft_info,
             achieved_flight_record)
         # calculate dependency tree
         process_order, gr_st = dependency_order(node_mgr, draw=False)
+        if changed is not None:
+            affected = dependent_nodes(gr_st, changed)
+            logger.info("Deriving %d of %d nodes affected by changes to: %s",
+                        len(affected), len(process_order), sorted(changed))
+            for node_name in affected:
+                initial.pop(node_name, None)
+            # Unaffected derived parameters are loaded from the HDF file.
+            stored_names = set(hdf.valid_param_names()) - set(param_names)
+            node_mgr.hdf_keys.extend(
+                n for n in process_order
+                if n in stored_names and n not in affected)
         if settings.CACHE_PARAMETER_MIN_USAGE:
-            # find params used more than
-            for node in gr_st.nodes():
-                if node in node_mgr.derived_nodes:
-                    # this includes KPV/KTIs but they'll be ignored by HDF
-                    qty = len(gr_st.predecessors(node))
-                    if qty > settings.CACHE_PARAMETER_MIN_USAGE:
-                        hdf.cache_param_list.append(node)
-            logging.info("HDF set to cache parameters: %s",
-                         hdf.cache_param_list)
-
-        # derive parameters
-        ktis, kpvs, sections, approaches, flight_attrs = \
-            derive_parameters(hdf, node_mgr, process_order, params=initial, force=force)
+            logger.warning("CACHE_PARAMETER_MIN_USAGE is deprecated and has "
+                           "no effect. HDF dependencies are prefetched "
+                           "instead, see PREFETCH_LOOKAHEAD.")
+        # derive parameters, sharing airport lookups between nodes
+        with flight_geodata():
+            ktis, kpvs, sections, approaches, flight_attrs = \
+                derive_parameters(hdf, node_mgr, process_order, params=initial, force=force)
 
         # geo locate KTIs
         ktis = geo_locate(hdf, ktis)
@@ -703,6 +947,10 @@ def main():
                         help='Type of segment.')
     parser.add_argument('--strip', default=False, action='store_true',
                         help='Strip the HDF5 file to only the LFL parameters')
+    help = 'Write derived parameters to a sidecar HDF5 file rather than ' \
+        'to a copy of the file.'
+    parser.add_argument('--sidecar', default=False, action='store_true',
+                        help=help)
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                         help='Verbose logging')
 
@@ -753,6 +1001,10 @@ def main():
     
     parser.add_argument('-initial', dest='initial', type=str,
                         help='Path to initial nodes in json format.')
+    help = 'Changed nodes. Only these nodes and the nodes which depend ' \
+        'upon them are derived again.'
+    parser.add_argument('-changed', dest='changed', type=str, nargs='+',
+                        default=None, help=help)
     
 
     args = parser.parse_args()
@@ -802,10 +1054,18 @@ def main():
         aircraft_info['Engine Type'] = args.engine_type
 
     # Derive parameters to new HDF
-    hdf_copy = copy_file(args.file, postfix='_process')
-    if args.strip:
-        with hdf_file(hdf_copy) as hdf:
-            hdf.delete_params(hdf.derived_keys())
+    if args.sidecar:
+        hdf_path = args.file
+        root, ext = os.path.splitext(args.file)
+        output_path = sidecar_path = root + '_process' + ext
+        if args.strip and os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+    else:
+        hdf_path = output_path = copy_file(args.file, postfix='_process')
+        sidecar_path = None
+        if args.strip:
+            with hdf_file(hdf_path) as hdf:
+                hdf.delete_params(hdf.derived_keys())
     
     if args.initial:
         if not os.path.exists(args.initial):
@@ -815,31 +1075,32 @@ def main():
         initial = {}
 
     segment_info = {
-        'File': hdf_copy,
+        'File': hdf_path,
         'Segment Type': args.segment_type,
     }
     res = process_flight(
         segment_info, args.tail_number, aircraft_info=aircraft_info,
         requested=args.requested, required=args.required, initial=initial,
-        include_flight_attributes=False,
+        include_flight_attributes=False, changed=args.changed,
+        sidecar=sidecar_path,
     )
     # Flatten results.
     res = {k: list(itertools.chain.from_iterable(six.itervalues(v)))
            for k, v in six.iteritems(res)}
     
-    logger.info("Derived parameters stored in hdf: %s", hdf_copy)
+    logger.info("Derived parameters stored in hdf: %s", output_path)
     # Write CSV file
     if not args.disable_csv:
-        csv_dest = os.path.splitext(hdf_copy)[0] + '.csv'
-        csv_flight_details(hdf_copy, res['kti'], res['kpv'], res['phases'],
-                           dest_path=csv_dest)
+        csv_dest = os.path.splitext(output_path)[0] + '.csv'
+        csv_flight_details(hdf_path, res['kti'], res['kpv'], res['phases'],
+                           dest_path=csv_dest, sidecar_path=sidecar_path)
         logger.info("KPV, KTI and Phases writen to csv: %s", csv_dest)
     # Write KML file
     if not args.disable_kml:
-        kml_dest = os.path.splitext(hdf_copy)[0] + '.kml'
+        kml_dest = os.path.splitext(output_path)[0] + '.kml'
         dest = track_to_kml(
-            hdf_copy, res['kti'], res['kpv'], res['approach'],
-            dest_path=kml_dest)
+            hdf_path, res['kti'], res['kpv'], res['approach'],
+            dest_path=kml_dest, sidecar_path=sidecar_path)
         if dest:
             logger.info("Flight Track with attributes writen to kml: %s", dest)
 
@@ -50,6 +50,17 @@ PRE_PROCESSING_MODULE_PATHS = [ # Cant end with _MODULES as will be added to NOD
 API_HTTP_HANDLER = 'analysis_engine.api_handler.HTTPHandler'
 API_HTTP_BASE_URL = None
 
+# Time in seconds that responses of the HTTP API Handler's aircraft and
+# airport lookups are cached for. 0 disables caching.
+API_HTTP_CACHE_TTL = 24 * 60 * 60
+# Path of an SQLite database which cached responses are shared through
+# between processes. None only caches responses within the process.
+API_HTTP_CACHE_PATH = None
+# Maximum number of responses held in memory by the HTTP API Handler's cache
+# within each process, discarding the least recently used. None is
+# unbounded.
+API_HTTP_CACHE_SIZE = 4096
+
 API_FILE_HANDLER = 'analysis_engine.api_handler.FileHandler'
 API_FILE_PATHS = {
     'aircraft': os.path.join(_path, 'config', 'aircraft.yaml'),
@@ -58,14 +69,40 @@ API_FILE_PATHS = {
     'exports': os.path.join(_path, 'config', 'exports.yaml'),
 }
 
+# Directory that compiled indexes of the File API Handler's YAML files are
+# written to. None writes each index alongside its YAML file.
+API_FILE_INDEX_DIR = None
+
 API_HANDLER = API_FILE_HANDLER
 
+# Maximum distance in metres of airports returned by the File API Handler's
+# nearest airport lookup. None returns all airports, e.g. 100000 limits the
+# airports to those within 100 km.
+NEAREST_AIRPORT_MAX_DISTANCE = None
+
 # User's home directory, override in analyser_custom_settings.py
 WORKING_DIR = os.path.expanduser('~')
 
-# Cache parameters which are used more than n times in HDF
+# Deprecated: HDF dependencies used by several nodes are prefetched rather
+# than cached by the HDF file (see PREFETCH_LOOKAHEAD). Kept so that custom
+# settings which set it can still be imported; non-zero values log a warning.
 CACHE_PARAMETER_MIN_USAGE = 0
 
+# Number of nodes ahead within the process order whose HDF dependencies are
+# read on a background thread during processing. 0 disables prefetching.
+PREFETCH_LOOKAHEAD = 10
+
+# Maximum size in bytes of prefetched parameter arrays held in memory.
+PREFETCH_MEMORY_LIMIT = 512 * 1024 ** 2
+
+# Maximum number of derived parameters waiting to be written to the HDF file
+# by a background thread during processing. 0 writes parameters immediately.
+WRITE_QUEUE_SIZE = 10
+
+# Maximum number of segments split from raw HDF files by the background stage
+# of an ingest pipeline waiting to be processed.
+INGEST_QUEUE_SIZE = 4
+
 
 ##############################################################################
 # Segment Splitting
@@ -79,6 +116,18 @@ ROTOR_MINIMUM_SPLIT_DURATION = 4
 # Minimum duration of a fast airspeed to splt into a segment.
 MINIMUM_FAST_DURATION = 60
 
+# Segments of source files up to this size in bytes are built in memory and
+# written to disk once complete. Each segment file image is held in memory
+# until the segment is written, so this is disabled (0) by default and should
+# only be enabled where memory allows, e.g. 64 * 1024 ** 2.
+SEGMENT_FILE_IMAGE_LIMIT = 0
+
+# Duration in seconds of the windows in which the parameters used to split
+# very long recordings into segments are read. Memory use is then bounded by
+# the window duration rather than the duration of the recording at the cost of
+# reading the split parameters twice. If None, whole parameters are read.
+SPLIT_WINDOW_DURATION = None
+
 # When the average normalised value of selected parameters drops below this
 # value, a flight split can be made.
 MINIMUM_SPLIT_PARAM_VALUE = 0.175
@@ -105,6 +154,11 @@ NODE_CACHE = True
 # accurate to. A value of None will retain full accuracy.
 NODE_CACHE_OFFSET_DP = None
 
+# Lazy parameter loading determines whether the arrays of dependencies stored
+# within the HDF file are only loaded when they are accessed. Dependencies
+# whose aligned copies are already in the node cache will not be loaded.
+LAZY_PARAMETER_LOADING = True
+
 
 ##############################################################################
 # Parameter Analysis
@@ -238,6 +292,16 @@ CONTROLS_IN_USE_TOLERANCE = 1
 # Pilot in control - difference between each control force as a ratio
 CONTROL_COLUMN_IN_USE_RATIO = 1.30  # %
 
+# Maximum number of grid point declinations cached by magnetic_declination
+# within each process before the cache is cleared.
+DECLINATION_CACHE_SIZE = 100000
+
+# Maximum number of times magnetic_declination halves the latitude and
+# longitude resolution of its grid towards the poles. The resolution is
+# halved each time the cosine of the latitude halves, so 6 levels reach
+# within about 1 degree of the poles.
+DECLINATION_GRID_LEVELS = 6
+
 # Change in altitude to create a Descent Low Climb phase, from which
 # approaches, go-around and touch-and-go phases and instances derive.
 DESCENT_LOW_CLIMB_THRESHOLD = 500 #ft
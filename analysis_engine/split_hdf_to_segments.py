@@ -3,17 +3,21 @@
 
 from __future__ import print_function
 
+import h5py
 import os
 import logging
 import pytz
 import numpy as np
 
 from datetime import datetime, timedelta
+from hashlib import sha256
 from dateutil.relativedelta import relativedelta
-from math import floor
+from math import ceil, floor
 
 from analysis_engine import hooks, settings
 from analysis_engine.datastructures import Segment
+from analysis_engine.hdf_io import (segment_bounds, SegmentView,
+                                    slice_segment_param)
 from analysis_engine.node import P
 from analysis_engine.library import (align,
                                      blend_parameters,
@@ -27,13 +31,11 @@ from analysis_engine.library import (align,
                                      runs_of_ones,
                                      slices_remove_small_gaps,
                                      slices_remove_small_slices,
-                                     straighten_headings,
-                                     vstack_params)
+                                     straighten_headings)
 
 from hdfaccess.file import hdf_file
-from hdfaccess.utils import segment_boundaries, write_segment
+from hdfaccess.utils import segment_boundaries
 
-from flightdatautilities.filesystem_tools import sha_hash_file
 
 
 logger = logging.getLogger(name=__name__)
@@ -47,6 +49,61 @@ class TimebaseError(ValueError):
     pass
 
 
+# Parameters kept in memory while writing segments to calculate segment info.
+SEGMENT_INFO_PARAMETERS = ('Airspeed', 'Nr', 'Nr (1)', 'Nr (2)',
+                           'Year', 'Month', 'Day', 'Hour', 'Minute', 'Second')
+
+# Engine parameters averaged to determine whether the engines are running.
+ENG_SPLIT_PARAMETERS = (
+    'Eng (1) N1', 'Eng (2) N1', 'Eng (3) N1', 'Eng (4) N1',
+    'Eng (1) N2', 'Eng (2) N2', 'Eng (3) N2', 'Eng (4) N2',
+    'Eng (1) Np', 'Eng (2) Np', 'Eng (3) Np', 'Eng (4) Np',
+    'Eng (1) Fuel Flow', 'Eng (2) Fuel Flow', 'Eng (3) Fuel Flow', 'Eng (4) Fuel Flow'
+)
+
+# Parameters normalised and averaged to find splits between segments.
+NORMALISED_SPLIT_PARAMETERS = ENG_SPLIT_PARAMETERS + (
+    'Groundspeed', 'Groundspeed (1)', 'Groundspeed (2)')
+
+# Split parameters are read in windows starting at superframe boundaries with
+# a superframe either side (see _WindowedSplitParameters).
+SPLIT_WINDOW_MARGIN = 64
+
+
+class SegmentParameters(dict):
+    '''
+    In-memory parameters of a segment used to calculate segment info without
+    reading the segment's HDF file. content_hash is the hash of the segment's
+    SEGMENT_INFO_PARAMETERS (see segment_content_hash).
+    '''
+    def __init__(self, duration, content_hash=None, timebase=None):
+        self.duration = duration
+        self.content_hash = content_hash
+        # (speed, thresholds, start_datetime) if the start datetime was
+        # written to the segment's HDF file by write_segments.
+        self.timebase = timebase
+
+
+def segment_content_hash(params):
+    '''
+    Hash of the data of a segment's SEGMENT_INFO_PARAMETERS which identifies
+    segments which do not go fast. The hash is the same whether the segment
+    was written to a new HDF file or is a virtual segment.
+
+    :param params: The segment's parameters, e.g. an hdf_file or
+        SegmentParameters.
+    :type params: mapping of str to Parameter
+    :rtype: str
+    '''
+    content_hash = sha256()
+    for name in SEGMENT_INFO_PARAMETERS:
+        if name not in params:
+            continue
+        content_hash.update(name.encode('utf-8'))
+        content_hash.update(np.ascontiguousarray(params[name].array.data))
+    return content_hash.hexdigest()
+
+
 def validate_aircraft(aircraft_info, hdf):
     """
     """
@@ -63,7 +120,8 @@ def validate_aircraft(aircraft_info, hdf):
 def _segment_type_and_slice(speed_array, speed_frequency,
                             heading_array, heading_frequency,
                             start, stop, eng_arrays,
-                            aircraft_info, thresholds, hdf):
+                            aircraft_info, thresholds, hdf,
+                            split_params=None):
     """
     Uses the Heading to determine whether the aircraft moved about at all and
     the airspeed to determine if it was a full or partial flight.
@@ -96,15 +154,24 @@ def _segment_type_and_slice(speed_array, speed_frequency,
     * 'START_ONLY'
     * 'STOP_ONLY'
     * 'MID_FLIGHT'
+
+    If split_params are provided, the change of heading is calculated from
+    the split parameters' windows (see
+    _WindowedSplitParameters.heading_change) rather than from heading_array
+    and eng_arrays.
     """
 
-    speed_start = start * speed_frequency
-    speed_stop = stop * speed_frequency
+    speed_start = int(start * speed_frequency)
+    speed_stop = int(stop * speed_frequency)
     speed_array = speed_array[speed_start:speed_stop]
 
-    heading_start = start * heading_frequency
-    heading_stop = stop * heading_frequency
-    heading_array = heading_array[heading_start:heading_stop]
+    if split_params is None:
+        heading_start = int(start * heading_frequency)
+        heading_stop = int(stop * heading_frequency)
+        heading_array = heading_array[heading_start:heading_stop]
+        has_eng_params = eng_arrays is not None
+    else:
+        has_eng_params = bool(split_params.eng_names)
 
     # remove small gaps between valid data, e.g. brief data spikes
     unmasked_slices = slices_remove_small_gaps(
@@ -147,9 +214,15 @@ def _segment_type_and_slice(speed_array, speed_frequency,
             # We have seeen 12-second spurious gog='Air' signals during rotor rundown. Hence increased limit.
             did_move = slices_remove_small_slices(np.ma.clump_masked(gog_test),
                                                   time_limit=30, hz=gog.frequency)
+        elif split_params is not None:
+            hdiff = split_params.heading_change(start, stop, engines=False)
+            did_move = hdiff > settings.HEADING_CHANGE_TAXI_THRESHOLD
         else:
             hdiff = np.ma.abs(np.ma.diff(heading_array)).sum()
             did_move = hdiff > settings.HEADING_CHANGE_TAXI_THRESHOLD
+    elif split_params is not None:
+        hdiff = split_params.heading_change(start, stop)
+        did_move = hdiff > settings.HEADING_CHANGE_TAXI_THRESHOLD
     else:
         # Check Heading change for fixed wing.
         if eng_arrays is not None:
@@ -157,7 +230,7 @@ def _segment_type_and_slice(speed_array, speed_frequency,
         hdiff = np.ma.abs(np.ma.diff(heading_array)).sum()
         did_move = hdiff > settings.HEADING_CHANGE_TAXI_THRESHOLD
 
-    if not did_move or (not fast_for_long and eng_arrays is None):
+    if not did_move or (not fast_for_long and not has_eng_params):
         # added check for not fast for long and no engine params to avoid
         # lots of Herc ground runs
         logger.debug("Aircraft did not move.")
@@ -195,6 +268,40 @@ def _segment_type_and_slice(speed_array, speed_frequency,
     return segment_type, segment, array_start_secs
 
 
+def _average_arrays(arrays):
+    '''
+    Average masked arrays of equal length, equivalent to
+    np.ma.average(vstack_params(*arrays), axis=0). The arrays are
+    accumulated one at a time so that only the totals and the current array
+    are held in memory rather than all of the stacked arrays, which bounds
+    memory use for very long recordings.
+
+    :param arrays: Masked arrays to average.
+    :type arrays: iterable of np.ma.MaskedArray
+    :returns: Average of the unmasked values at each index or None if there
+        are no arrays.
+    :rtype: np.ma.MaskedArray or None
+    '''
+    total = count = None
+    for array in arrays:
+        filled = np.ma.filled(array, 0)
+        valid = ~np.ma.getmaskarray(array)
+        if total is None:
+            total = filled.copy()
+            count = valid.astype(int)
+            continue
+        if np.result_type(total, filled) == total.dtype:
+            total += filled
+        else:
+            total = total + filled
+        count += valid
+    if total is None:
+        return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average = total * 1. / count
+    return np.ma.array(average, mask=count == 0)
+
+
 def _get_normalised_split_params(hdf):
     '''
     Get split parameters (currently engine power and Groundspeed) from hdf,
@@ -206,39 +313,32 @@ def _get_normalised_split_params(hdf):
         Will return None, None if no split parameters are available.
     :rtype: (None, None) or (np.ma.masked_array, float)
     '''
-    params = []
-    first_split_param = None
-    split_params = (
-        'Eng (1) N1', 'Eng (2) N1', 'Eng (3) N1', 'Eng (4) N1',
-        'Eng (1) N2', 'Eng (2) N2', 'Eng (3) N2', 'Eng (4) N2',
-        'Eng (1) Np', 'Eng (2) Np', 'Eng (3) Np', 'Eng (4) Np',
-        'Eng (1) Fuel Flow', 'Eng (2) Fuel Flow', 'Eng (3) Fuel Flow', 'Eng (4) Fuel Flow',
-        'Groundspeed', 'Groundspeed (1)', 'Groundspeed (2)'
-    )
-    for param_name in split_params:
-        try:
-            param = hdf[param_name]
-        except KeyError:
-            continue
-        if first_split_param:
-            # Align all other parameters to first available.  #Q: Why not force
-            # to 1Hz?
-            param.array = align(param, first_split_param)
-        else:
-            first_split_param = param
-        params.append(param)
+    first_split_params = []
+
+    def normalised_arrays():
+        for param_name in NORMALISED_SPLIT_PARAMETERS:
+            try:
+                param = hdf[param_name]
+            except KeyError:
+                continue
+            if first_split_params:
+                # Align all other parameters to first available.  #Q: Why not force
+                # to 1Hz?
+                array = align(param, first_split_params[0])
+            else:
+                first_split_params.append(param)
+                array = param.array
+            if array.dtype.kind != 'f':
+                array = array.astype(float)
+            # We normalise each in turn to the range 0-1 so they have equal weight
+            yield normalise(array, copy=False)
 
-    if not first_split_param:
-        return None, None
-    # If there is at least one split parameter available.
-    # normalise the parameters we'll use for splitting the data
-    stacked_params = vstack_params(*params)
-    # We normalise each in turn to the range 0-1 so they have equal weight
-    normalised_params = [normalise(i) for i in stacked_params]
     # Using a true minimum leads to bias to a zero value. We take the average
     # to allow each parameter equal weight, then (later) seek the minimum.
-    split_params_min = np.ma.average(normalised_params, axis=0)
-    return split_params_min, first_split_param.frequency
+    split_params_min = _average_arrays(normalised_arrays())
+    if split_params_min is None:
+        return None, None
+    return split_params_min, first_split_params[0].frequency
 
 
 def _get_eng_params(hdf, align_param=None):
@@ -251,33 +351,25 @@ def _get_eng_params(hdf, align_param=None):
         Will return None, None if no split parameters are available.
     :rtype: (None, None) or (np.ma.masked_array, float)
     '''
-    params = []
-
-    eng_params = (
-        'Eng (1) N1', 'Eng (2) N1', 'Eng (3) N1', 'Eng (4) N1',
-        'Eng (1) N2', 'Eng (2) N2', 'Eng (3) N2', 'Eng (4) N2',
-        'Eng (1) Np', 'Eng (2) Np', 'Eng (3) Np', 'Eng (4) Np',
-        'Eng (1) Fuel Flow', 'Eng (2) Fuel Flow', 'Eng (3) Fuel Flow', 'Eng (4) Fuel Flow'
-    )
+    align_params = [align_param] if align_param else []
 
-    for param_name in eng_params:
-        try:
-            param = hdf[param_name]
-        except KeyError:
-            continue
-        if align_param:
-            # Align all other parameters to provided param or first available.
-            param.array = align(param, align_param)
-        else:
-            align_param = param
-        params.append(param)
+    def eng_arrays():
+        for param_name in ENG_SPLIT_PARAMETERS:
+            try:
+                param = hdf[param_name]
+            except KeyError:
+                continue
+            if align_params:
+                # Align all other parameters to provided param or first available.
+                yield align(param, align_params[0])
+            else:
+                align_params.append(param)
+                yield param.array
 
-    if not len(params):
+    split_params_avg = _average_arrays(eng_arrays())
+    if split_params_avg is None:
         return None, None
-    # If there is at least one split parameter available.
-    stacked_params = vstack_params(*params)
-    split_params_avg = np.ma.average(stacked_params, axis=0)
-    return split_params_avg, align_param.frequency
+    return split_params_avg, align_params[0].frequency
 
 
 def _rate_of_turn(heading):
@@ -315,7 +407,8 @@ def _split_on_eng_params(slice_start_secs, slice_stop_secs,
     '''
     slice_start = slice_start_secs * split_params_frequency
     slice_stop = slice_stop_secs * split_params_frequency
-    split_params_slice = slice(np.round(slice_start, 0), np.round(slice_stop, 0))
+    split_params_slice = slice(int(np.round(slice_start, 0)),
+                               int(np.round(slice_stop, 0)))
     split_index, split_value = min_value(split_params_min,
                                          _slice=split_params_slice)
 
@@ -324,7 +417,7 @@ def _split_on_eng_params(slice_start_secs, slice_stop_secs,
 
     matching_indices = np.ma.where(
         split_params_min[split_params_slice] == split_value)[0]
-    split_index = matching_indices[len(matching_indices) / 2] + slice_start
+    split_index = matching_indices[len(matching_indices) // 2] + slice_start
 
     split_index = round(split_index / split_params_frequency)
     return split_index, split_value
@@ -351,11 +444,27 @@ def _split_on_dfc(slice_start_secs, slice_stop_secs, dfc_frequency,
         occur.
     :rtype: int or float or None
     '''
-    dfc_slice = slice(slice_start_secs * dfc_frequency,
-                      floor(slice_stop_secs * dfc_frequency) + 1)
+    dfc_slice = slice(int(slice_start_secs * dfc_frequency),
+                      int(floor(slice_stop_secs * dfc_frequency) + 1))
     unmasked_edges = np.ma.flatnotmasked_edges(dfc_diff[dfc_slice])
     if unmasked_edges is None:
         return None
+    return _dfc_split_index(slice_start_secs, slice_stop_secs, dfc_frequency,
+                            dfc_half_period, unmasked_edges,
+                            eng_split_index=eng_split_index)
+
+
+def _dfc_split_index(slice_start_secs, slice_stop_secs, dfc_frequency,
+                     dfc_half_period, unmasked_edges, eng_split_index=None):
+    '''
+    Split index from the first and last unmasked indices of the 'Frame
+    Counter' diff within the slow slice (see _split_on_dfc).
+
+    :param unmasked_edges: First and last unmasked indices of the diff
+        relative to the start of the slow slice.
+    :type unmasked_edges: np.ndarray
+    :rtype: int or float
+    '''
     unmasked_edges = unmasked_edges.astype(float)
     unmasked_edges /= dfc_frequency
     if eng_split_index:
@@ -393,12 +502,27 @@ def _split_on_rot(slice_start_secs, slice_stop_secs, heading_frequency,
     rot_slice = slice(slice_start_secs * heading_frequency,
                       slice_stop_secs * heading_frequency)
     midpoint = (rot_slice.stop - rot_slice.start) / 2
-    stopped_slices = np.ma.clump_unmasked(rate_of_turn[rot_slice])
+    stopped_slices = np.ma.clump_unmasked(
+        rate_of_turn[int(rot_slice.start):int(rot_slice.stop)])
     if not stopped_slices:
         return
 
     middle_stop = min(stopped_slices, key=lambda s: abs(s.start - midpoint))
+    return _rot_split_index(rot_slice, heading_frequency, middle_stop)
+
 
+def _rot_split_index(rot_slice, heading_frequency, middle_stop):
+    '''
+    Split index half-way within the period of not turning closest to the
+    middle of the slow slice (see _split_on_rot).
+
+    :param rot_slice: Slow slice at the frequency of Heading.
+    :type rot_slice: slice
+    :param middle_stop: Period of not turning relative to the start of the
+        slow slice.
+    :type middle_stop: slice
+    :rtype: int or float
+    '''
     # Split half-way within the stop slice.
     stop_duration = middle_stop.stop - middle_stop.start
     rot_split_index = \
@@ -408,7 +532,477 @@ def _split_on_rot(slice_start_secs, slice_stop_secs, heading_frequency,
     return split_index
 
 
-def split_segments(hdf, aircraft_info):
+def _frame_counter_diff(array):
+    '''
+    Diff of 'Frame Counter' masked where it increments normally so that only
+    jumps are unmasked.
+
+    :param array: 'Frame Counter' array.
+    :type array: np.ma.MaskedArray
+    :rtype: np.ma.MaskedArray
+    '''
+    dfc_diff = np.ma.diff(array)
+    # Mask 'Frame Counter' incrementing by 1.
+    dfc_diff = np.ma.masked_equal(dfc_diff, 1)
+    # Mask 'Frame Counter' overflow where the Frame Counter transitions
+    # from 4095 to 0.
+    # Q: This used to be 4094, are there some Frame Counters which
+    # increment from 1 rather than 0 or something else?
+    dfc_diff = np.ma.masked_equal(dfc_diff, -4095)
+    return dfc_diff
+
+
+class _SplitParameters(object):
+    '''
+    Parameters used to find splits between segments read from the HDF file
+    as whole arrays.
+    '''
+    def __init__(self, hdf):
+        '''
+        :type hdf: hdfaccess.file.hdf_file
+        '''
+        self.hdf = hdf
+        try:
+            # Fetch Heading if available
+            self.heading = hdf.get_param('Heading', valid_only=True)
+        except KeyError:
+            # try Heading True, otherwise fail loudly with a KeyError
+            self.heading = hdf.get_param('Heading True', valid_only=True)
+        self.eng_arrays, _ = _get_eng_params(hdf, align_param=self.heading)
+        self.dfc_frequency = None
+
+    def segment_type_and_slice(self, speed_array, speed_frequency, start,
+                               stop, aircraft_info, thresholds):
+        '''
+        See _segment_type_and_slice.
+        '''
+        return _segment_type_and_slice(
+            speed_array, speed_frequency, self.heading.array,
+            self.heading.frequency, start, stop, self.eng_arrays,
+            aircraft_info, thresholds, self.hdf)
+
+    def prepare(self):
+        '''
+        Read the parameters used to find splits within slow slices.
+        '''
+        self.rate_of_turn = _rate_of_turn(self.heading)
+        self.split_params_min, self.split_params_frequency \
+            = _get_normalised_split_params(self.hdf)
+        if self.hdf.reliable_frame_counter:
+            dfc = self.hdf['Frame Counter']
+            self.dfc_diff = _frame_counter_diff(dfc.array)
+            self.dfc_frequency = dfc.frequency
+
+    def split_on_eng_params(self, slice_start_secs, slice_stop_secs):
+        '''
+        See _split_on_eng_params.
+        '''
+        if self.split_params_min is None:
+            return None, None
+        return _split_on_eng_params(slice_start_secs, slice_stop_secs,
+                                    self.split_params_min,
+                                    self.split_params_frequency)
+
+    def split_on_dfc(self, slice_start_secs, slice_stop_secs,
+                     eng_split_index=None):
+        '''
+        See _split_on_dfc.
+        '''
+        # Gap between difference values.
+        dfc_half_period = (1 / self.dfc_frequency) / 2
+        return _split_on_dfc(slice_start_secs, slice_stop_secs,
+                             self.dfc_frequency, dfc_half_period,
+                             self.dfc_diff, eng_split_index=eng_split_index)
+
+    def split_on_rot(self, slice_start_secs, slice_stop_secs):
+        '''
+        See _split_on_rot.
+        '''
+        return _split_on_rot(slice_start_secs, slice_stop_secs,
+                             self.heading.frequency, self.rate_of_turn)
+
+
+class _WindowedSplitParameters(object):
+    '''
+    Parameters used to find splits between segments read from the HDF file
+    in windows rather than as whole arrays, so that memory use is bounded by
+    the duration of the windows rather than the duration of the recording.
+
+    Windows start at superframe boundaries and are read with a margin of
+    SPLIT_WINDOW_MARGIN seconds either side which is trimmed after alignment
+    and rates of change so that each window matches the same part of the
+    whole arrays. The maxima used to normalise the split parameters are
+    found by reading all of their windows once before splitting. Masked
+    sections of Heading which extend beyond the margin are repaired by
+    extending the window to the nearest valid samples. Heading is
+    straightened within each window so the rate of turn may differ from
+    whole arrays by floating point rounding.
+    '''
+    def __init__(self, hdf, window):
+        '''
+        :type hdf: hdfaccess.file.hdf_file
+        :param window: Duration of the windows in seconds which is rounded up
+            to a multiple of SPLIT_WINDOW_MARGIN.
+        :type window: int or float
+        '''
+        self.hdf = hdf
+        self.duration = hdf.duration
+        self.window = int(max(ceil(window / float(SPLIT_WINDOW_MARGIN)), 1)) \
+            * SPLIT_WINDOW_MARGIN
+        self.heading_name = 'Heading'
+        try:
+            heading, _ = self._read(self.heading_name, 0, 0, valid_only=True)
+        except KeyError:
+            # try Heading True, otherwise fail loudly with a KeyError
+            self.heading_name = 'Heading True'
+            heading, _ = self._read(self.heading_name, 0, 0, valid_only=True)
+        # Engine parameters are aligned to Heading.
+        self.heading = P(heading.name, frequency=heading.frequency,
+                         offset=heading.offset)
+        self.eng_names = [n for n in ENG_SPLIT_PARAMETERS if n in hdf]
+        self.split_names = [n for n in NORMALISED_SPLIT_PARAMETERS
+                            if n in hdf]
+        self.split_params_frequency = None
+        self.dfc_frequency = None
+        self._maxima = None
+        self._straightened = False
+        self._cache = {}
+
+    def _read(self, name, start, stop, valid_only=False):
+        '''
+        Read a parameter between start and stop seconds with a margin either
+        side.
+
+        :returns: The parameter and the start of its array in seconds.
+        :rtype: (Parameter, int or float)
+        '''
+        start = max(start - SPLIT_WINDOW_MARGIN, 0)
+        stop = min(stop + SPLIT_WINDOW_MARGIN, self.duration)
+        param = self.hdf.get_param(name, valid_only=valid_only,
+                                   _slice=slice(start, stop))
+        return param, start
+
+    def _trim(self, array, frequency, array_start, window_start):
+        '''
+        Trim the margins from an array read for the window starting at
+        window_start seconds.
+        '''
+        start = int((window_start - array_start) * frequency)
+        return array[start:start + int(self.window * frequency)]
+
+    def _window(self, read, window_start):
+        '''
+        Read a window, caching the most recent window of each kind as
+        windows are usually read in order.
+
+        :param read: Method reading the window starting at window_start.
+        :type read: callable
+        '''
+        cached = self._cache.get(read.__name__)
+        if cached is None or cached[0] != window_start:
+            cached = (window_start, read(window_start))
+            self._cache[read.__name__] = cached
+        return cached[1]
+
+    def _windows(self, get_window, frequency, start, stop):
+        '''
+        Parts of the windows of an array between the start and stop indices.
+
+        :param get_window: Returns the array within the window starting at
+            the given number of seconds.
+        :type get_window: callable
+        :param frequency: Frequency of the array.
+        :type frequency: int or float
+        :returns: Offsets of the parts relative to start along with the
+            parts.
+        :rtype: iterator of (int, np.ma.MaskedArray)
+        '''
+        window_start = int(start / frequency // self.window * self.window)
+        while window_start < self.duration:
+            offset = int(window_start * frequency)
+            if offset >= stop:
+                break
+            array = get_window(window_start)
+            part_start = max(start, offset)
+            part_stop = min(stop, offset + len(array))
+            if part_start < part_stop:
+                yield (part_start - start,
+                       array[part_start - offset:part_stop - offset])
+            window_start += self.window
+
+    def _split_param_arrays(self, window_start):
+        '''
+        Split parameters within a window as float arrays aligned to the first
+        available split parameter (see _get_normalised_split_params).
+
+        :rtype: iterator of np.ma.MaskedArray
+        '''
+        window_stop = window_start + self.window
+        first, array_start = self._read(self.split_names[0], window_start,
+                                        window_stop)
+        for param_name in self.split_names:
+            if param_name == first.name:
+                array = first.array
+            else:
+                param, _ = self._read(param_name, window_start, window_stop)
+                array = align(param, first)
+            if array.dtype.kind != 'f':
+                array = array.astype(float)
+            yield self._trim(array, first.frequency, array_start,
+                             window_start)
+
+    def _read_split_params(self, window_start):
+        '''
+        Average of the normalised split parameters within a window.
+        '''
+        def normalised_arrays():
+            for index, array in enumerate(
+                    self._split_param_arrays(window_start)):
+                # normalise by the maximum of the whole array without
+                # modifying the array read
+                yield array * (1.0 / self._maxima[index])
+
+        return _average_arrays(normalised_arrays())
+
+    def _read_eng_params(self, window_start):
+        '''
+        Average of the engine parameters within a window aligned to Heading
+        (see _get_eng_params).
+        '''
+        window_stop = window_start + self.window
+
+        def eng_arrays():
+            for param_name in self.eng_names:
+                param, array_start = self._read(param_name, window_start,
+                                                window_stop)
+                yield self._trim(align(param, self.heading),
+                                 self.heading.frequency, array_start,
+                                 window_start)
+
+        return _average_arrays(eng_arrays())
+
+    def _read_heading(self, window_start):
+        '''
+        Heading within a window along with the rate of turn once prepared, in
+        which case Heading is straightened and repaired (see _rate_of_turn).
+
+        :rtype: (np.ma.MaskedArray, np.ma.MaskedArray or None)
+        '''
+        start = window_start
+        stop = window_start + self.window
+        while True:
+            heading, array_start = self._read(self.heading_name, start, stop,
+                                              valid_only=True)
+            frequency = heading.frequency
+            if not self._straightened:
+                return (self._trim(heading.array, frequency, array_start,
+                                   window_start), None)
+            # Masked sections are repaired from the nearest valid samples.
+            mask = np.ma.getmaskarray(heading.array)
+            extend_start = mask[0] and array_start > 0
+            extend_stop = mask[-1] and \
+                stop + SPLIT_WINDOW_MARGIN < self.duration
+            if not (extend_start or extend_stop):
+                break
+            if extend_start:
+                start -= self.window
+            if extend_stop:
+                stop += self.window
+        rate_of_turn = _rate_of_turn(heading)
+        return (self._trim(heading.array, frequency, array_start,
+                           window_start),
+                self._trim(rate_of_turn, frequency, array_start,
+                           window_start))
+
+    def _read_dfc_diff(self, window_start):
+        '''
+        'Frame Counter' diff within a window (see _frame_counter_diff).
+        '''
+        dfc, array_start = self._read('Frame Counter', window_start,
+                                      window_start + self.window)
+        return self._trim(_frame_counter_diff(dfc.array), dfc.frequency,
+                          array_start, window_start)
+
+    def _heading_window(self, window_start):
+        return self._window(self._read_heading, window_start)[0]
+
+    def _engine_heading_window(self, window_start):
+        heading = self._heading_window(window_start)
+        if not self.eng_names:
+            return heading
+        eng_arrays = self._window(self._read_eng_params, window_start)
+        return np.ma.masked_where(eng_arrays < settings.MIN_FAN_RUNNING,
+                                  heading)
+
+    def _rate_of_turn_window(self, window_start):
+        return self._window(self._read_heading, window_start)[1]
+
+    def _split_params_window(self, window_start):
+        return self._window(self._read_split_params, window_start)
+
+    def _dfc_diff_window(self, window_start):
+        return self._window(self._read_dfc_diff, window_start)
+
+    def segment_type_and_slice(self, speed_array, speed_frequency, start,
+                               stop, aircraft_info, thresholds):
+        '''
+        See _segment_type_and_slice.
+        '''
+        return _segment_type_and_slice(
+            speed_array, speed_frequency, None, None, start, stop, None,
+            aircraft_info, thresholds, self.hdf, split_params=self)
+
+    def heading_change(self, start, stop, engines=True):
+        '''
+        Sum of the absolute changes of heading between start and stop
+        seconds (see _segment_type_and_slice).
+
+        :param engines: Only include changes of heading while the engines
+            are running.
+        :type engines: bool
+        :rtype: float or np.ma.masked
+        '''
+        frequency = self.heading.frequency
+        get_window = \
+            self._engine_heading_window if engines else self._heading_window
+        hdiff = np.ma.masked
+        previous = None
+        for _, heading in self._windows(get_window, frequency,
+                                        int(start * frequency),
+                                        int(stop * frequency)):
+            if previous is not None:
+                # include the change between windows
+                heading = np.ma.concatenate([previous, heading])
+            change = np.ma.abs(np.ma.diff(heading)).sum()
+            if change is not np.ma.masked:
+                hdiff = change if hdiff is np.ma.masked else hdiff + change
+            previous = heading[-1:]
+        return hdiff
+
+    def prepare(self):
+        '''
+        Find the maxima used to normalise the split parameters by reading all
+        of their windows (see _get_normalised_split_params).
+        '''
+        self._straightened = True
+        self._cache.clear()
+        if self.split_names:
+            first, _ = self._read(self.split_names[0], 0, 0)
+            self.split_params_frequency = first.frequency
+            self._maxima = [np.ma.masked] * len(self.split_names)
+            window_start = 0
+            while window_start < self.duration:
+                for index, array in enumerate(
+                        self._split_param_arrays(window_start)):
+                    maximum = array.max()
+                    if maximum is np.ma.masked:
+                        continue
+                    if (self._maxima[index] is np.ma.masked or
+                            maximum > self._maxima[index]):
+                        self._maxima[index] = maximum
+                window_start += self.window
+        if self.hdf.reliable_frame_counter:
+            dfc, _ = self._read('Frame Counter', 0, 0)
+            self.dfc_frequency = dfc.frequency
+
+    def split_on_eng_params(self, slice_start_secs, slice_stop_secs):
+        '''
+        See _split_on_eng_params.
+        '''
+        if not self.split_names:
+            return None, None
+        frequency = self.split_params_frequency
+        slice_start = slice_start_secs * frequency
+        slice_stop = slice_stop_secs * frequency
+        start = int(np.round(slice_start, 0))
+        stop = int(np.round(slice_stop, 0))
+
+        # Find the minimum and the number of indices with the minimum.
+        split_value = None
+        count = 0
+        for _, array in self._windows(self._split_params_window, frequency,
+                                      start, stop):
+            if not np.ma.count(array):
+                continue
+            value = np.ma.min(array)
+            if split_value is None or value < split_value:
+                split_value = value
+                count = 0
+            if value == split_value:
+                count += len(np.ma.where(array == split_value)[0])
+        if split_value is None:
+            return None, None
+
+        # Split at the middle index with the minimum.
+        index = count // 2
+        for offset, array in self._windows(self._split_params_window,
+                                           frequency, start, stop):
+            matching_indices = np.ma.where(array == split_value)[0]
+            if index < len(matching_indices):
+                split_index = matching_indices[index] + offset + slice_start
+                break
+            index -= len(matching_indices)
+
+        split_index = round(split_index / frequency)
+        return split_index, split_value
+
+    def split_on_dfc(self, slice_start_secs, slice_stop_secs,
+                     eng_split_index=None):
+        '''
+        See _split_on_dfc.
+        '''
+        frequency = self.dfc_frequency
+        start = int(slice_start_secs * frequency)
+        stop = int(floor(slice_stop_secs * frequency) + 1)
+        unmasked_edges = None
+        for offset, array in self._windows(self._dfc_diff_window, frequency,
+                                           start, stop):
+            edges = np.ma.flatnotmasked_edges(array)
+            if edges is None:
+                continue
+            if unmasked_edges is None:
+                unmasked_edges = edges + offset
+            else:
+                unmasked_edges[1] = edges[1] + offset
+        if unmasked_edges is None:
+            return None
+        # Gap between difference values.
+        dfc_half_period = (1 / frequency) / 2
+        return _dfc_split_index(slice_start_secs, slice_stop_secs, frequency,
+                                dfc_half_period, unmasked_edges,
+                                eng_split_index=eng_split_index)
+
+    def split_on_rot(self, slice_start_secs, slice_stop_secs):
+        '''
+        See _split_on_rot.
+        '''
+        frequency = self.heading.frequency
+        rot_slice = slice(slice_start_secs * frequency,
+                          slice_stop_secs * frequency)
+        midpoint = (rot_slice.stop - rot_slice.start) / 2
+        # Periods of not turning are joined across windows while keeping the
+        # one which starts closest to the midpoint.
+        middle_stop = stopped = None
+        for offset, array in self._windows(self._rate_of_turn_window,
+                                           frequency, int(rot_slice.start),
+                                           int(rot_slice.stop)):
+            for stopped_slice in np.ma.clump_unmasked(array):
+                start = stopped_slice.start + offset
+                stop = stopped_slice.stop + offset
+                if stopped is not None and stopped[1] == start:
+                    stopped[1] = stop
+                    continue
+                stopped = [start, stop]
+                if middle_stop is None or \
+                   abs(start - midpoint) < abs(middle_stop[0] - midpoint):
+                    middle_stop = stopped
+        if middle_stop is None:
+            return
+
+        return _rot_split_index(rot_slice, frequency, slice(*middle_stop))
+
+
+def split_segments(hdf, aircraft_info, window=None):
     '''
     TODO: DJ suggested not to use decaying engine oil temperature.
 
@@ -421,20 +1015,26 @@ def split_segments(hdf, aircraft_info):
      superframes
 
     TODO: Use L3UQAR num power ups for difficult cases?
+
+    :param window: Duration in seconds of the windows in which the split
+        parameters are read to bound memory use for very long recordings
+        (see _WindowedSplitParameters). If None, whole parameters are read.
+    :type window: int or float or None
     '''
 
     segments = []
     speed, thresholds = _get_speed_parameter(hdf, aircraft_info)
 
-    # Look for heading first
-    try:
-        # Fetch Heading if available
-        heading = hdf.get_param('Heading', valid_only=True)
-    except KeyError:
-        # try Heading True, otherwise fail loudly with a KeyError
-        heading = hdf.get_param('Heading True', valid_only=True)
+    # Look for heading and engine parameters first
+    if window:
+        split_params = _WindowedSplitParameters(hdf, window)
+    else:
+        split_params = _SplitParameters(hdf)
 
-    eng_arrays, _ = _get_eng_params(hdf, align_param=heading)
+    def segment_type_and_slice(speed_array, start, stop):
+        return split_params.segment_type_and_slice(
+            speed_array, speed.frequency, start, stop, aircraft_info,
+            thresholds)
 
     # Look for speed
     try:
@@ -445,10 +1045,7 @@ def split_segments(hdf, aircraft_info):
         # not go fast.
         logger.warning("speed is entirely masked. The entire contents of "
                        "the data will be a GROUND_ONLY slice.")
-        return [_segment_type_and_slice(
-            speed.array, speed.frequency, heading.array,
-            heading.frequency, 0, hdf.duration, eng_arrays,
-            aircraft_info, thresholds, hdf)]
+        return [segment_type_and_slice(speed.array, 0, hdf.duration)]
 
     speed_secs = len(speed_array) / speed.frequency
 
@@ -461,24 +1058,18 @@ def split_segments(hdf, aircraft_info):
         if split_flags:
             for split_idx in split_flags[0]:
                 split_idx = split_idx / seg_split.frequency
-                segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                                        heading.array, heading.frequency,
-                                                        start, split_idx, eng_arrays,
-                                                        aircraft_info, thresholds, hdf))
+                segments.append(segment_type_and_slice(speed_array, start,
+                                                       split_idx))
                 start = split_idx
                 logger.info("Split Flag found at at index '%d'.", split_idx)
             # Add remaining data to a segment.
-            segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                                    heading.array, heading.frequency,
-                                                    start, speed_secs, eng_arrays,
-                                                    aircraft_info, thresholds, hdf))
+            segments.append(segment_type_and_slice(speed_array, start,
+                                                   speed_secs))
         else:
             # if no split flags use whole file.
             logger.info("'Segment Split' found but no Splits found, using whole file.")
-            segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                                    heading.array, heading.frequency,
-                                                    start, speed_secs, eng_arrays,
-                                                    aircraft_info, thresholds, hdf))
+            segments.append(segment_type_and_slice(speed_array, start,
+                                                   speed_secs))
         return segments
 
     slow_array = np.ma.masked_less_equal(speed_array,
@@ -492,35 +1083,16 @@ def split_segments(hdf, aircraft_info):
                     "single segment comprising all data.", len(speedy_slices))
         # Use the first and last available unmasked values to determine segment
         # type.
-        return [_segment_type_and_slice(
-            speed_array, speed.frequency, heading.array,
-            heading.frequency, 0, speed_secs, eng_arrays,
-            aircraft_info, thresholds, hdf)]
+        return [segment_type_and_slice(speed_array, 0, speed_secs)]
 
     # suppress transient changes in speed around 80 kts
     slow_slices = slices_remove_small_slices(np.ma.clump_masked(slow_array), 10, speed.frequency)
 
-    rate_of_turn = _rate_of_turn(heading)
-
-    split_params_min, split_params_frequency \
-        = _get_normalised_split_params(hdf)
-
-    if hdf.reliable_frame_counter:
-        dfc = hdf['Frame Counter']
-        dfc_diff = np.ma.diff(dfc.array)
-        # Mask 'Frame Counter' incrementing by 1.
-        dfc_diff = np.ma.masked_equal(dfc_diff, 1)
-        # Mask 'Frame Counter' overflow where the Frame Counter transitions
-        # from 4095 to 0.
-        # Q: This used to be 4094, are there some Frame Counters which
-        # increment from 1 rather than 0 or something else?
-        dfc_diff = np.ma.masked_equal(dfc_diff, -4095)
-        # Gap between difference values.
-        dfc_half_period = (1 / dfc.frequency) / 2
-    else:
+    split_params.prepare()
+
+    if not split_params.dfc_frequency:
         logger.info("'Frame Counter' will not be used for splitting since "
                     "'reliable_frame_counter' is False.")
-        dfc = None
 
     start = 0
     last_fast_index = None
@@ -557,23 +1129,17 @@ def split_segments(hdf, aircraft_info):
         last_fast_index = slow_slice.stop
 
         # Find split based on minimum of engine parameters.
-        if split_params_min is not None:
-            eng_split_index, eng_split_value = _split_on_eng_params(
-                slice_start_secs, slice_stop_secs, split_params_min,
-                split_params_frequency)
-        else:
-            eng_split_index, eng_split_value = None, None
+        eng_split_index, eng_split_value = split_params.split_on_eng_params(
+            slice_start_secs, slice_stop_secs)
 
         # Split using 'Frame Counter'.
-        if dfc is not None:
-            dfc_split_index = _split_on_dfc(
-                slice_start_secs, slice_stop_secs, dfc.frequency,
-                dfc_half_period, dfc_diff, eng_split_index=eng_split_index)
+        if split_params.dfc_frequency:
+            dfc_split_index = split_params.split_on_dfc(
+                slice_start_secs, slice_stop_secs,
+                eng_split_index=eng_split_index)
             if dfc_split_index:
-                segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                                        heading.array, heading.frequency,
-                                                        start, dfc_split_index, eng_arrays,
-                                                        aircraft_info, thresholds, hdf))
+                segments.append(segment_type_and_slice(speed_array, start,
+                                                       dfc_split_index))
                 start = dfc_split_index
                 logger.info("'Frame Counter' jumped within slow_slice '%s' "
                             "at index '%d'.", slow_slice, dfc_split_index)
@@ -590,10 +1156,8 @@ def split_segments(hdf, aircraft_info):
                         "slow_slice '%s' at index '%d'.",
                         eng_split_value, settings.MINIMUM_SPLIT_PARAM_VALUE,
                         slow_slice, eng_split_index)
-            segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                                    heading.array, heading.frequency,
-                                                    start, eng_split_index, eng_arrays,
-                                                    aircraft_info, thresholds, hdf))
+            segments.append(segment_type_and_slice(speed_array, start,
+                                                   eng_split_index))
             start = eng_split_index
             continue
         else:
@@ -605,16 +1169,11 @@ def split_segments(hdf, aircraft_info):
 
         # Split using rate of turn. Q: Should this be considered in other
         # splitting methods.
-        if rate_of_turn is None:
-            continue
-
-        rot_split_index = _split_on_rot(slice_start_secs, slice_stop_secs,
-                                        heading.frequency, rate_of_turn)
+        rot_split_index = split_params.split_on_rot(slice_start_secs,
+                                                    slice_stop_secs)
         if rot_split_index:
-            segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                                    heading.array, heading.frequency,
-                                                    start, rot_split_index, eng_arrays,
-                                                    aircraft_info, thresholds, hdf))
+            segments.append(segment_type_and_slice(speed_array, start,
+                                                   rot_split_index))
             start = rot_split_index
             logger.info("Splitting at index '%s' where rate of turn was below "
                         "'%s'.", rot_split_index,
@@ -630,10 +1189,7 @@ def split_segments(hdf, aircraft_info):
                        "'%s'.", slow_slice)
 
     # Add remaining data to a segment.
-    segments.append(_segment_type_and_slice(speed_array, speed.frequency,
-                                            heading.array, heading.frequency,
-                                            start, speed_secs, eng_arrays,
-                                            aircraft_info, thresholds, hdf))
+    segments.append(segment_type_and_slice(speed_array, start, speed_secs))
 
     '''
     import matplotlib.pyplot as plt
@@ -886,8 +1442,167 @@ def _calculate_start_datetime(hdf, fallback_dt, validation_dt):
     return timebase
 
 
+def _segment_timebase(hdf, fallback_dt, validation_dt, aircraft_info):
+    '''
+    :returns: The segment's speed parameter, speed thresholds and start
+        datetime.
+    :rtype: (Parameter, dict, datetime)
+    '''
+    speed, thresholds = _get_speed_parameter(hdf, aircraft_info)
+    try:
+        start_datetime = _calculate_start_datetime(hdf, fallback_dt, validation_dt)
+    except TimebaseError:
+        # Warn the user and store the fake datetime. The code on the other
+        # side should check the datetime and avoid processing this file
+        logger.exception(
+            'Unable to calculate timebase, using 1970-01-01 00:00:00+0000!')
+        start_datetime = datetime.utcfromtimestamp(0).replace(tzinfo=pytz.utc)
+    return speed, thresholds, start_datetime
+
+
+def write_segments(hdf_path, segment_slices, dest_paths, boundary,
+                   submasks=(), fallback_dts=None, validation_dt=None,
+                   aircraft_info={}):
+    '''
+    Write segments of the HDF file to new HDF files in a single pass. Each
+    parameter is read from the source file once and its slices are written
+    to every segment file, rather than reading the source file once per
+    segment. Parameters are sliced in the same way as
+    hdfaccess.utils.write_segment: arrays are extended to superframe
+    boundaries and samples outside of the segment slice are masked.
+
+    If fallback_dts are provided, the start datetime of each segment is
+    calculated and written to the segment file before it is closed and
+    stored in SegmentParameters.timebase.
+
+    Segments of source files up to settings.SEGMENT_FILE_IMAGE_LIMIT bytes
+    (disabled by default) are built in memory and written to disk once
+    complete. The content hash of each segment is calculated from the
+    in-memory parameters (see segment_content_hash).
+
+    :param hdf_path: Path to the source HDF file.
+    :type hdf_path: str
+    :param segment_slices: Slices of the segments in seconds.
+    :type segment_slices: [slice]
+    :param dest_paths: Paths of the segment HDF files to create.
+    :type dest_paths: [str]
+    :param boundary: Superframe boundary in seconds which segments are
+        extended to.
+    :type boundary: int
+    :param submasks: Names of submasks to keep.
+    :type submasks: iterable of str
+    :param fallback_dts: Fallback datetime of each segment (see
+        append_segment_info).
+    :type fallback_dts: [datetime] or None
+    :param validation_dt: Used to validate the start datetimes.
+    :type validation_dt: datetime
+    :param aircraft_info: Information which identify the aircraft.
+    :type aircraft_info: dict
+    :returns: In-memory parameters used to calculate segment info (see
+        SEGMENT_INFO_PARAMETERS) for each segment.
+    :rtype: [SegmentParameters]
+    '''
+    boundaries = [segment_bounds(segment_slice, boundary)
+                  for segment_slice in segment_slices]
+
+    in_memory = os.path.getsize(hdf_path) <= settings.SEGMENT_FILE_IMAGE_LIMIT
+
+    with hdf_file(hdf_path) as hdf:
+        segments_params = []
+        dest_hdfs = []
+        try:
+            for dest_path, (supf_start_secs, supf_stop_secs, _, _) in \
+                    zip(dest_paths, boundaries):
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                if in_memory:
+                    dest_hdf = hdf_file(h5py.File(
+                        dest_path, 'w', driver='core', backing_store=False))
+                else:
+                    dest_hdf = hdf_file(dest_path, create=True)
+                dest_hdfs.append(dest_hdf)
+                for name, value in hdf.hdf.attrs.items():
+                    dest_hdf.hdf.attrs[name] = value
+                if supf_stop_secs is None:
+                    duration = hdf.duration - supf_start_secs
+                else:
+                    duration = supf_stop_secs - supf_start_secs
+                dest_hdf.duration = duration
+                segments_params.append(SegmentParameters(duration))
+
+            for name in hdf.keys():
+                param = hdf.get_param(name, load_submasks=True)
+                for dest_hdf, segment_params, bounds in \
+                        zip(dest_hdfs, segments_params, boundaries):
+                    supf_start_secs, supf_stop_secs, array_start_secs, \
+                        array_stop_secs = bounds
+                    segment_param = slice_segment_param(
+                        param, supf_start_secs, supf_stop_secs, submasks,
+                        array_start_secs=array_start_secs,
+                        array_stop_secs=array_stop_secs)
+                    dest_hdf.set_param(segment_param)
+                    if name in SEGMENT_INFO_PARAMETERS:
+                        segment_params[name] = segment_param
+
+            for segment_params in segments_params:
+                segment_params.content_hash = \
+                    segment_content_hash(segment_params)
+
+            if fallback_dts is not None:
+                # The start datetime attribute is written before the file
+                # image is written to disk.
+                for dest_hdf, segment_params, fallback_dt in \
+                        zip(dest_hdfs, segments_params, fallback_dts):
+                    segment_params.timebase = _segment_timebase(
+                        segment_params, fallback_dt, validation_dt,
+                        aircraft_info)
+                    dest_hdf.start_datetime = segment_params.timebase[2]
+
+            if in_memory:
+                for dest_path, dest_hdf in zip(dest_paths, dest_hdfs):
+                    dest_hdf.hdf.flush()
+                    image = dest_hdf.hdf.id.get_file_image()
+                    with open(dest_path, 'wb') as dest_file:
+                        dest_file.write(image)
+        finally:
+            for dest_hdf in dest_hdfs:
+                dest_hdf.close()
+    return segments_params
+
+
+def read_virtual_segments(hdf_path, segment_slices, boundary):
+    '''
+    Read the parameters used to calculate segment info of virtual segments,
+    which are not written to new HDF files but processed as slices of the
+    source HDF file (see hdf_io.SegmentView).
+
+    The content hash of each segment is calculated as for segments written
+    by write_segments (see segment_content_hash).
+
+    :param hdf_path: Path to the source HDF file.
+    :type hdf_path: str
+    :param segment_slices: Slices of the segments in seconds.
+    :type segment_slices: [slice]
+    :param boundary: Superframe boundary in seconds which segments are
+        extended to.
+    :type boundary: int
+    :rtype: [SegmentParameters]
+    '''
+    segments_params = []
+    for segment_slice in segment_slices:
+        with SegmentView(hdf_path, segment_slice, boundary=boundary) as hdf:
+            segment_params = SegmentParameters(hdf.duration)
+            for name in SEGMENT_INFO_PARAMETERS:
+                if name in hdf:
+                    segment_params[name] = hdf.get_param(name)
+            segment_params.content_hash = segment_content_hash(segment_params)
+        segments_params.append(segment_params)
+    return segments_params
+
+
 def append_segment_info(hdf_segment_path, segment_type, segment_slice, part,
-                        fallback_dt=None, validation_dt=None, aircraft_info={}):
+                        fallback_dt=None, validation_dt=None, aircraft_info={},
+                        segment_params=None, virtual=False):
     """
     Get information about a segment such as type, hash, etc. and return a
     named tuple.
@@ -906,23 +1621,37 @@ def append_segment_info(hdf_segment_path, segment_type, segment_slice, part,
     :param fallback_dt: Used to replace elements of datetimes which are not
         available in the hdf file (e.g. YEAR not being recorded)
     :type fallback_dt: datetime
+    :param segment_params: In-memory parameters of the segment written by
+        write_segments. If provided, the segment's data is not read from
+        hdf_segment_path.
+    :type segment_params: SegmentParameters or None
+    :param virtual: Whether the segment is a virtual segment of the HDF file
+        at hdf_segment_path (see read_virtual_segments) in which case the
+        HDF file is not modified. Requires segment_params.
+    :type virtual: bool
     :returns: Segment named tuple
     :rtype: Segment
     """
     # build information about a slice
-    with hdf_file(hdf_segment_path) as hdf:
-        speed, thresholds = _get_speed_parameter(hdf, aircraft_info)
-        duration = hdf.duration
-        try:
-            start_datetime = _calculate_start_datetime(hdf, fallback_dt, validation_dt)
-        except TimebaseError:
-            # Warn the user and store the fake datetime. The code on the other
-            # side should check the datetime and avoid processing this file
-            logger.exception(
-                'Unable to calculate timebase, using 1970-01-01 00:00:00+0000!')
-            start_datetime = datetime.utcfromtimestamp(0).replace(tzinfo=pytz.utc)
-        stop_datetime = start_datetime + timedelta(seconds=duration)
-        hdf.start_datetime = start_datetime
+    if segment_params is not None and segment_params.timebase is not None:
+        # the start datetime was written to the file by write_segments
+        speed, thresholds, start_datetime = segment_params.timebase
+        duration = segment_params.duration
+    elif segment_params is not None:
+        speed, thresholds, start_datetime = _segment_timebase(
+            segment_params, fallback_dt, validation_dt, aircraft_info)
+        duration = segment_params.duration
+        if not virtual:
+            # only the start datetime attribute is written to the file
+            with hdf_file(hdf_segment_path) as hdf:
+                hdf.start_datetime = start_datetime
+    else:
+        with hdf_file(hdf_segment_path) as hdf:
+            speed, thresholds, start_datetime = _segment_timebase(
+                hdf, fallback_dt, validation_dt, aircraft_info)
+            duration = hdf.duration
+            hdf.start_datetime = start_datetime
+    stop_datetime = start_datetime + timedelta(seconds=duration)
 
     if segment_type in ('START_AND_STOP', 'START_ONLY', 'STOP_ONLY'):
         # we went fast, so get the index
@@ -942,8 +1671,13 @@ def append_segment_info(hdf_segment_path, segment_type, segment_slice, part,
     else:
         go_fast_index = None
         go_fast_datetime = None
-        # if not go_fast, create hash from entire file
-        speed_hash = sha_hash_file(hdf_segment_path)
+        # if not go_fast, create hash from the segment's content
+        if segment_params is not None and segment_params.content_hash:
+            # calculated while writing or reading the segment
+            speed_hash = segment_params.content_hash
+        else:
+            with hdf_file(hdf_segment_path) as hdf:
+                speed_hash = segment_content_hash(hdf)
     segment = Segment(
         segment_slice,
         segment_type,
@@ -959,11 +1693,16 @@ def append_segment_info(hdf_segment_path, segment_type, segment_slice, part,
 
 def split_hdf_to_segments(hdf_path, aircraft_info, fallback_dt=None,
                           validation_dt=None, fallback_relative_to_start=True,
-                          draw=False, dest_dir=None, pre_file_kwargs={}):
+                          draw=False, dest_dir=None, pre_file_kwargs={},
+                          virtual=False):
     """
     Main method - analyses an HDF file for flight segments and splits each
     flight into a new segment appropriately.
 
+    Virtual segments are not written to new files. The path of each Segment
+    is hdf_path and the segment is processed as a slice of hdf_path by
+    passing Segment.slice as segment_info['Slice'] to process_flight.
+
     :param hdf_path: path to HDF file
     :type hdf_path: string
     :param aircraft_info: Information which identify the aircraft, specfically
@@ -980,6 +1719,9 @@ def split_hdf_to_segments(hdf_path, aircraft_info, fallback_dt=None,
     :type dest_dir: str
     :param pre_file_kwargs: Pre-file analysis keyword arguments.
     :type pre_file_kwargs: dict
+    :param virtual: Whether to create virtual segments rather than writing
+        each segment to a new file.
+    :type virtual: bool
     :returns: List of Segments
     :rtype: List of Segment recordtypes ('slice type part duration path hash')
     """
@@ -1012,32 +1754,55 @@ def split_hdf_to_segments(hdf_path, aircraft_info, fallback_dt=None,
         # on a minimum boundary of 4 seconds for the analyser.
         boundary = 64 if hdf.superframe_present else 4
 
-        segment_tuples = split_segments(hdf, aircraft_info)
+        segment_tuples = split_segments(
+            hdf, aircraft_info, window=settings.SPLIT_WINDOW_DURATION)
         frame_doubled = aircraft_info.get('Frame Doubled', False)
 
         fallback_dt = calculate_fallback_dt(hdf, fallback_dt, validation_dt, fallback_relative_to_start, frame_doubled)
 
-    # process each segment (into a new file) having closed original hdf_path
+    segment_slices = [segment_slice for _, segment_slice, _ in segment_tuples]
+    # calculate the fallback time of each segment up front so that the start
+    # datetime is written along with the segment's parameters
+    segment_fallback_dts = []
+    for _, segment_slice, start_padding in segment_tuples:
+        # adjust fallback time to account for any padding added at start of segment
+        segment_fallback_dts.append(
+            fallback_dt - timedelta(seconds=start_padding))
+        if fallback_dt:
+            # move the fallback_dt on to be relative to start of next segment slice
+            fallback_dt += timedelta(seconds=(segment_slice.stop - segment_slice.start))
+
+    if virtual:
+        # segments are read as slices of hdf_path when processed
+        dest_paths = [hdf_path] * len(segment_tuples)
+        segments_params = read_virtual_segments(
+            hdf_path, segment_slices, boundary)
+    else:
+        # write all segments (into new files) in a single pass of hdf_path
+        basename = os.path.splitext(os.path.basename(hdf_path))[0]
+        # write segment to new split file (.001)
+        dest_paths = [os.path.join(dest_dir, basename + '.%03d.hdf5' % part)
+                      for part in range(1, len(segment_tuples) + 1)]
+        logger.debug("Writing segments: %s", dest_paths)
+        segments_params = write_segments(
+            hdf_path, segment_slices, dest_paths, boundary,
+            submasks=('arinc', 'invalid_states', 'padding', 'saturation'),
+            fallback_dts=segment_fallback_dts, validation_dt=validation_dt,
+            aircraft_info=aircraft_info)
+
+    # process each segment having closed original hdf_path
     segments = []
     previous_stop_dt = None
     for part, (segment_type, segment_slice, start_padding) in enumerate(segment_tuples,
                                                          start=1):
-        # write segment to new split file (.001)
-        basename = os.path.basename(hdf_path)
-        dest_basename = os.path.splitext(basename)[0] + '.%03d.hdf5' % part
-        dest_path = os.path.join(dest_dir, dest_basename)
-        logger.debug("Writing segment %d: %s", part, dest_path)
-
-        write_segment(hdf_path, segment_slice, dest_path, boundary,
-                      submasks=('arinc', 'invalid_states', 'padding', 'saturation'))
-
-        # adjust fallback time to account for any padding added at start of segment
-        segment_start_dt = fallback_dt - timedelta(seconds=start_padding)
+        dest_path = dest_paths[part - 1]
 
         segment = append_segment_info(
             dest_path, segment_type, segment_slice, part,
-            fallback_dt=segment_start_dt, validation_dt=validation_dt,
-            aircraft_info=aircraft_info)
+            fallback_dt=segment_fallback_dts[part - 1],
+            validation_dt=validation_dt,
+            aircraft_info=aircraft_info,
+            segment_params=segments_params[part - 1], virtual=virtual)
 
         if previous_stop_dt and segment.start_dt < previous_stop_dt - timedelta(0, 4):
             # In theory, this should not happen - but be warned of superframe
@@ -1046,12 +1811,8 @@ def split_hdf_to_segments(hdf_path, aircraft_info, fallback_dt=None,
                 "Segment start_dt '%s' comes before the previous segment "
                 "ended '%s'", segment.start_dt, previous_stop_dt)
         previous_stop_dt = segment.stop_dt
-
-        if fallback_dt:
-            # move the fallback_dt on to be relative to start of next segment slice
-            fallback_dt += timedelta(seconds=(segment_slice.stop - segment_slice.start))
         segments.append(segment)
-        if draw:
+        if draw and not virtual:
             plot_essential(dest_path)
 
     if draw:
@@ -10,12 +10,31 @@ Flight Data Analyzer: API Handler: Tests
 # Imports
 
 import copy
+import mock
+import os
+import shutil
+import simplejson as json
+import tempfile
+import threading
 import unittest
 import yaml
 
+from six.moves import BaseHTTPServer
+
 from flightdatautilities import api
 
 from analysis_engine import settings
+from analysis_engine.api_handler import (
+    compile_config,
+    ConfigIndex,
+    flight_geodata,
+    geodata_handler,
+    GeodataContext,
+    HTTPHandler,
+    load_config,
+    prefetch_airports,
+    ResponseCache,
+)
 
 
 ##############################################################################
@@ -49,18 +68,54 @@ class FileHandlerTest(unittest.TestCase):
         self.assertEqual(self.handler.get_airport('OSL'), self.airports[1])
         self.assertEqual(self.handler.get_airport('ENGM'), self.airports[1])
 
+    def test_get_airport_copy(self):
+        # Modifying the airport does not modify the cached config.
+        airport = self.handler.get_airport(2456)
+        airport['name'] = 'Modified'
+        airport.setdefault('runways', []).append({'id': 0})
+        self.assertEqual(self.handler.get_airport(2456), self.airports[0])
+
     def test_get_nearest_airport(self):
-        airport = self.handler.get_nearest_airport(58, 8)
+        airport = self.handler.get_nearest_airport(58, 8, max_distance=None)
         self.assertEqual(airport[0]['distance'], 23253.447237062534)
         expected = copy.deepcopy(self.airports)
         expected[0]['distance'] = 23253.447237062534
         expected[1]['distance'] = 301363.618453967
         self.assertEqual(airport, expected)
-        airport = self.handler.get_nearest_airport(60, 11)
-        self.assertEqual(airport[1]['distance'], 22267.45203750386)
+        airport = self.handler.get_nearest_airport(60, 11, max_distance=None)
+        self.assertEqual(airport[0]['distance'], 22267.45203750386)
         expected[0]['distance'] = 259894.3641803484
         expected[1]['distance'] = 22267.45203750386
-        self.assertEqual(airport, expected)
+        # Airports are sorted by distance.
+        self.assertEqual(airport, expected[::-1])
+
+    def test_get_nearest_airport_max_distance(self):
+        airport = self.handler.get_nearest_airport(58, 8, max_distance=100000)
+        self.assertEqual([a['id'] for a in airport], [2456])
+        airport = self.handler.get_nearest_airport(58, 8, max_distance=400000)
+        self.assertEqual([a['id'] for a in airport], [2456, 2461])
+        self.assertRaises(api.NotFoundError, self.handler.get_nearest_airport,
+                          0, 0, max_distance=100000)
+        # The airports of the file are not modified.
+        self.assertNotIn('distance', self.handler.get_airport(2456))
+
+    def test_get_nearest_airport_max_distance_setting(self):
+        # All airports are returned by default.
+        airport = self.handler.get_nearest_airport(58, 8)
+        self.assertEqual([a['id'] for a in airport], [2456, 2461])
+        with mock.patch.object(settings, 'NEAREST_AIRPORT_MAX_DISTANCE',
+                               100000):
+            airport = self.handler.get_nearest_airport(58, 8)
+            self.assertEqual([a['id'] for a in airport], [2456])
+            airports = self.handler.get_nearest_airports([(58, 8)])
+            self.assertEqual([a['id'] for a in airports[0]], [2456])
+
+    def test_get_nearest_airports(self):
+        airports = self.handler.get_nearest_airports([(58, 8), (0, 0)],
+                                                     max_distance=100000)
+        self.assertEqual(airports[0], self.handler.get_nearest_airport(
+            58, 8, max_distance=100000))
+        self.assertIsInstance(airports[1], api.NotFoundError)
 
 
 class HTTPHandlerTest(unittest.TestCase):
@@ -89,6 +144,244 @@ class HTTPHandlerTest(unittest.TestCase):
         pass
 
 
+class ConfigIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'airports.yaml')
+        shutil.copy(settings.API_FILE_PATHS['airports'], self.path)
+        patcher = mock.patch.object(settings, 'API_FILE_INDEX_DIR', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with open(self.path, 'rb') as f:
+            self.airports = yaml.load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_config_index(self):
+        index = ConfigIndex(self.airports)
+        self.assertEqual(index.airport_codes,
+                         {2456: 0, 'KRS': 0, 'ENCN': 0, 2461: 1, 'OSL': 1, 'ENGM': 1})
+        self.assertEqual(len(index.airport_index.airports), 2)
+        self.assertEqual(ConfigIndex(None).airport_codes, {})
+
+    def test_load_config(self):
+        index_path = self.path + '.idx'
+        index = load_config(self.path)
+        self.assertEqual(index.data, self.airports)
+        self.assertTrue(os.path.exists(index_path))
+        # The index is loaded once per process.
+        self.assertIs(load_config(self.path), index)
+        # The compiled index is loaded without parsing the YAML file.
+        with mock.patch('analysis_engine.api_handler._config_indexes', {}):
+            with mock.patch('analysis_engine.api_handler.yaml') as yaml_patch:
+                self.assertEqual(load_config(self.path).data, self.airports)
+            self.assertFalse(yaml_patch.load.called)
+        # The index is compiled again when the YAML file is modified.
+        with open(self.path, 'ab') as f:
+            f.write(b'  - {id: 1, code: {icao: XXXX}, latitude: 0, longitude: 0}\n')
+        index = load_config(self.path)
+        self.assertEqual(index.data[-1]['id'], 1)
+        self.assertEqual(index.airport_codes['XXXX'], 2)
+
+    def test_compile_config_index_dir(self):
+        with mock.patch.object(settings, 'API_FILE_INDEX_DIR', self.temp_dir):
+            compile_config(settings.API_FILE_PATHS['airports'])
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'airports.yaml.idx')))
+
+
+class GeodataContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = mock.Mock()
+        self.handler.get_airport.return_value = {'id': 2456}
+        self.handler.get_nearest_airport.return_value = [{'id': 2456}]
+        self.handler.get_nearest_airports.side_effect = \
+            lambda coordinates: [[{'id': 2461}] for _ in coordinates]
+
+    def test_get_airport(self):
+        context = GeodataContext(self.handler)
+        airport = context.get_airport('ENCN')
+        airport['name'] = 'Kjevik'
+        self.assertEqual(context.get_airport('ENCN'), {'id': 2456})
+        self.handler.get_airport.assert_called_once_with('ENCN')
+        self.handler.get_airport.side_effect = api.NotFoundError('Not found.')
+        self.assertRaises(api.NotFoundError, context.get_airport, 'XXXX')
+        self.assertRaises(api.NotFoundError, context.get_airport, 'XXXX')
+        self.assertEqual(self.handler.get_airport.call_count, 2)
+
+    def test_get_nearest_airport(self):
+        context = GeodataContext(self.handler)
+        context.get_nearest_airport(58.2, 8.1)
+        self.assertEqual(context.get_nearest_airport(latitude=58.2, longitude=8.1),
+                         [{'id': 2456}])
+        self.handler.get_nearest_airport.assert_called_once_with(58.2, 8.1)
+
+    def test_prefetch(self):
+        context = GeodataContext(self.handler)
+        context.get_nearest_airport(58.2, 8.1)
+        context.prefetch([(58.2, 8.1), (60.2, 11.1), (None, 11.1),
+                          (60.2, 11.1), (91, 0)])
+        # Only new valid coordinates are looked up in a single call.
+        self.handler.get_nearest_airports.assert_called_once_with([(60.2, 11.1)])
+        self.assertEqual(context.get_nearest_airport(60.2, 11.1), [{'id': 2461}])
+        self.assertEqual(self.handler.get_nearest_airport.call_count, 1)
+
+    def test_flight_geodata(self):
+        self.assertIs(geodata_handler(self.handler), self.handler)
+        # Prefetching outside of a flight does nothing.
+        prefetch_airports([(58.2, 8.1)])
+        with flight_geodata() as context:
+            self.assertIs(geodata_handler(self.handler), context)
+            self.assertIs(context.handler, self.handler)
+            prefetch_airports([(58.2, 8.1)])
+            self.assertEqual(geodata_handler(self.handler).get_nearest_airport(58.2, 8.1),
+                             [{'id': 2461}])
+        self.assertIs(geodata_handler(self.handler), self.handler)
+        self.assertFalse(self.handler.get_nearest_airport.called)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @mock.patch('analysis_engine.api_handler.time')
+    def test_ttl(self, time):
+        time.time.return_value = 1000
+        cache = ResponseCache(60, self.path)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'id': 1})
+        response = cache.get('a')
+        self.assertEqual(response, {'id': 1})
+        # A copy of the response is returned.
+        response['id'] = 2
+        self.assertEqual(cache.get('a'), {'id': 1})
+        # Responses are shared through the database.
+        self.assertEqual(ResponseCache(60, self.path).get('a'), {'id': 1})
+        time.time.return_value = 1061
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(ResponseCache(60, self.path).get('a'))
+
+    def test_size(self):
+        cache = ResponseCache(60, size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Looking up a response makes it the most recently used.
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(list(cache._memory), ['a', 'c'])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_size_database(self):
+        cache = ResponseCache(60, self.path, size=1)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(list(cache._memory), ['b'])
+        # Responses discarded from memory are read from the database.
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(list(cache._memory), ['a'])
+
+    def test_fetch(self):
+        cache = ResponseCache(60)
+        requests = []
+        event = threading.Event()
+
+        def request():
+            requests.append(1)
+            event.wait(1)
+            return [1, 2]
+
+        threads = [threading.Thread(target=cache.fetch, args=('a', request))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        event.set()
+        for thread in threads:
+            thread.join()
+        # Concurrent requests are coalesced.
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(cache.fetch('a', request), [1, 2])
+        self.assertEqual(len(requests), 1)
+
+    def test_fetch_error(self):
+        cache = ResponseCache(60)
+
+        def request():
+            raise api.NotFoundError('Not found.')
+
+        self.assertRaises(api.NotFoundError, cache.fetch, 'a', request)
+        # Errors are not cached.
+        self.assertEqual(cache.fetch('a', lambda: {'id': 1}), {'id': 1})
+
+
+class _APIRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Local stand-in for the HTTP API.
+    '''
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = json.dumps({'id': 2456, 'path': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPHandlerCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        _APIRequestHandler.requests = []
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                _APIRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        base_url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        for name, value in (('API_HTTP_BASE_URL', base_url),
+                            ('API_HTTP_CACHE_TTL', 60),
+                            ('API_HTTP_CACHE_PATH', None)):
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.handler = HTTPHandler()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_airport(self):
+        airport = self.handler.get_airport('ENCN')
+        self.assertEqual(airport['id'], 2456)
+        self.assertEqual(self.handler.get_airport(' encn '), airport)
+        self.assertEqual(_APIRequestHandler.requests, ['/api/airport/encn/'])
+
+    def test_get_nearest_airport(self):
+        self.handler.get_nearest_airport(58.20421, 8.08536)
+        # Coordinates are quantised to three decimal places.
+        self.handler.get_nearest_airport(58.20419, 8.08541)
+        self.handler.get_nearest_airport(58.21, 8.08)
+        self.assertEqual(len(_APIRequestHandler.requests), 2)
+
+    def test_cache_disabled(self):
+        with mock.patch.object(settings, 'API_HTTP_CACHE_TTL', 0):
+            self.handler.get_aircraft('G-FDSL')
+            self.handler.get_aircraft('G-FDSL')
+        self.assertEqual(len(_APIRequestHandler.requests), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import six
 import unittest
 import yaml
 
@@ -1287,6 +1288,55 @@ class TestZaventem(unittest.TestCase):
         self.assertEqual(int(approaches[1].loc_est.start), 13554)
 
 
+    @unittest.skipIf(six.PY3, 'ApproachInformation indexes arrays with '
+                     'float reference indices which requires Python 2.')
+    @patch('analysis_engine.approaches.api')
+    def test_airport_coordinates(self, api):
+        get_handler = Mock()
+        get_handler.get_nearest_airport.return_value = [airports['zaventem']]
+        api.get_handler.return_value = get_handler
+
+        def fetch(par_name):
+            try:
+                return load(root + par_name + '.nod')
+            except:
+                return None
+        root = os.path.join(approaches_path, 'ILS_test_10180313_')
+        args = [fetch('Altitude AAL'),
+                fetch('Altitude AGL'),
+                A('Aircraft Type', 'aeroplane'),
+                S(name='Approach And Landing',
+                  items=[Section(name='Approach And Landing',
+                                 slice=slice(11754, 12346),
+                                 start_edge=11754, stop_edge=12346),
+                         Section(name='Approach And Landing',
+                                 slice=slice(13500, 13898),
+                                 start_edge=13500, stop_edge=13898)]),
+                fetch('Heading Continuous'),
+                fetch('Latitude Prepared'),
+                fetch('Longitude Prepared'),
+                fetch('ILS Localizer'),
+                fetch('ILS Glideslope'),
+                fetch('ILS Frequency'),
+                A(name='AFR Landing Airport', value=None),
+                A(name='AFR Landing Runway', value=None),
+                KPV('Latitude At Touchdown', items=[]),
+                KPV('Longitude At Touchdown', items=[]),
+                A('Precise Positioning', False)]
+        args += [None] * (len(ApproachInformation.get_dependency_names()) - len(args))
+        coordinates = ApproachInformation().get_airport_coordinates(args)
+        approaches = ApproachInformation()
+        approaches.get_derived(args)
+        # The coordinates looked up include the go-around extrapolated to the
+        # threshold.
+        self.assertEqual(approaches[0].type, 'GO_AROUND')
+        self.assertEqual(coordinates,
+                         [(approach.lowest_lat, approach.lowest_lon)
+                          for approach in approaches])
+        self.assertEqual(get_handler.get_nearest_airport.call_args_list,
+                         [call(latitude=lat, longitude=lon)
+                          for lat, lon in coordinates])
+
 class TestBarcelona(unittest.TestCase):
     '''
     c60cf86bb146
@@ -17,7 +17,9 @@ from analysis_engine.dependency_graph import (
     CircularDependency,
     InoperableDependencies,
     any_predecessors_in_requested,
+    dependency_graph,
     dependency_order, 
+    dependent_nodes,
     graph_nodes, 
     graph_adjacencies,
     indent_tree,
@@ -614,6 +616,42 @@ Node: Start Datetime 	Pre: [] 	Succ: [] 	Neighbors: [] 	Edges: []
         
 
 
+class TestDependentNodes(unittest.TestCase):
+    def setUp(self):
+        edges = [('root', 'P7'), ('root', 'P8'),
+                 ('P7', 'P4'), ('P7', 'P5'), ('P7', 'P6'),
+                 ('P4', 'Raw1'), ('P4', 'Raw2'),
+                 ('P5', 'Raw3'), ('P5', 'Raw4'),
+                 ('P6', 'Raw3'), ('P8', 'Raw5')]
+        self.graph = nx.DiGraph(edges)
+
+    def test_dependent_nodes(self):
+        self.assertEqual(dependent_nodes(self.graph, ['P4']), {'P4', 'P7'})
+        self.assertEqual(dependent_nodes(self.graph, ['Raw3']),
+                         {'Raw3', 'P5', 'P6', 'P7'})
+        self.assertEqual(dependent_nodes(self.graph, ['P4', 'P8']),
+                         {'P4', 'P7', 'P8'})
+        self.assertEqual(dependent_nodes(self.graph, ['P7']), {'P7'})
+
+    def test_dependency_graph(self):
+        # Nodes are linked to their dependencies even if they cannot operate.
+        derived_nodes = {
+            'P4': MockParam(dependencies=['Raw1', 'Raw2']),
+            'P7': MockParam(dependencies=['P4', 'Raw3'], operational=False),
+            'P8': MockParam(dependencies=['Raw5']),
+        }
+        graph = dependency_graph(derived_nodes)
+        self.assertEqual(dependent_nodes(graph, ['Raw1']),
+                         {'Raw1', 'P4', 'P7'})
+        self.assertEqual(dependent_nodes(graph, ['Raw3']), {'Raw3', 'P7'})
+        self.assertEqual(dependent_nodes(graph, ['P8']), {'P8'})
+
+    def test_dependent_nodes_unknown(self):
+        self.assertEqual(dependent_nodes(self.graph, ['Unknown']), set())
+        self.assertEqual(dependent_nodes(self.graph, []), set())
+        self.assertEqual(dependent_nodes(self.graph, ['root']), set())
+
+
 class TestGraphAdjacencies(unittest.TestCase):
     def test_graph_adjacencies(self):
         g = nx.DiGraph()
@@ -786,6 +786,29 @@ class TestTakeoffAirport(unittest.TestCase, NodeTest):
         get_nearest_airport.assert_called_once_with(4.0, 3.0)
         get_nearest_airport.reset_mock()
 
+    def test_get_airport_coordinates(self):
+        toff_lat = KPV(name='Latitude At Liftoff', items=[
+            KeyPointValue(index=12, value=4.0),
+            KeyPointValue(index=32, value=6.0),
+        ])
+        toff_lon = KPV(name='Longitude At Liftoff', items=[
+            KeyPointValue(index=12, value=3.0),
+            KeyPointValue(index=32, value=9.0),
+        ])
+        off_block_lat = KPV(name='Latitude Off Blocks', items=[
+            KeyPointValue(index=2, value=4.1),
+        ])
+        off_block_lon = KPV(name='Longitude Off Blocks', items=[
+            KeyPointValue(index=2, value=3.1),
+        ])
+        apt = self.node_class()
+        self.assertEqual(
+            apt.get_airport_coordinates(
+                [toff_lat, toff_lon, None, off_block_lat, off_block_lon]),
+            [(4.0, 3.0), (4.1, 3.1)])
+        self.assertEqual(
+            apt.get_airport_coordinates([None, None, None, None, None]), [])
+
     @patch('analysis_engine.api_handler.FileHandler.get_nearest_airport')
     def test_derive_afr_fallback(self, get_nearest_airport):
         info = {'id': '50'}
@@ -0,0 +1,383 @@
+import mock
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from hdfaccess.file import hdf_file
+
+from analysis_engine.hdf_io import (
+    HDFOverlay,
+    LockedHDF,
+    open_hdf,
+    ParameterPrefetcher,
+    ParameterWriter,
+    segment_bounds,
+    SegmentView,
+    slice_segment_param,
+)
+from analysis_engine.node import M, P
+
+
+test_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'test_data')
+
+
+class TestLockedHDF(unittest.TestCase):
+    def test_locking(self):
+        active = []
+        overlapped = []
+
+        def access(*args, **kwargs):
+            # Record whether another thread is accessing the file.
+            overlapped.append(bool(active))
+            active.append(None)
+            time.sleep(0.001)
+            active.pop()
+
+        hdf = mock.Mock()
+        hdf.get_param.side_effect = access
+        hdf.set_param.side_effect = access
+        locked = LockedHDF(hdf)
+
+        def run(method):
+            for _ in range(20):
+                method('Airspeed')
+
+        threads = [threading.Thread(target=run, args=(locked.get_param,)),
+                   threading.Thread(target=run, args=(locked.set_param,)),
+                   threading.Thread(target=run, args=(locked.get_param,))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(overlapped), 60)
+        self.assertFalse(any(overlapped))
+
+    def test_attributes(self):
+        hdf = mock.Mock()
+        hdf.__contains__ = mock.Mock(return_value=True)
+        locked = LockedHDF(hdf)
+        locked.duration = 100
+        self.assertEqual(hdf.duration, 100)
+        self.assertEqual(locked.duration, 100)
+        self.assertIn('Airspeed', locked)
+
+
+class TestParameterPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.params = {
+            'Airspeed': P('Airspeed', np.ma.arange(10, dtype=float)),
+            'Heading': P('Heading', np.ma.arange(20, dtype=float),
+                         frequency=2),
+        }
+
+        def get_param(name, valid_only=False):
+            if name not in self.params:
+                raise KeyError(name)
+            return self.params[name]
+
+        self.hdf = mock.Mock()
+        self.hdf.get_param.side_effect = get_param
+        self.process_order = ['Airspeed', 'Heading', 'Node 1', 'Node 2',
+                              'Node 3']
+        self.dependencies = {
+            'Node 1': ['Airspeed', 'Pitch'],
+            'Node 2': ['Airspeed', 'Heading'],
+            'Node 3': ['Heading'],
+        }
+
+    def _wait(self, prefetcher, names):
+        # Wait for the background thread to read the parameters.
+        with prefetcher._condition:
+            while not all(n in prefetcher._params or n in prefetcher._failed
+                          for n in names):
+                prefetcher._condition.wait(1)
+
+    def test_get_param(self):
+        with ParameterPrefetcher(self.hdf, self.process_order,
+                                 self.dependencies) as prefetcher:
+            prefetcher.advance(2)
+            self._wait(prefetcher, ['Airspeed', 'Pitch', 'Heading'])
+            airspeed = prefetcher.get_param('Airspeed')
+            # A copy is returned until the last use.
+            self.assertIsNot(airspeed, self.params['Airspeed'])
+            self.assertEqual(airspeed.array.tolist(), list(range(10)))
+            # Invalid parameters are read by the caller.
+            self.assertIsNone(prefetcher.get_param('Pitch'))
+            prefetcher.advance(3)
+            self.assertIs(prefetcher.get_param('Airspeed'),
+                          self.params['Airspeed'])
+            self.assertNotIn('Airspeed', prefetcher._params)
+            self.assertIsNone(prefetcher.get_param('Airspeed'))
+            self.assertIsNotNone(prefetcher.get_param('Heading'))
+        self.assertFalse(prefetcher._thread.is_alive())
+        self.assertEqual(prefetcher._params, {})
+
+    def test_get_param_without_consuming(self):
+        with ParameterPrefetcher(self.hdf, self.process_order,
+                                 self.dependencies) as prefetcher:
+            prefetcher.advance(3)
+            self._wait(prefetcher, ['Airspeed', 'Heading'])
+            prefetcher.get_param('Airspeed')
+            # Looking ahead at a parameter does not count as a use.
+            airspeed = prefetcher.get_param('Airspeed', consume=False)
+            self.assertIsNot(airspeed, self.params['Airspeed'])
+            self.assertIn('Airspeed', prefetcher._params)
+            self.assertIs(prefetcher.get_param('Airspeed'),
+                          self.params['Airspeed'])
+
+    def test_release_unused(self):
+        with ParameterPrefetcher(self.hdf, self.process_order,
+                                 self.dependencies) as prefetcher:
+            prefetcher.advance(2)
+            self._wait(prefetcher, ['Airspeed', 'Heading'])
+            # Node 2 was not derived so Airspeed is no longer used.
+            prefetcher.get_param('Airspeed')
+            prefetcher.advance(4)
+            self.assertEqual(list(prefetcher._params), ['Heading'])
+            self.assertIsNone(prefetcher.get_param('Airspeed'))
+        # Remaining parameters are released at the end of the flight.
+        self.assertEqual(prefetcher._params, {})
+        self.assertEqual(prefetcher._memory, 0)
+
+    def test_lookahead(self):
+        with ParameterPrefetcher(self.hdf, self.process_order,
+                                 self.dependencies,
+                                 lookahead=0) as prefetcher:
+            prefetcher.advance(2)
+            self._wait(prefetcher, ['Airspeed', 'Pitch'])
+            self.assertNotIn('Heading', prefetcher._params)
+            prefetcher.advance(3)
+            self._wait(prefetcher, ['Heading'])
+            self.assertIn('Heading', prefetcher._params)
+
+    def test_memory_limit(self):
+        with ParameterPrefetcher(self.hdf, self.process_order,
+                                 self.dependencies,
+                                 memory_limit=1) as prefetcher:
+            prefetcher.advance(2)
+            self._wait(prefetcher, ['Airspeed'])
+            self.assertNotIn('Heading', prefetcher._params)
+            # Releasing Airspeed after its last use frees memory.
+            prefetcher.get_param('Airspeed')
+            prefetcher.get_param('Airspeed')
+            self._wait(prefetcher, ['Heading'])
+            self.assertEqual(list(prefetcher._params), ['Heading'])
+
+
+class TestParameterWriter(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+        self.event = threading.Event()
+        self.event.set()
+
+        def set_param(param):
+            self.event.wait(1)
+            if param.name == 'Invalid':
+                raise ValueError(param.name)
+            self.written.append(param.name)
+
+        self.hdf = mock.Mock()
+        self.hdf.set_param.side_effect = set_param
+
+    def test_put(self):
+        with ParameterWriter(self.hdf) as writer:
+            for name in ('Airspeed', 'Heading', 'Pitch'):
+                writer.put(P(name, np.ma.arange(10)))
+            writer.flush()
+            self.assertEqual(self.written, ['Airspeed', 'Heading', 'Pitch'])
+        self.assertFalse(writer._thread.is_alive())
+
+    def test_get_param(self):
+        self.event.clear()
+        writer = ParameterWriter(self.hdf)
+        node = P('Airspeed', np.ma.arange(10))
+        writer.put(node)
+        # The queued parameter is shared rather than copied.
+        self.assertIs(writer.get_param('Airspeed'), node)
+        self.assertIsNone(writer.get_param('Heading'))
+        self.event.set()
+        writer.close()
+        self.assertIsNone(writer.get_param('Airspeed'))
+        self.assertEqual(self.written, ['Airspeed'])
+
+    def test_error(self):
+        self.event.clear()
+        writer = ParameterWriter(self.hdf)
+        writer.put(P('Invalid', np.ma.arange(10)))
+        writer.put(P('Airspeed', np.ma.arange(10)))
+        self.event.set()
+        self.assertRaises(ValueError, writer.flush)
+        # The error is raised until the writer is closed and parameters are
+        # no longer written.
+        self.assertRaises(ValueError, writer.get_param, 'Airspeed')
+        self.assertRaises(ValueError, writer.put, P('Pitch', np.ma.arange(10)))
+        self.assertRaises(ValueError, writer.close)
+        self.assertEqual(self.written, [])
+        writer = ParameterWriter(self.hdf)
+        writer.put(P('Invalid', np.ma.arange(10)))
+        self.assertRaises(ValueError, writer.close)
+
+
+class TestHDFOverlay(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.raw_path = os.path.join(self.temp_dir, 'raw.hdf5')
+        self.sidecar_path = os.path.join(self.temp_dir, 'sidecar.hdf5')
+        shutil.copy2(os.path.join(test_data_path,
+                                  'alt_aal_faulty_alt_rad.hdf5'),
+                     self.raw_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_overlay(self):
+        with hdf_file(self.raw_path) as hdf:
+            raw_names = hdf.valid_param_names()
+            duration = hdf.duration
+            altitude_std = hdf['Altitude STD'].array
+        with HDFOverlay(self.raw_path, self.sidecar_path) as hdf:
+            self.assertEqual(hdf.duration, duration)
+            self.assertEqual(hdf.valid_param_names(), sorted(raw_names))
+            hdf.set_param(P('Altitude AAL', np.ma.arange(duration)))
+            hdf.set_param(P('Altitude STD', np.ma.zeros(duration)))
+            hdf.set_attr('aircraft_info', {'Tail Number': 'G-FDSL'})
+            hdf.analysis_version = '1.0'
+            self.assertIn('Altitude AAL', hdf)
+            self.assertEqual(hdf.valid_param_names(),
+                             sorted(raw_names + ['Altitude AAL']))
+            self.assertEqual(hdf['Altitude STD'].array.sum(), 0)
+            self.assertEqual(hdf.get_attr('aircraft_info'),
+                             {'Tail Number': 'G-FDSL'})
+            hdf.delete_params(['Altitude STD'])
+            self.assertEqual(hdf['Altitude STD'].array.tolist(),
+                             altitude_std.tolist())
+        # The raw HDF file is not modified.
+        with hdf_file(self.raw_path) as hdf:
+            self.assertEqual(hdf.valid_param_names(), raw_names)
+            self.assertIsNone(hdf.analysis_version)
+        with hdf_file(self.sidecar_path) as hdf:
+            self.assertEqual(hdf.valid_param_names(), ['Altitude AAL'])
+            self.assertEqual(hdf.analysis_version, '1.0')
+
+    def test_set_attributes(self):
+        raw = mock.Mock(file_path=self.raw_path, duration=10, version='raw')
+        sidecar = mock.Mock(duration=10)
+        with mock.patch('analysis_engine.hdf_io.hdf_file',
+                        return_value=sidecar):
+            hdf = HDFOverlay(raw, self.sidecar_path)
+        hdf.start_datetime = 100
+        self.assertEqual(sidecar.start_datetime, 100)
+        # Other attributes are also set on the sidecar HDF file.
+        self.assertEqual(hdf.version, 'raw')
+        hdf.version = 'sidecar'
+        self.assertEqual(sidecar.version, 'sidecar')
+        self.assertEqual(raw.version, 'raw')
+        self.assertEqual(hdf.version, 'sidecar')
+        self.assertNotIn('version', hdf.__dict__)
+
+
+class TestSliceSegmentParam(unittest.TestCase):
+    def test_slice_segment_param(self):
+        param = P('Airspeed', np.ma.arange(40), frequency=2)
+        res = slice_segment_param(param, 4, 12, ())
+        self.assertEqual(res.array.tolist(), list(range(8, 24)))
+        self.assertEqual(res.frequency, 2)
+        self.assertEqual(res.submasks, {})
+        self.assertEqual(len(param.array), 40)
+        # to the end of the data
+        res = slice_segment_param(param, 16, None, ())
+        self.assertEqual(res.array.tolist(), list(range(32, 40)))
+
+    def test_slice_segment_param_padding(self):
+        param = P('Airspeed', np.ma.arange(40), frequency=2)
+        param.submasks = {'arinc': np.zeros(40, dtype=bool),
+                          'saturation': np.ones(40, dtype=bool)}
+        res = slice_segment_param(param, 16, 24, ('arinc',))
+        self.assertEqual(res.array.tolist(), list(range(32, 40)) + [None] * 8)
+        self.assertEqual(sorted(res.submasks), ['arinc', 'padding'])
+        self.assertEqual(res.submasks['padding'].tolist(),
+                         [False] * 8 + [True] * 8)
+        self.assertEqual(len(res.submasks['arinc']), 16)
+
+    def test_slice_segment_param_multistate(self):
+        param = M('Gear Down', np.ma.array([0, 1] * 10),
+                  values_mapping={0: 'Up', 1: 'Down'})
+        res = slice_segment_param(param, 16, 24, ())
+        self.assertEqual(res.array.values_mapping, {0: 'Up', 1: 'Down'})
+        self.assertEqual(res.array.raw.tolist(),
+                         [0, 1, 0, 1, None, None, None, None])
+
+    def test_slice_segment_param_array_bounds(self):
+        param = P('Airspeed', np.ma.arange(40), frequency=2)
+        param.submasks = {'padding': np.zeros(40, dtype=bool)}
+        param.submasks['padding'][10] = True
+        res = slice_segment_param(param, 4, 12, ('padding',),
+                                  array_start_secs=1, array_stop_secs=7)
+        self.assertEqual(res.array.tolist(),
+                         [None] * 2 + list(range(10, 22)) + [None] * 2)
+        self.assertEqual(res.submasks['padding'].tolist(),
+                         [True] * 3 + [False] * 11 + [True] * 2)
+        # The source parameter is not masked.
+        self.assertFalse(np.ma.is_masked(param.array))
+
+    def test_segment_bounds(self):
+        with mock.patch('analysis_engine.hdf_io.segment_boundaries') as \
+                segment_boundaries:
+            segment_boundaries.return_value = (100, 1004, 2, 901)
+            self.assertEqual(segment_bounds(slice(102, 1001), 4),
+                             (100, 1004, 2, 901))
+            segment_boundaries.return_value = (0, None, 0, None)
+            self.assertEqual(segment_bounds(slice(None, None), 4),
+                             (0, None, 0, None))
+
+
+class TestSegmentView(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.hdf_path = os.path.join(self.temp_dir, 'raw.hdf5')
+        self.sidecar_path = os.path.join(self.temp_dir, 'sidecar.hdf5')
+        shutil.copy2(os.path.join(test_data_path,
+                                  'alt_aal_faulty_alt_rad.hdf5'),
+                     self.hdf_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_param(self):
+        segment_slice = slice(102, 1001)
+        start, stop, array_start, array_stop = \
+            segment_bounds(segment_slice, 4)
+        with hdf_file(self.hdf_path) as hdf:
+            param = hdf['Altitude STD']
+        expected = param.array[int(start * param.frequency):
+                               int(stop * param.frequency)].copy()
+        # Samples outside of the segment slice are masked.
+        expected[:int(array_start * param.frequency)] = np.ma.masked
+        expected[int(array_stop * param.frequency):] = np.ma.masked
+        with SegmentView(self.hdf_path, segment_slice) as view:
+            self.assertEqual(view.duration, stop - start)
+            self.assertIn('Altitude STD', view)
+            res = view['Altitude STD']
+            self.assertEqual(res.frequency, param.frequency)
+            self.assertEqual(res.array.tolist(), expected.tolist())
+            res = view.get_param('Altitude STD', _slice=slice(10, 20))
+            self.assertEqual(res.array.tolist(),
+                             expected[int(10 * param.frequency):
+                                      int(20 * param.frequency)].tolist())
+            self.assertIsNone(view.get('Invalid'))
+
+    def test_open_hdf(self):
+        self.assertRaises(ValueError, open_hdf, self.hdf_path,
+                          segment_slice=slice(100, 1000))
+        with open_hdf(self.hdf_path, sidecar_path=self.sidecar_path,
+                      segment_slice=slice(100, 1000)) as hdf:
+            duration = hdf.duration
+            hdf.set_param(P('Altitude AAL', np.ma.arange(duration)))
+            self.assertEqual(len(hdf['Altitude AAL'].array), duration)
+        with hdf_file(self.hdf_path) as hdf:
+            self.assertNotIn('Altitude AAL', hdf)
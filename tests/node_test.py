@@ -9,7 +9,7 @@ from datetime import datetime
 from inspect import ArgSpec
 from random import shuffle
 
-from analysis_engine.library import min_value, max_value
+from analysis_engine.library import min_value, max_value, valid_slices_within_array
 from analysis_engine.node import (
     ApproachItem,
     ApproachNode,
@@ -22,7 +22,12 @@ from analysis_engine.node import (
     Node, NodeManager,
     Parameter, P,
     MultistateDerivedParameterNode, M,
+    invalidate_cached_slices,
+    lazy_param_copy,
+    lazy_param_from_hdf,
+    dumps,
     load,
+    loads,
     powerset,
     SectionNode,
     Section,
@@ -1982,6 +1987,47 @@ class TestDerivedParameterNode(unittest.TestCase):
         slices = param.slices_from_to(4, -2, threshold=0.2)
         slices_from_to.assert_called_with(array, 4, -2, threshold=0.2)
 
+    @mock.patch('analysis_engine.node.slices_from_to')
+    def test_slices_from_to_cache(self, slices_from_to):
+        slices_from_to.return_value = (np.ma.arange(10), [slice(0, 10)])
+        cache = {}
+        param = DerivedParameterNode('Param', array=np.ma.arange(10),
+                                     cache=cache)
+        self.assertEqual(param.slices_from_to(5, 15), [slice(0, 10)])
+        # Slices of the same parameter are computed once per flight, also
+        # for copies of the parameter loaded separately.
+        other = DerivedParameterNode('Param', array=np.ma.arange(10),
+                                     cache=cache)
+        self.assertEqual(other.slices_from_to(5, 15), [slice(0, 10)])
+        self.assertEqual(slices_from_to.call_count, 1)
+        other.slices_from_to(15, 5)
+        self.assertEqual(slices_from_to.call_count, 2)
+        # Slices are not shared by other frequencies.
+        DerivedParameterNode('Param', array=np.ma.arange(20), frequency=2,
+                             cache=cache).slices_from_to(5, 15)
+        self.assertEqual(slices_from_to.call_count, 3)
+        # Slices are recomputed once the parameter is derived again.
+        invalidate_cached_slices(cache, 'Param')
+        other.slices_from_to(5, 15)
+        self.assertEqual(slices_from_to.call_count, 4)
+        other.slices_from_to(5, 15)
+        self.assertEqual(slices_from_to.call_count, 4)
+
+    def test_slices_within_band(self):
+        array = np.ma.array([0, 10, 20, 30, 40, 30, 20, 10, 0, 10, 20])
+        array[3] = np.ma.masked
+        sections = [Section('Phase', slice(0, 10), 0, 10)]
+        for cache in (None, {}):
+            param = DerivedParameterNode('Param', array=array, cache=cache)
+            expected = valid_slices_within_array(
+                np.ma.masked_outside(array, 10, 30), sections)
+            self.assertEqual(param.slices_within_band(10, 30, sections),
+                             expected)
+            self.assertEqual(param.slices_within_band(30, 10, sections),
+                             expected)
+            self.assertEqual(param.slices_within_band(10, 30, sections),
+                             [slice(1, 3), slice(5, 8), slice(9, 10)])
+
     def test_slices_to_touchdown_basic(self):
         heights = np.ma.arange(100,-10,-10)
         heights[:-1] -= 10
@@ -2181,6 +2227,86 @@ class TestMultistateDerivedParameterNode(unittest.TestCase):
         self.assertEqual(list(res.array), expected)
         os.remove(dest)
 
+class TestLazyParamFromHdf(unittest.TestCase):
+    def setUp(self):
+        self.param = P('Airspeed', np.ma.arange(20, dtype=float),
+                       frequency=2, offset=0.25)
+
+        def get_param(name, valid_only=False, _slice=None):
+            if name != self.param.name:
+                raise KeyError(name)
+            if _slice is None:
+                return self.param
+            start = int((_slice.start or 0) * self.param.frequency)
+            stop = int(_slice.stop * self.param.frequency)
+            return P(self.param.name, self.param.array[start:stop],
+                     frequency=self.param.frequency, offset=self.param.offset)
+
+        self.hdf = mock.Mock()
+        self.hdf.get_param.side_effect = get_param
+
+    def test_lazy_param_from_hdf(self):
+        node = lazy_param_from_hdf(self.hdf, 'Airspeed')
+        self.assertEqual(node.frequency, 2)
+        self.assertEqual(node.offset, 0.25)
+        self.assertNotIn('array', node.__dict__)
+        self.assertEqual(self.hdf.get_param.call_count, 1)
+        self.assertEqual(node.array.tolist(), list(range(20)))
+        self.assertEqual(self.hdf.get_param.call_count, 2)
+        node.array
+        self.assertEqual(self.hdf.get_param.call_count, 2)
+        self.assertRaises(KeyError, lazy_param_from_hdf, self.hdf, 'Pitch')
+
+    def test_get_aligned_cached(self):
+        cache = {}
+        node = lazy_param_from_hdf(self.hdf, 'Airspeed', cache=cache)
+        aligned = node.get_aligned(P('Pitch', frequency=1, offset=0.5))
+        self.assertEqual(len(aligned.array), 10)
+        node = lazy_param_from_hdf(self.hdf, 'Airspeed', cache=cache)
+        self.assertEqual(
+            node.get_aligned(P('Pitch', frequency=1, offset=0.5)), aligned)
+        self.assertNotIn('array', node.__dict__)
+
+    def test_pickle(self):
+        node = lazy_param_from_hdf(self.hdf, 'Airspeed')
+        node = loads(dumps(node))
+        self.assertEqual(node.array.tolist(), list(range(20)))
+
+
+class TestLazyParamCopy(unittest.TestCase):
+    def test_lazy_param_copy(self):
+        param = P('Airspeed', np.ma.arange(20, dtype=float), frequency=2,
+                  offset=0.25)
+        node = lazy_param_copy(param)
+        self.assertEqual(node.frequency, 2)
+        self.assertEqual(node.offset, 0.25)
+        self.assertNotIn('array', node.__dict__)
+        # The array is copied when first accessed.
+        node.array[0] = np.ma.masked
+        self.assertEqual(node.array.tolist(), [None] + list(range(1, 20)))
+        self.assertEqual(param.array.tolist(), list(range(20)))
+
+    def test_lazy_param_copy_multistate(self):
+        param = M('Gear Down', np.ma.array([0, 1, 1]),
+                  values_mapping={0: 'Up', 1: 'Down'})
+        node = lazy_param_copy(param)
+        self.assertIsInstance(node, MultistateDerivedParameterNode)
+        node.array[node.array != 'Down'] = np.ma.masked
+        self.assertEqual(node.array.raw.tolist(), [None, 1, 1])
+        self.assertEqual(param.array.raw.tolist(), [0, 1, 1])
+
+    def test_get_aligned_cached(self):
+        cache = {}
+        param = P('Airspeed', np.ma.arange(20, dtype=float), frequency=2,
+                  offset=0.25)
+        aligned = lazy_param_copy(param, cache=cache).get_aligned(
+            P('Pitch', frequency=2, offset=0.5))
+        node = lazy_param_copy(param, cache=cache)
+        self.assertEqual(
+            node.get_aligned(P('Pitch', frequency=2, offset=0.5)), aligned)
+        self.assertNotIn('array', node.__dict__)
+
+
 class TestNodeTypeAbbreviation(unittest.TestCase):
     def test_node_type_abbr_attribute(self):
         class NAME(DerivedParameterNode):
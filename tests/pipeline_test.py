@@ -0,0 +1,174 @@
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import pytz
+import unittest
+
+from datetime import datetime, timedelta
+
+from analysis_engine.datastructures import Segment
+from analysis_engine.pipeline import IngestPipeline, SegmentIndex
+
+
+class TestSegmentIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'segments.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_put(self):
+        res = {'flight': [], 'kpv': [('Airspeed Max', 250.0)]}
+        start_dt = datetime(2012, 12, 25, tzinfo=pytz.utc)
+        segment = Segment(slice(0, 100), 'START_AND_STOP', 1, 'a.hdf5',
+                          'ABCDEF', start_dt, None,
+                          start_dt + timedelta(seconds=100))
+        with SegmentIndex(self.path) as index:
+            self.assertIsNone(index.get(segment, 'G-FDSL'))
+            index.put(segment, res, 'G-FDSL')
+            self.assertEqual(index.get(segment, 'G-FDSL'), res)
+            # The file path and part do not identify the segment.
+            self.assertEqual(index.get(Segment(
+                slice(0.0, 100.0), 'START_AND_STOP', 2, 'b.hdf5', 'ABCDEF',
+                start_dt, None, start_dt + timedelta(seconds=100)),
+                'G-FDSL'), res)
+        # Results are stored within the database.
+        with SegmentIndex(self.path) as index:
+            self.assertEqual(index.get(segment, 'G-FDSL'), res)
+        # Results of other versions are not returned.
+        with SegmentIndex(self.path, version='0.0.1') as index:
+            self.assertIsNone(index.get(segment, 'G-FDSL'))
+
+    def test_get_key(self):
+        res = {'flight': [], 'kpv': [('Airspeed Max', 250.0)]}
+        start_dt = datetime(2012, 12, 25, tzinfo=pytz.utc)
+        segment = Segment(slice(0, 100), 'START_AND_STOP', 1, 'a.hdf5',
+                          'ABCDEF', start_dt, None,
+                          start_dt + timedelta(seconds=100))
+        with SegmentIndex(self.path) as index:
+            index.put(segment, res, 'G-FDSL')
+            # Segments with the same hash are not identical unless the type,
+            # start datetime, duration and tail number match.
+            for changes in ({'type': 'STOP_ONLY'},
+                            {'start_dt': start_dt + timedelta(days=1),
+                             'stop_dt': segment.stop_dt + timedelta(days=1)},
+                            {'stop_dt': segment.stop_dt + timedelta(seconds=4)}):
+                other = Segment(**dict(segment._asdict(), **changes))
+                self.assertIsNone(index.get(other, 'G-FDSL'))
+            self.assertIsNone(index.get(segment, 'G-ABCD'))
+            self.assertIsNone(index.get(segment))
+
+    def test_get_offset(self):
+        # The same flight within data downloaded again at a different offset.
+        res = {'flight': [], 'kpv': [('Airspeed Max', 250.0)]}
+        start_dt = datetime(2012, 12, 25, tzinfo=pytz.utc)
+        segment = Segment(slice(0, 100), 'START_AND_STOP', 1, 'a.hdf5',
+                          'ABCDEF', start_dt, None,
+                          start_dt + timedelta(seconds=100))
+        with SegmentIndex(self.path) as index:
+            index.put(segment, res, 'G-FDSL')
+            other = Segment(slice(3600, 3700), 'START_AND_STOP', 3, 'b.hdf5',
+                            'ABCDEF', start_dt, None,
+                            start_dt + timedelta(seconds=100))
+            self.assertEqual(index.get(other, 'G-FDSL'), res)
+
+
+class TestIngestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.aircraft_info = {'Tail Number': 'G-FDSL'}
+
+        def split_hdf_to_segments(hdf_path, aircraft_info, **kwargs):
+            if hdf_path == 'invalid.hdf5':
+                raise ValueError(hdf_path)
+            return [Segment(slice(0, 100 * part), 'START_AND_STOP', part,
+                            hdf_path, 'hash%d' % part) for part in (1, 2)]
+
+        patcher = mock.patch('analysis_engine.pipeline.split_hdf_to_segments',
+                             side_effect=split_hdf_to_segments)
+        self.split = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('analysis_engine.pipeline.process_flight',
+                             side_effect=lambda segment_info, *a, **kw:
+                             segment_info)
+        self.process = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_iter(self):
+        with IngestPipeline(['a.hdf5', 'b.hdf5'], self.aircraft_info,
+                            process_kwargs={'force': True}) as pipeline:
+            results = list(pipeline)
+        self.assertEqual([(s.path, s.part) for s, _ in results],
+                         [('a.hdf5', 1), ('a.hdf5', 2),
+                          ('b.hdf5', 1), ('b.hdf5', 2)])
+        self.assertEqual(results[0][1]['File'], 'a.hdf5')
+        self.assertNotIn('Slice', results[0][1])
+        self.process.assert_called_with(
+            results[-1][1], 'G-FDSL', aircraft_info=self.aircraft_info,
+            force=True)
+
+    def test_iter_once(self):
+        with IngestPipeline(['a.hdf5'], self.aircraft_info) as pipeline:
+            self.assertEqual(len(list(pipeline)), 2)
+            # Iterating again would wait forever for segments.
+            self.assertRaises(RuntimeError, iter, pipeline)
+        pipeline = IngestPipeline(['a.hdf5'], self.aircraft_info)
+        pipeline.stop()
+        self.assertRaises(RuntimeError, iter, pipeline)
+
+    def test_virtual(self):
+        with IngestPipeline(['/data/a.hdf5'], self.aircraft_info,
+                            split_kwargs={'virtual': True}) as pipeline:
+            results = list(pipeline)
+        self.assertEqual(results[1][1]['Slice'], slice(0, 200))
+        self.assertEqual(self.process.call_args[1]['sidecar'],
+                         '/data/a.002.hdf5')
+
+    def test_back_pressure(self):
+        event = threading.Event()
+
+        def hdf_paths():
+            yield 'a.hdf5'
+            event.set()
+            yield 'b.hdf5'
+
+        with IngestPipeline(hdf_paths(), self.aircraft_info,
+                            queue_size=1) as pipeline:
+            # The split stage blocks until segments are processed.
+            self.assertFalse(event.wait(0.5))
+            self.assertEqual(self.split.call_count, 1)
+            results = list(pipeline)
+        self.assertEqual(len(results), 4)
+
+    def test_split_error(self):
+        pipeline = IngestPipeline(['a.hdf5', 'invalid.hdf5', 'b.hdf5'],
+                                  self.aircraft_info)
+        results = []
+        with self.assertRaises(ValueError):
+            for segment, res in pipeline:
+                results.append(segment)
+        # Segments of files split before the error are processed.
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.split.call_count, 2)
+
+    def test_stop(self):
+        with IngestPipeline(['a.hdf5', 'b.hdf5'], self.aircraft_info,
+                            queue_size=1) as pipeline:
+            for segment, res in pipeline:
+                break
+        self.assertFalse(pipeline._thread.is_alive())
+        self.assertEqual(self.process.call_count, 1)
+
+    def test_index(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with SegmentIndex(os.path.join(temp_dir, 'segments.db')) as index:
+            # The segments of b.hdf5 are identical to the segments of a.hdf5.
+            with IngestPipeline(['a.hdf5', 'b.hdf5'], self.aircraft_info,
+                                index=index) as pipeline:
+                results = list(pipeline)
+        self.assertEqual(self.process.call_count, 2)
+        self.assertEqual([res['File'] for _, res in results],
+                         ['a.hdf5', 'a.hdf5', 'a.hdf5', 'a.hdf5'])
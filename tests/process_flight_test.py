@@ -1,5 +1,25 @@
+import mock
+import os
+import pytz
+import shutil
+import tempfile
 import unittest
 
+from datetime import datetime
+
+from analysis_engine import hooks, settings
+from analysis_engine.api_handler import flight_geodata
+from analysis_engine.process_flight import (
+    _defer_airport_nodes,
+    _prefetch_airports,
+    _prefetch_dependencies,
+    process_flight,
+)
+
+
+test_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'test_data')
+
 
 class TestProcessFlight(unittest.TestCase):
 
@@ -15,3 +35,186 @@ class TestProcessFlight(unittest.TestCase):
         '''
         self.assertTrue(False, msg='Test not implemented.')
 
+
+class TestPrefetchDependencies(unittest.TestCase):
+    def setUp(self):
+        self.node_mgr = mock.Mock()
+        self.node_mgr.hdf_keys = ['Eng (1) N1', 'Eng (2) N1', 'Airspeed']
+        self.node_mgr.derived_nodes = {}
+        for name, dependencies in (
+                ('Eng (*) N1 Avg', ['Eng (1) N1', 'Eng (2) N1']),
+                ('Eng (*) N1 Max', ['Eng (1) N1', 'Eng (2) N1']),
+                ('Airspeed Max', ['Airspeed', 'Airborne'])):
+            node = mock.Mock()
+            node.get_dependency_names.return_value = dependencies
+            self.node_mgr.derived_nodes[name] = node
+        self.process_order = ['Eng (1) N1', 'Eng (*) N1 Avg', 'Airborne',
+                              'Eng (*) N1 Max', 'Airspeed Max']
+
+    def test_prefetch_dependencies(self):
+        # Later uses are served from the node cache.
+        self.assertEqual(
+            _prefetch_dependencies(self.node_mgr, self.process_order, {}),
+            {'Eng (*) N1 Avg': ['Eng (1) N1', 'Eng (2) N1'],
+             'Eng (*) N1 Max': [],
+             'Airspeed Max': ['Airspeed']})
+
+    @mock.patch('analysis_engine.process_flight.LAZY_PARAMETER_LOADING',
+                False)
+    def test_prefetch_dependencies_not_lazy(self):
+        self.assertEqual(
+            _prefetch_dependencies(self.node_mgr, self.process_order,
+                                   {'Airspeed Max': None}),
+            {'Eng (*) N1 Avg': ['Eng (1) N1', 'Eng (2) N1'],
+             'Eng (*) N1 Max': ['Eng (1) N1', 'Eng (2) N1']})
+
+
+class TestPrefetchAirports(unittest.TestCase):
+    def setUp(self):
+        self.node_mgr = mock.Mock()
+        self.node_mgr.hdf_keys = []
+        self.node_mgr.get_attribute.return_value = None
+        self.node_mgr.derived_nodes = {}
+        for name, dependencies, coordinates in (
+                ('Approach Information', ['Latitude Prepared'],
+                 [(51.0, -0.5), (51.1, -0.4)]),
+                ('FDR Takeoff Airport', ['Latitude At Liftoff'],
+                 [(52.0, 0.5)]),
+                ('Later Airport', ['Latitude At Touchdown'], [(53.0, 1.5)])):
+            node_class = mock.Mock()
+            node_class.get_dependency_names.return_value = dependencies
+            node_class.return_value.get_airport_coordinates.return_value = \
+                coordinates
+            self.node_mgr.derived_nodes[name] = node_class
+        self.process_order = ['Latitude At Liftoff', 'Approach Information',
+                              'FDR Takeoff Airport', 'Latitude At Touchdown',
+                              'Later Airport']
+        self.params = {'Latitude At Liftoff': mock.Mock()}
+
+    def test_prefetch_airports(self):
+        handler = mock.Mock()
+        handler.get_nearest_airports.return_value = [[{'id': 1}]] * 3
+        airport_nodes = ['Approach Information', 'FDR Takeoff Airport',
+                         'Later Airport']
+        with flight_geodata(handler):
+            _prefetch_airports(None, self.node_mgr, self.process_order, 1,
+                               airport_nodes, self.params, None, None, None)
+        # The coordinates of all nodes whose dependencies are available are
+        # looked up at once.
+        handler.get_nearest_airports.assert_called_once_with(
+            [(51.0, -0.5), (51.1, -0.4), (52.0, 0.5)])
+        self.assertEqual(airport_nodes, ['Later Airport'])
+        derived_nodes = self.node_mgr.derived_nodes
+        derived_nodes['FDR Takeoff Airport'].return_value.get_airport_coordinates\
+            .assert_called_once_with([self.params['Latitude At Liftoff']])
+        derived_nodes['Approach Information'].return_value\
+            .get_airport_coordinates.assert_called_once_with([None])
+        self.assertFalse(derived_nodes['Later Airport'].called)
+
+    def test_prefetch_airports_error(self):
+        handler = mock.Mock()
+        handler.get_nearest_airports.return_value = [[{'id': 1}]]
+        self.node_mgr.derived_nodes['Approach Information'].return_value\
+            .get_airport_coordinates.side_effect = IndexError
+        airport_nodes = ['Approach Information', 'FDR Takeoff Airport']
+        with flight_geodata(handler):
+            _prefetch_airports(None, self.node_mgr, self.process_order, 1,
+                               airport_nodes, self.params, None, None, None)
+        # Errors are raised when the node is derived.
+        handler.get_nearest_airports.assert_called_once_with([(52.0, 0.5)])
+        self.assertEqual(airport_nodes, [])
+
+class TestDeferAirportNodes(unittest.TestCase):
+    def test_defer_airport_nodes(self):
+        node_mgr = mock.Mock()
+        node_mgr.hdf_keys = ['Latitude']
+        node_mgr.derived_nodes = {}
+        for name, dependencies, airport in (
+                ('Latitude At Liftoff', ['Latitude', 'Liftoff'], False),
+                ('FDR Takeoff Airport', ['Latitude At Liftoff'], True),
+                ('FDR Takeoff Runway', ['FDR Takeoff Airport'], True),
+                ('Takeoff Airport Name', ['FDR Takeoff Airport'], False),
+                ('Approach Information', ['Latitude', 'Approach'], True),
+                ('Landing Airport Name', ['Approach Information'], False)):
+            spec = ['get_dependency_names']
+            if airport:
+                spec.append('airport_coordinates')
+            node_class = mock.Mock(spec=spec)
+            node_class.get_dependency_names.return_value = dependencies
+            node_mgr.derived_nodes[name] = node_class
+        process_order = ['Latitude', 'Liftoff', 'Latitude At Liftoff',
+                         'FDR Takeoff Airport', 'FDR Takeoff Runway',
+                         'Approach', 'Approach Information',
+                         'Takeoff Airport Name', 'Landing Airport Name']
+        # Airport nodes are moved to just before their first dependant or to
+        # the end if nothing depends upon them.
+        self.assertEqual(
+            _defer_airport_nodes(node_mgr, process_order, {}),
+            ['Latitude', 'Liftoff', 'Latitude At Liftoff', 'Approach',
+             'FDR Takeoff Airport', 'Takeoff Airport Name',
+             'Approach Information', 'Landing Airport Name',
+             'FDR Takeoff Runway'])
+        # Airport nodes which have already been derived are not moved.
+        self.assertEqual(
+            _defer_airport_nodes(node_mgr, process_order,
+                                 {'FDR Takeoff Airport': None}),
+            ['Latitude', 'Liftoff', 'Latitude At Liftoff',
+             'FDR Takeoff Airport', 'Approach', 'Takeoff Airport Name',
+             'Approach Information', 'Landing Airport Name',
+             'FDR Takeoff Runway'])
+
+
+class TestProcessFlightChanged(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.full_path = os.path.join(self.temp_dir, 'full.hdf5')
+        self.changed_path = os.path.join(self.temp_dir, 'changed.hdf5')
+        for path in (self.full_path, self.changed_path):
+            shutil.copy2(os.path.join(test_data_path, 'Specimen_Flight.hdf5'),
+                         path)
+        self.aircraft_info = {
+            'Aircraft Type': 'aeroplane',
+            'Tail Number': 'G-ABCD',
+            'Model': 'B737-301',
+            'Series': 'B737-300',
+            'Family': 'B737 Classic',
+            'Manufacturer': 'Boeing',
+            'Precise Positioning': False,
+            'Frame': '737-5',
+            'Frame Qualifier': 'Altitude_Radio_EFIS',
+        }
+        patchers = [
+            mock.patch.object(settings, 'API_HANDLER',
+                              'analysis_engine.api_handler.FileHandler'),
+            mock.patch.object(hooks, 'PRE_FLIGHT_ANALYSIS', None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _process_flight(self, path, **kwargs):
+        segment_info = {
+            'File': path,
+            'Start Datetime': datetime(2012, 12, 30, 19, 9, 6,
+                                       tzinfo=pytz.utc),
+            'Segment Type': 'START_AND_STOP',
+        }
+        res = process_flight(
+            segment_info, self.aircraft_info['Tail Number'],
+            aircraft_info=dict(self.aircraft_info),
+            requested=['Airspeed Max', 'Altitude Max', 'Rate Of Climb Max',
+                       'Rate Of Descent Max'], **kwargs)
+        res['flight'].pop('FDR Analysis Datetime', None)
+        return res
+
+    def test_process_flight_changed(self):
+        expected = self._process_flight(self.full_path)
+        initial = self._process_flight(self.changed_path)
+        res = self._process_flight(self.changed_path, initial=initial,
+                                   changed=['Altitude STD Smoothed'])
+        self.assertEqual(sorted(res), sorted(expected))
+        for key in expected:
+            self.assertEqual(res[key], expected[key], msg=key)
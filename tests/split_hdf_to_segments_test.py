@@ -1,14 +1,18 @@
 from __future__ import print_function
 
+import copy
 import mock
 import numpy as np
 import os.path
 import pytz
+import shutil
+import tempfile
 import unittest
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from analysis_engine.split_hdf_to_segments import (
+    _average_arrays,
     _calculate_start_datetime,
     _get_normalised_split_params,
     _mask_invalid_years,
@@ -17,11 +21,17 @@ from analysis_engine.split_hdf_to_segments import (
     calculate_fallback_dt,
     get_dt_arrays,
     has_constant_time,
+    read_virtual_segments,
+    SegmentParameters,
+    segment_content_hash,
     split_segments,
+    write_segments,
 )
+from analysis_engine.hdf_io import SegmentView
 from analysis_engine.node import M, P, Parameter
 
 from hdfaccess.file import hdf_file
+from hdfaccess.utils import write_segment
 
 from flightdatautilities.array_operations import load_compressed
 from flightdatautilities.filesystem_tools import copy_file
@@ -37,6 +47,52 @@ class MockHDF(dict):
         self.duration = duration
 
 
+class WindowedMockHDF(dict):
+    '''
+    Parameters which can be read between seconds with get_param's _slice
+    argument. Whole parameters read with __getitem__ and the largest number of
+    samples read with _slice are recorded.
+    '''
+    def __init__(self, params, duration):
+        super(WindowedMockHDF, self).__init__((p.name, p) for p in params)
+        self.duration = duration
+        self.reliable_frame_counter = True
+        self.superframe_present = False
+        self.whole_reads = []
+        self.max_window_samples = 0
+
+    def __getitem__(self, name):
+        self.whole_reads.append(name)
+        # each read returns a new array as with hdf_file
+        return copy.deepcopy(dict.__getitem__(self, name))
+
+    def get_param(self, name, valid_only=False, _slice=None):
+        if _slice is None:
+            return self[name]
+        param = copy.copy(dict.__getitem__(self, name))
+        param.array = param.array[int(_slice.start * param.frequency):
+                                  int(_slice.stop * param.frequency)].copy()
+        if name not in ('Heading', 'Heading True'):
+            # windows of Heading are extended to repair masked sections
+            self.max_window_samples = max(self.max_window_samples,
+                                          len(param.array))
+        return param
+
+
+class TestAverageArrays(unittest.TestCase):
+    def test_average_arrays(self):
+        arrays = [
+            np.ma.array([1.0, 2.0, 3.0, 4.0], mask=[0, 0, 1, 1]),
+            np.ma.array([3.0, 5.0, 7.0, 9.0], mask=[0, 1, 0, 1]),
+            np.ma.array([2, 2, 2, 2], mask=[0, 0, 0, 1]),
+        ]
+        expected = np.ma.average(np.ma.vstack(arrays), axis=0)
+        res = _average_arrays(iter(arrays))
+        self.assertEqual(res.tolist(), expected.tolist())
+        self.assertEqual(res.tolist(), [2.0, 2.0, 4.5, None])
+        self.assertIsNone(_average_arrays([]))
+
+
 class TestInvalidYears(unittest.TestCase):
     def test_mask_invalid_years(self):
         array = np.ma.array([0, 2, 9, 10, 13, 14, 15, 88, 99,
@@ -395,6 +451,9 @@ class TestSplitSegments(unittest.TestCase):
                           ('START_AND_STOP', slice(21799.0, 24665.0, None), 3),
                           ('START_AND_STOP', slice(24665.0, 27898.0, None), 1),
                           ('START_AND_STOP', slice(27898.0, 31424.0, None), 2)])
+        # Reading split parameters in windows gives the same segments.
+        self.assertEqual(split_segments(hdf, {}, window=1024),
+                         segment_tuples)
 
     def test_split_segments_data_2(self):
         '''Splits on both DFC Jump and Engine parameters.'''
@@ -410,6 +469,9 @@ class TestSplitSegments(unittest.TestCase):
                           ('START_AND_STOP', slice(9912.0, 13064.0, None), 56),
                           ('START_AND_STOP', slice(13064.0, 16467.0, None), 8),
                           ('START_AND_STOP', slice(16467.0, 19200.0, None), 19)])
+        # Reading split parameters in windows gives the same segments.
+        self.assertEqual(split_segments(hdf, {}, window=1024),
+                         segment_tuples)
 
     def test_split_segments_data_3(self):
         '''Splits on both Engine and Heading parameters.'''
@@ -431,6 +493,9 @@ class TestSplitSegments(unittest.TestCase):
                           ('START_AND_STOP', slice(26607.0, 28534.0, None), 3),
                           ('START_AND_STOP', slice(28534.0, 30875.0, None), 2),
                           ('START_AND_STOP', slice(30875.0, 33680.0, None), 3)])
+        # Reading split parameters in windows gives the same segments.
+        self.assertEqual(split_segments(hdf, {}, window=1024),
+                         segment_tuples)
 
     @unittest.skipIf(not os.path.isfile(os.path.join(test_data_path,
                                                      "4_3377853_146-301.hdf5")),
@@ -487,6 +552,63 @@ class TestSplitSegments(unittest.TestCase):
                           'START_AND_STOP',
                           'START_ONLY'))
 
+    def test_split_segments_windowed(self):
+        duration = 12800
+        seconds = np.arange(duration)
+
+        def fill(values):
+            array = np.ma.zeros(duration)
+            for (start, stop), value in values:
+                array[start:stop] = value
+            return array
+
+        flights = [(600, 3000), (4600, 7000), (8600, 10400), (11600, 12500)]
+        ground = [(0, 600), (3000, 4600), (7000, 8600), (10400, 11600),
+                  (12500, duration)]
+        airspeed = fill([(f, 250) for f in flights] +
+                        [(g, 10) for g in ground])
+        airspeed[11000:11100] = np.ma.masked
+        groundspeed = fill([(f, 400) for f in flights] +
+                           [(g, 15) for g in ground])
+        # Engines are shut down between the second and third flights.
+        eng_1_n1 = fill([(f, 90) for f in flights] +
+                        [(g, 25) for g in ground] + [((7500, 8100), 0)])
+        eng_1_n2 = fill([(f, 100) for f in flights] +
+                        [(g, 60) for g in ground] + [((7500, 8100), 0)])
+        # Taxiing turns between flights and stops turning for a while
+        # between the third and fourth flights.
+        heading = np.ma.array((seconds * 3.0) % 360)
+        for start, stop in flights:
+            heading[start:stop] = 90
+        heading[10900:11000] = heading[10899]
+        heading[5000:5400] = np.ma.masked
+        heading[3500:3520] = np.ma.masked
+        # 'Frame Counter' jumps between the first and second flights.
+        dfc = np.ma.array((seconds + 1000 * (seconds >= 3900)) % 4096)
+        hdf = WindowedMockHDF([
+            P('Airspeed', airspeed), P('Groundspeed', groundspeed),
+            P('Eng (1) N1', eng_1_n1), P('Eng (1) N2', eng_1_n2),
+            P('Heading', heading), P('Frame Counter', dfc)], duration)
+
+        segment_tuples = split_segments(hdf, {})
+        self.assertEqual([s[0] for s in segment_tuples],
+                         ['START_AND_STOP'] * 4)
+        self.assertEqual([(s[1].start, s[1].stop) for s in segment_tuples],
+                         [(0, 3900), (3900, 7800), (7800, 10950),
+                          (10950, duration)])
+
+        for window in (256, 1000, 4096, 20000):
+            hdf.whole_reads = []
+            hdf.max_window_samples = 0
+            self.assertEqual(split_segments(hdf, {}, window=window),
+                             segment_tuples)
+            # Only Airspeed is read as a whole and other parameters are read
+            # within windows rounded up to 64 seconds with 64 seconds either
+            # side.
+            self.assertEqual(hdf.whole_reads, ['Airspeed'])
+            self.assertLessEqual(hdf.max_window_samples,
+                                 int(np.ceil(window / 64.0)) * 64 + 128)
+
     def test__get_normalised_split_params(self):
         hdf = mock.Mock()
         hdf.get = mock.Mock()
@@ -573,10 +695,9 @@ class mocked_hdf(object):
 
 class TestSegmentInfo(unittest.TestCase):
     @mock.patch('analysis_engine.split_hdf_to_segments.logger')
-    @mock.patch('analysis_engine.split_hdf_to_segments.sha_hash_file')
     @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
                 new_callable=mocked_hdf)
-    def test_timestamps_in_past(self, hdf_file_patch, sha_hash_file_patch, logger_patch):
+    def test_timestamps_in_past(self, hdf_file_patch, logger_patch):
         # No longer raising exception, using epoch instead with exception logging,
         # allows segment to be created.
         # example where it goes fast
@@ -592,10 +713,9 @@ class TestSegmentInfo(unittest.TestCase):
         self.assertTrue(logger_patch.exception.called)
         self.assertEqual(logger_patch.exception.call_args[0], ('Unable to calculate timebase, using 1970-01-01 00:00:00+0000!',))
 
-    @mock.patch('analysis_engine.split_hdf_to_segments.sha_hash_file')
     @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
                 new_callable=mocked_hdf)
-    def test_timestamps_in_future_use_fallback_year(self, hdf_file_patch, sha_hash_file_patch):
+    def test_timestamps_in_future_use_fallback_year(self, hdf_file_patch):
         # Using fallback time is no longer recommended
         # example where it goes fast
         seg = append_segment_info('future timestamps', 'START_AND_STOP',
@@ -610,10 +730,9 @@ class TestSegmentInfo(unittest.TestCase):
         #                  'future timestamps', 'START_AND_STOP', slice(10,1000),
         #                  4, fallback_dt=datetime(2012,12,12,0,0,0))
 
-    @mock.patch('analysis_engine.split_hdf_to_segments.sha_hash_file')
     @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
                 new_callable=mocked_hdf)
-    def test_append_segment_info(self, hdf_file_patch, sha_hash_file_patch):
+    def test_append_segment_info(self, hdf_file_patch):
         # example where it goes fast
         # TODO: Increase slice to be realitic for duration of data
         seg = append_segment_info('fast', 'START_AND_STOP', slice(10, 1000), 4)
@@ -624,12 +743,53 @@ class TestSegmentInfo(unittest.TestCase):
         self.assertEqual(seg.go_fast_dt, datetime(2012, 12, 25, 0, 6, 52, tzinfo=pytz.utc))
         self.assertEqual(seg.stop_dt, datetime(2012, 12, 25, 11, 29, 56, tzinfo=pytz.utc))
 
-    @mock.patch('analysis_engine.split_hdf_to_segments.sha_hash_file')
     @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
                 new_callable=mocked_hdf)
-    def test_append_segment_info_no_gofast(self, hdf_file_patch,
-                                           sha_hash_file_patch):
-        sha_hash_file_patch.return_value = 'ABCDEFG'
+    def test_append_segment_info_segment_params(self, hdf_file_patch):
+        hdf = mocked_hdf()('fast')
+        segment_params = SegmentParameters(hdf.duration)
+        for name in ('Airspeed', 'Year', 'Month', 'Day', 'Hour', 'Minute',
+                     'Second'):
+            segment_params[name] = hdf[name]
+        seg = append_segment_info('fast', 'START_AND_STOP', slice(10, 1000), 4,
+                                  segment_params=segment_params)
+        self.assertEqual(seg.start_dt, datetime(2012, 12, 25, 0, 0, 0, tzinfo=pytz.utc))
+        self.assertEqual(seg.go_fast_dt, datetime(2012, 12, 25, 0, 6, 52, tzinfo=pytz.utc))
+        self.assertEqual(seg.stop_dt, datetime(2012, 12, 25, 11, 29, 56, tzinfo=pytz.utc))
+        # The start datetime is written to the segment file.
+        self.assertEqual(hdf_file_patch.start_datetime, seg.start_dt)
+
+    @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
+                new_callable=mocked_hdf)
+    def test_append_segment_info_content_hash(self, hdf_file_patch):
+        hdf = mocked_hdf()('slow')
+        segment_params = SegmentParameters(hdf.duration,
+                                           content_hash='ABCDEFG')
+        for name in ('Airspeed', 'Year', 'Month', 'Day', 'Hour', 'Minute',
+                     'Second'):
+            segment_params[name] = hdf[name]
+        seg = append_segment_info('slow', 'GROUND_ONLY', slice(10, 110), 1,
+                                  segment_params=segment_params)
+        self.assertEqual(seg.hash, 'ABCDEFG')
+
+    @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file')
+    def test_append_segment_info_virtual(self, hdf_file_patch):
+        hdf = mocked_hdf()('fast')
+        segment_params = SegmentParameters(hdf.duration)
+        for name in ('Airspeed', 'Year', 'Month', 'Day', 'Hour', 'Minute',
+                     'Second'):
+            segment_params[name] = hdf[name]
+        seg = append_segment_info('fast', 'START_AND_STOP', slice(10, 1000), 4,
+                                  segment_params=segment_params, virtual=True)
+        self.assertEqual(seg.path, 'fast')
+        self.assertEqual(seg.slice, slice(10, 1000))
+        self.assertEqual(seg.start_dt, datetime(2012, 12, 25, 0, 0, 0, tzinfo=pytz.utc))
+        # The parent HDF file is not opened.
+        self.assertFalse(hdf_file_patch.called)
+
+    @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
+                new_callable=mocked_hdf)
+    def test_append_segment_info_no_gofast(self, hdf_file_patch):
         # example where it does not go fast
         seg = append_segment_info('slow', 'GROUND_ONLY', slice(10, 110), 1)
         self.assertEqual(seg.path, 'slow')
@@ -637,14 +797,14 @@ class TestSegmentInfo(unittest.TestCase):
         self.assertEqual(seg.start_dt, datetime(2012, 12, 25, 0, 0, 0, tzinfo=pytz.utc))  # still has a start
         self.assertEqual(seg.part, 1)
         self.assertEqual(seg.type, 'GROUND_ONLY')
-        self.assertEqual(seg.hash, 'ABCDEFG')  # taken from the "file"
+        # taken from the "file"
+        self.assertEqual(seg.hash, segment_content_hash(mocked_hdf()('slow')))
         self.assertEqual(seg.stop_dt, datetime(2012, 12, 25, 0, 0, 50, tzinfo=pytz.utc))  # +50 seconds of airspeed
 
     @mock.patch('analysis_engine.split_hdf_to_segments.logger')
-    @mock.patch('analysis_engine.split_hdf_to_segments.sha_hash_file')
     @mock.patch('analysis_engine.split_hdf_to_segments.hdf_file',
                 new_callable=mocked_hdf)
-    def test_invalid_datetimes(self, hdf_file_patch, sha_hash_file_patch, logger_patch):
+    def test_invalid_datetimes(self, hdf_file_patch, logger_patch):
         # No longer raising exception, using epoch instead
         #seg = append_segment_info('invalid timestamps', 'START_AND_STOP', slice(10,110), 2)
 
@@ -775,6 +935,93 @@ class TestSegmentInfo(unittest.TestCase):
         self.assertEqual(res, datetime(2012, 12, 12, 23, 59, 58, tzinfo=pytz.utc))
 
 
+class TestWriteSegments(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.hdf_path = os.path.join(self.temp_dir, 'split_segments_1.hdf5')
+        shutil.copy2(os.path.join(test_data_path, 'split_segments_1.hdf5'),
+                     self.hdf_path)
+        self.segment_slices = [slice(0, 9953), slice(9953, 21799)]
+        self.dest_paths = [
+            os.path.join(self.temp_dir, 'split_segments_1.%03d.hdf5' % part)
+            for part in (1, 2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_segments_content_hash(self):
+        fallback_dt = datetime(2012, 12, 25, tzinfo=pytz.utc)
+        fallback_dts = [fallback_dt, fallback_dt + timedelta(seconds=9953)]
+        segments_params = write_segments(
+            self.hdf_path, self.segment_slices, self.dest_paths, 4,
+            fallback_dts=fallback_dts)
+        virtual_params = read_virtual_segments(
+            self.hdf_path, self.segment_slices, 4)
+        for part, (segment_slice, dest_path, segment_params) in enumerate(
+                zip(self.segment_slices, self.dest_paths, segments_params),
+                start=1):
+            start_datetime = segment_params.timebase[2]
+            with hdf_file(dest_path) as hdf:
+                self.assertEqual(hdf.start_datetime, start_datetime)
+                self.assertEqual(segment_params.content_hash,
+                                 segment_content_hash(hdf))
+            # Written and virtual segments have the same hash.
+            self.assertEqual(segment_params.content_hash,
+                             virtual_params[part - 1].content_hash)
+            seg = append_segment_info(
+                dest_path, 'GROUND_ONLY', segment_slice, part,
+                fallback_dt=fallback_dts[part - 1],
+                segment_params=segment_params)
+            self.assertEqual(seg.start_dt, start_datetime)
+            self.assertEqual(seg.hash, segment_params.content_hash)
+            virtual_seg = append_segment_info(
+                self.hdf_path, 'GROUND_ONLY', segment_slice, part,
+                fallback_dt=fallback_dts[part - 1],
+                segment_params=virtual_params[part - 1], virtual=True)
+            self.assertEqual(virtual_seg.hash, seg.hash)
+
+    def test_write_segments_matches_write_segment(self):
+        # A segment which does not start or stop on a superframe boundary.
+        segment_slice = slice(9953, 21799)
+        submasks = ('arinc', 'invalid_states', 'padding', 'saturation')
+        expected_path = os.path.join(self.temp_dir, 'write_segment.hdf5')
+        write_segment(self.hdf_path, segment_slice, expected_path, 64,
+                      submasks=submasks)
+        write_segments(self.hdf_path, [segment_slice], self.dest_paths[:1],
+                       64, submasks=submasks)
+        virtual_params = read_virtual_segments(
+            self.hdf_path, [segment_slice], 64)[0]
+        with hdf_file(expected_path) as expected_hdf, \
+                hdf_file(self.dest_paths[0]) as hdf, \
+                SegmentView(self.hdf_path, segment_slice, boundary=64) as view:
+            self.assertEqual(hdf.duration, expected_hdf.duration)
+            self.assertEqual(view.duration, expected_hdf.duration)
+            self.assertEqual(sorted(hdf.keys()), sorted(expected_hdf.keys()))
+            for name in expected_hdf.keys():
+                expected = expected_hdf.get_param(name)
+                params = [hdf.get_param(name), view.get_param(name),
+                          view.get_param(name, load_submasks=True)]
+                if name in virtual_params:
+                    params.append(virtual_params[name])
+                for param in params:
+                    self.assertEqual(param.frequency, expected.frequency)
+                    self.assertEqual(param.offset, expected.offset)
+                    self.assertEqual(np.ma.getmaskarray(param.array).tolist(),
+                                     np.ma.getmaskarray(expected.array).tolist())
+                    self.assertEqual(param.array.tolist(),
+                                     expected.array.tolist())
+
+    def test_write_segments_without_start_datetime(self):
+        # The start datetime is written by append_segment_info after the
+        # file is closed.
+        segments_params = write_segments(
+            self.hdf_path, self.segment_slices, self.dest_paths, 4)
+        for segment_params in segments_params:
+            self.assertIsNone(segment_params.timebase)
+            self.assertEqual(segment_params.content_hash,
+                             segment_content_hash(segment_params))
+
+
 class TestSegmentTypeAndSlice(unittest.TestCase):
     
     def test_segment_type_and_slice_1(self):